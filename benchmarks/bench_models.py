@@ -0,0 +1,97 @@
+"""
+Memory and construction time of review and offer records: the former `__dict__` classes against
+the slotted `Review` / `Offer` and the columnar `ReviewBatch` / `OfferBatch`.
+Field values are taken from the fixture corpus and shared between records, so only the per-record overhead is measured.
+
+    python benchmarks/bench_models.py [records]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+from terraplen import Country, ReviewBatch, OfferBatch, parse_offers, parse_review_stream
+from terraplen.models import Offer, Review
+
+FIXTURES = os.path.join(os.path.dirname(__file__), os.pardir, 'tests', 'fixtures', 'us')
+
+
+class LegacyOffer:
+    # `terraplen.models.Offer` before it was slotted
+    def __init__(self, price, currency, rating, condition, ships_from, sold_by, sold_by_url):
+        self.price = price
+        self.currency = currency
+        self.approx_review = rating
+        self.condition = condition
+        self.ships_from = ships_from
+        self.sold_by = sold_by
+        self.sold_by_url = sold_by_url
+
+
+class LegacyReview:
+    # `terraplen.models.Review` before it was slotted
+    def __init__(self, reviewer, reviewer_url, review_url, title, rating, helpful, body):
+        self.reviewer = reviewer
+        self.reviewer_url = reviewer_url
+        self.review_url = review_url
+        self.title = title
+        self.rating = rating
+        self.helpful = helpful
+        self.body = body
+
+
+def measure(build, rounds: int = 3):
+    # time without tracemalloc, which slows allocation down
+    elapsed = min(timed(build) for _ in range(rounds))
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return elapsed, size
+
+
+def timed(build) -> float:
+    start = time.perf_counter()
+    build()
+    return time.perf_counter() - start
+
+
+def main(records: int = 200000):
+    with open(os.path.join(FIXTURES, 'reviews.txt'), encoding='utf-8') as f:
+        reviews = parse_review_stream(f.read(), 'B07WXL5YPW', Country.UnitedStates).reviews
+    with open(os.path.join(FIXTURES, 'offers.html'), encoding='utf-8') as f:
+        offers = parse_offers(f.read(), 'www.amazon.com', {'page': 1}).offers
+    review_values = [tuple(review) for review in reviews]
+    offer_values = [tuple(offer) for offer in offers]
+
+    def review_batch():
+        batch = ReviewBatch()
+        for i in range(records):
+            batch.append(reviews[i % len(reviews)], 'B07WXL5YPW')
+        return batch
+
+    def offer_batch():
+        batch = OfferBatch()
+        for i in range(records):
+            batch.append(offers[i % len(offers)])
+        return batch
+
+    cases = (('reviews', 'legacy', lambda: [LegacyReview(*review_values[i % len(reviews)]) for i in range(records)]),
+             ('reviews', 'slots', lambda: [Review(*review_values[i % len(reviews)]) for i in range(records)]),
+             ('reviews', 'batch', review_batch),
+             ('offers', 'legacy', lambda: [LegacyOffer(*offer_values[i % len(offers)]) for i in range(records)]),
+             ('offers', 'slots', lambda: [Offer(*offer_values[i % len(offers)]) for i in range(records)]),
+             ('offers', 'batch', offer_batch))
+
+    print('{} records'.format(records))
+    print('{:<8} {:<7} {:>10} {:>12} {:>14}'.format('model', 'storage', 'build ms', 'memory MiB', 'bytes/record'))
+    for model, storage, build in cases:
+        elapsed, size = measure(build)
+        print('{:<8} {:<7} {:>10.1f} {:>12.1f} {:>14.1f}'.format(model, storage, elapsed * 1000, size / 2 ** 20,
+                                                                 size / records))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,54 @@
+"""
+Parse time of a 20-review AJAX stream response: the former `eval()` + one BeautifulSoup per chunk
+against `decode_review_stream` + one shared document.
+
+    python benchmarks/bench_review_stream.py [rounds]
+"""
+
+import os
+import sys
+import timeit
+
+from bs4 import BeautifulSoup
+
+from terraplen import Scraper, Country, selector
+
+FIXTURE = os.path.join(os.path.dirname(__file__), os.pardir, 'tests', 'fixtures', 'us', 'reviews.txt')
+
+
+LEGACY_FIELDS = (selector.Review.RatingIcon, selector.Review.Title, selector.Review.Helpful, selector.Review.Body,
+                 selector.Review.Reviewer, selector.Review.ReviewerURL, selector.Review.ReviewURL)
+
+
+def legacy_parse(text: str):
+    # what `get_review` did before: eval every chunk and build one soup per fragment
+    reviews = []
+    for dat in text.split(selector.Review.StreamStrip):
+        if not dat:
+            continue
+        data = eval(dat)
+        if data[0] == selector.Review.StreamIndex0 and data[2]:
+            top = BeautifulSoup(data[2], 'lxml').select_one('div')
+            if top and top.get('data-hook') == 'review':
+                reviews.append([top.select_one(css) for css in LEGACY_FIELDS])
+    return reviews
+
+
+def main(rounds: int = 50):
+    with open(FIXTURE, encoding='utf-8') as f:
+        text = f.read()
+
+    settings = Scraper._review_settings('B07WXL5YPW')
+    cases = [('eval + soup per chunk', lambda: legacy_parse(text))]
+    for parser in ('soup', 'lxml'):
+        scraper = Scraper(Country.UnitedStates, run_init=False, parser=parser)
+        cases.append(('stream decoder ({})'.format(parser),
+                      lambda scraper=scraper: scraper._parse_reviews(text, 'B07WXL5YPW', settings)))
+
+    for name, func in cases:
+        per_call = min(timeit.repeat(func, number=rounds, repeat=3)) / rounds
+        print('{:<28}{:>8.2f} ms'.format(name, per_call * 1000))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
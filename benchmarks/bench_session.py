@@ -0,0 +1,58 @@
+"""
+Requests per second of one-off `requests.get` calls against the pooled session of `Scraper`.
+
+Runs against a local keep-alive HTTP server, so it only measures connection setup
+and request overhead. Over TLS to a real marketplace the gap is much larger.
+
+    python benchmarks/bench_session.py [requests]
+"""
+
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from terraplen import Scraper, Country
+
+BODY = b'<html><body><div class="a-meter" aria-valuenow="42%"></div></body></html>'
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+def measure(name: str, get, url: str, count: int):
+    start = time.perf_counter()
+    for _ in range(count):
+        get(url)
+    elapsed = time.perf_counter() - start
+    print('{:<24}{:>10.1f} req/s'.format(name, count / elapsed))
+
+
+def main(count: int = 1000):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+
+    scraper = Scraper(Country.UnitedStates, run_init=False, throttle=False)
+    measure('requests.get', lambda u: requests.get(u, headers=scraper._create_header()), url, count)
+    measure('Scraper.session', scraper.get_with_update_cookie, url, count)
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -26,8 +26,9 @@ setup(name=about["__title__"],
       description=about["__description__"],
       long_description=__doc__,
       long_description_content_type="text/markdown",
-      install_requires=["requests", "lxml", "bs4"],
-      tests_require=["requests", "lxml", "bs4", "pytest"],
+      install_requires=["requests", "lxml", "cssselect", "bs4"],
+      extras_require={"async": ["aiohttp"], "numpy": ["numpy"], "pandas": ["pandas"], "arrow": ["pyarrow"]},
+      tests_require=["requests", "lxml", "cssselect", "bs4", "pytest", "pytest-benchmark"],
       packages=["terraplen"],
       zip_safe=True,
       platforms="any",
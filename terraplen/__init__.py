@@ -11,17 +11,80 @@
     :license: MIT.
 """
 
-import locale
+import importlib
 
 from .__about__ import __version__
-from .terraplen import (Scraper, Country, Language, Currency)
+from .models import Country, Language, Currency, ReviewSettings, ReviewParameter
 
-locale.setlocale(locale.LC_ALL, '')
+# everything else is imported on first access, so `import terraplen` stays cheap
+_lazy = {
+    "Scraper": ".terraplen",
+    "AsyncScraper": ".async_scraper",
+    "HTTPCache": ".cache",
+    "ResultCache": ".cache",
+    "Throttle": ".throttle",
+    "Metrics": ".metrics",
+    "CheckpointStore": ".checkpoint",
+    "MultiMarketScraper": ".multi_market",
+    "SingleFlight": ".single_flight",
+    "ProxyPool": ".proxy_pool",
+    "JobQueue": ".crawl",
+    "Crawler": ".crawl",
+    "SessionPool": ".session_pool",
+    "ReviewBatch": ".batch",
+    "OfferBatch": ".batch",
+    "JSONLSink": ".export",
+    "CSVSink": ".export",
+    "ParquetSink": ".export",
+    "open_sink": ".export",
+    "export_records": ".export",
+    "parse_rating": ".parser",
+    "parse_offers": ".parser",
+    "parse_review_stream": ".parser",
+    "ParsePipeline": ".pipeline",
+}
 
 __all__ = [
     "__version__",
     "Scraper",
+    "AsyncScraper",
     "Country",
     "Language",
-    "Currency"
+    "Currency",
+    "ReviewSettings",
+    "ReviewParameter",
+    "HTTPCache",
+    "ResultCache",
+    "Throttle",
+    "Metrics",
+    "CheckpointStore",
+    "MultiMarketScraper",
+    "SingleFlight",
+    "ProxyPool",
+    "JobQueue",
+    "Crawler",
+    "SessionPool",
+    "ReviewBatch",
+    "OfferBatch",
+    "JSONLSink",
+    "CSVSink",
+    "ParquetSink",
+    "open_sink",
+    "export_records",
+    "parse_rating",
+    "parse_offers",
+    "parse_review_stream",
+    "ParsePipeline"
 ]
+
+
+def __getattr__(name: str):
+    if name in _lazy:
+        value = getattr(importlib.import_module(_lazy[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError('module {} has no attribute {}'.format(repr(__name__), repr(name)))
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_lazy))
@@ -0,0 +1,248 @@
+import asyncio
+import time
+import weakref
+from http.cookies import SimpleCookie
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Tuple, Union
+
+from terraplen.parser import ParserBackend
+from terraplen.models import OfferList, ReviewList, ReviewSettings, Country, Currency, Language
+from terraplen.terraplen import BaseScraper
+from terraplen.throttle import Throttle
+from terraplen.metrics import Metrics
+from terraplen.single_flight import AsyncSingleFlight
+from terraplen.proxy_pool import ProxyPool
+from terraplen.exception import BotDetectedPath, BotDetectedStatusCode
+from terraplen.utils import lazy_import
+from terraplen.wrappers import async_retry
+
+if TYPE_CHECKING:  # pragma: no cover
+    import aiohttp
+
+
+class AsyncScraper(BaseScraper):
+    _semaphores = weakref.WeakKeyDictionary()  # event loop -> {domain: asyncio.Semaphore}
+
+    def __init__(self, country: Optional[Country] = Country.UnitedStates, language: Optional[Language] = None,
+                 currency: Optional[Currency] = None, run_init=True, max_concurrency: int = 16,
+                 limit_per_host: int = 0, parser: Union[str, ParserBackend, None] = None,
+                 throttle: Union[Throttle, bool] = True, max_retries: int = 3, metrics: Optional[Metrics] = None,
+                 single_flight: Union[AsyncSingleFlight, bool] = True, proxy_pool: Optional[ProxyPool] = None):
+        """
+        Create AsyncScraper Instance. Use as `async with AsyncScraper(...) as scraper:` or call `await init()` and
+        `await close()` yourself.
+        :param country: Instance of `terraplen.Country` or `str`. Language and currency will automatically be calculated if not provided. Defaults to `Country.UnitedStates.`
+        :param language: Instance of `terraplen.Language` or `str`
+        :param currency: Instance of `terraplen.Currency` or `str`
+        :param run_init: Whether run first setup on `__aenter__`. setup accesses to Amazon homepage.
+        :param max_concurrency: Maximum number of requests in flight per domain. The semaphore is shared by every AsyncScraper on the same event loop and domain, and the first one created decides its size.
+        :param limit_per_host: Connection pool size per host of the underlying `aiohttp.ClientSession`. 0 means unlimited.
+        :param parser: `'lxml'`, `'soup'` or instance of `terraplen.parser.ParserBackend`. Defaults to `'lxml'` if `cssselect` is installed, otherwise `'soup'`.
+        :param throttle: Instance of `terraplen.Throttle` pacing requests. True, the default, uses the one shared by every Scraper and AsyncScraper of the marketplace, so all of them together send at most 2 requests per second whatever `max_concurrency` is. See `Scraper`. False disables throttling.
+        :param max_retries: Number of retries, with exponential backoff and a new setup, when detected as bot.
+        :param metrics: Instance of `terraplen.Metrics`. DNS and connect time are recorded too, from aiohttp tracing.
+        :param single_flight: Instance of `terraplen.single_flight.AsyncSingleFlight`. Tasks requesting the same rating, offers or reviews at once share one download and parse. True creates one for this AsyncScraper. False disables it.
+        :param proxy_pool: Instance of `terraplen.ProxyPool`. See `Scraper`. aiohttp supports `http://` proxies only.
+        """
+        self._aiohttp = lazy_import('aiohttp', 'AsyncScraper')
+        self.session = None
+        self._pending_cookies = {}
+        self.max_concurrency = max_concurrency
+        self.limit_per_host = limit_per_host
+        self.run_init = run_init
+        self.proxy_pool = proxy_pool
+        self.single_flight = AsyncSingleFlight() if single_flight is True else single_flight or None
+
+        super().__init__(country, language, currency, parser, throttle, max_retries, metrics)
+
+    async def __aenter__(self) -> 'AsyncScraper':
+        if self.run_init:
+            await self.init()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def init(self):
+        """
+        Access the homepage to collect cookies.
+        """
+        await self.get_with_update_cookie(self._url_top_page())
+        self.init_have_run = True
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    @property
+    def cookie(self) -> Dict[str, str]:
+        if self.session is None:
+            return dict(self._pending_cookies)
+        return {cookie.key: cookie.value for cookie in self.session.cookie_jar}
+
+    async def get_with_update_cookie(self, url: str, endpoint: Optional[str] = None) -> 'aiohttp.ClientResponse':
+        """
+        :param endpoint: `'rating'`, `'offers'` or `'reviews'`, the label of the request in `self.metrics`
+        """
+        return (await self._request('GET', url, None, endpoint))[0]
+
+    async def post_with_update_cookie(self, url: str, data: Dict,
+                                      endpoint: Optional[str] = None) -> 'aiohttp.ClientResponse':
+        """
+        :param endpoint: `'rating'`, `'offers'` or `'reviews'`, the label of the request in `self.metrics`
+        """
+        return (await self._request('POST', url, data, endpoint))[0]
+
+    async def _request(self, method: str, url: str, data: Optional[Dict],
+                       endpoint: Optional[str]) -> Tuple['aiohttp.ClientResponse', bytes]:
+        # the body is returned along, as the response may not be read again once released
+        await self._throttle()
+        timings = {}  # filled by the trace callbacks of `_trace_config`
+        async with self._semaphore():
+            start = time.perf_counter()
+            resp, body = await self._send(method, url, data, timings)
+            total = time.perf_counter() - start
+        self._emit('response', endpoint=endpoint or 'top', status=resp.status, bytes=len(body), total=total,
+                   **timings)
+        self._check_response(resp.status, {key: morsel.value for key, morsel in resp.cookies.items()}, str(resp.url))
+        return resp, body
+
+    async def _send(self, method: str, url: str, data: Optional[Dict],
+                    timings: Dict) -> Tuple['aiohttp.ClientResponse', bytes]:
+        if self.proxy_pool is None:
+            async with self._get_session().request(method, url, data=data, headers=self._create_header(),
+                                                   trace_request_ctx=timings) as resp:
+                return resp, await resp.read()
+
+        attempt = 0
+        while True:
+            proxy = self.proxy_pool.acquire()
+            start = time.perf_counter()
+            try:
+                async with self._get_session().request(method, url, data=data, headers=self._create_header(),
+                                                       proxy=proxy.url, trace_request_ctx=timings,
+                                                       timeout=self._aiohttp.ClientTimeout(
+                                                           total=self.proxy_pool.timeout)) as resp:
+                    body = await resp.read()
+            except (self._aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                self.proxy_pool.failure(proxy)
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1  # see `Scraper._send`
+                continue
+            except BaseException:
+                self.proxy_pool.release(proxy)
+                raise
+            if resp.status == BotDetectedStatusCode or BotDetectedPath in str(resp.url):
+                self.proxy_pool.blocked(proxy)
+            else:
+                self.proxy_pool.success(proxy, time.perf_counter() - start)
+            return resp, body
+
+    async def get_rating(self, asin: str) -> Dict[int, int]:
+        return await self._coalesce('rating', 'GET', self._url_rating(asin), None, lambda: self._get_rating(asin))
+
+    async def get_offers(self, asin: str, prime_eligible=False, free_shipping=False, new=False, used_like_new=False,
+                         used_very_good=False, used_good=False, used_acceptable=False, merchant=None,
+                         page=1) -> OfferList:
+        filters = dict(prime_eligible=prime_eligible, free_shipping=free_shipping, new=new, used_like_new=used_like_new,
+                       used_very_good=used_very_good, used_good=used_good, used_acceptable=used_acceptable,
+                       merchant=merchant, page=page)
+        return await self._coalesce('offers', 'GET', self._url_offers(asin, **filters), None,
+                                    lambda: self._get_offers(asin, **filters))
+
+    async def get_review(self, asin: str, page=1, settings: Optional[ReviewSettings] = None) -> ReviewList:
+        return await self._coalesce('reviews', 'POST', self._url_reviews(page),
+                                    self._review_settings(asin, page, settings),
+                                    lambda: self._get_review(asin, page, settings))
+
+    async def _coalesce(self, endpoint: str, method: str, url: str, data: Optional[Dict], func: Callable):
+        if self.single_flight is None:
+            return await func()
+        result, shared = await self.single_flight.do(self._flight_key(method, url, data), func)
+        if shared:
+            self._emit('coalesced', endpoint=endpoint)
+        return result
+
+    @async_retry('rating')
+    async def _get_rating(self, asin: str) -> Dict[int, int]:
+        resp, body = await self._request('GET', self._url_rating(asin), None, 'rating')
+        if resp.status != 200:
+            raise ValueError("status code `{}` seems like invalid for `get_rating`".format(resp.status))
+        return self._parse_rating(body)
+
+    @async_retry('offers')
+    async def _get_offers(self, asin: str, prime_eligible=False, free_shipping=False, new=False, used_like_new=False,
+                         used_very_good=False, used_good=False, used_acceptable=False, merchant=None,
+                         page=1) -> OfferList:
+        resp, body = await self._request('GET', self._url_offers(
+            asin, prime_eligible=prime_eligible, free_shipping=free_shipping, new=new, used_like_new=used_like_new,
+            used_very_good=used_very_good, used_good=used_good, used_acceptable=used_acceptable, merchant=merchant,
+            page=page), None, 'offers')
+        if resp.status != 200:
+            raise ValueError("status code `{}` seems like invalid for `get_offers`".format(resp.status))
+        return self._parse_offers(body.decode(resp.get_encoding()), self._offer_settings(
+            prime_eligible=prime_eligible, free_shipping=free_shipping, new=new, used_like_new=used_like_new,
+            used_very_good=used_very_good, used_good=used_good, used_acceptable=used_acceptable,
+            merchant=merchant, page=page))
+
+    @async_retry('reviews')
+    async def _get_review(self, asin: str, page=1, settings: Optional[ReviewSettings] = None) -> ReviewList:
+        data = self._review_settings(asin, page, settings)
+        resp, body = await self._request('POST', self._url_reviews(page), data, 'reviews')
+        return self._parse_reviews(body.decode(resp.get_encoding()), asin, data)
+
+    def _set_cookie(self, name: str, value: str):
+        if self.session is None:
+            self._pending_cookies[name] = value
+            return
+        cookie = SimpleCookie()
+        cookie[name] = value
+        cookie[name]['domain'] = self._cookie_domain
+        cookie[name]['path'] = '/'
+        self.session.cookie_jar.update_cookies(cookie)
+
+    def _get_session(self) -> 'aiohttp.ClientSession':
+        # `aiohttp.ClientSession` must be created inside the running event loop
+        if self.session is None:
+            connector = self._aiohttp.TCPConnector(limit=0, limit_per_host=self.limit_per_host)
+            trace_configs = [self._trace_config()] if self.metrics is not None else None
+            self.session = self._aiohttp.ClientSession(connector=connector, trace_configs=trace_configs)
+            pending, self._pending_cookies = self._pending_cookies, {}
+            for name, value in pending.items():
+                self._set_cookie(name, value)
+        return self.session
+
+    def _trace_config(self) -> 'aiohttp.TraceConfig':
+        # record when each phase starts and ends into the `timings` dict passed by `_request`
+        def phase(name: str, end: bool):
+            async def callback(session, context, params):
+                timings = context.trace_request_ctx
+                if timings is None:
+                    return
+                if end:
+                    timings[name] = time.perf_counter() - timings.pop('_' + name)
+                else:
+                    timings['_' + name] = time.perf_counter()
+            return callback
+
+        trace_config = self._aiohttp.TraceConfig()
+        trace_config.on_dns_resolvehost_start.append(phase('dns', False))
+        trace_config.on_dns_resolvehost_end.append(phase('dns', True))
+        trace_config.on_connection_create_start.append(phase('connect', False))
+        trace_config.on_connection_create_end.append(phase('connect', True))
+        trace_config.on_request_start.append(phase('ttfb', False))
+        trace_config.on_request_end.append(phase('ttfb', True))  # fired once the response headers are read
+        return trace_config
+
+    async def _throttle(self):
+        if self.throttle is not None:
+            delay = self.throttle.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        domains = self._semaphores.setdefault(asyncio.get_running_loop(), {})
+        if self.domain not in domains:
+            domains[self.domain] = asyncio.Semaphore(self.max_concurrency)
+        return domains[self.domain]
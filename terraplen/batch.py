@@ -0,0 +1,186 @@
+from array import array
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from terraplen.models import Offer, OfferList, Review, ReviewList
+from terraplen.utils import lazy_import
+
+if TYPE_CHECKING:  # pragma: no cover
+    import numpy
+    import pandas
+    import pyarrow
+
+NAN = float('nan')
+ARROW_TYPES = {'b': 'int8', 'q': 'int64', 'd': 'float64'}  # typecode of `array.array` -> arrow type alias
+
+
+class _Batch:
+    """
+    Columnar storage of many records. Numeric fields are kept in `array.array`, one contiguous buffer per field,
+    others in one `list` per field.
+    """
+    # (field, typecode of `array.array` or None for a list of objects)
+    _columns: Tuple[Tuple[str, Optional[str]], ...] = ()
+
+    def __init__(self):
+        self._data = {name: array(typecode) if typecode else [] for name, typecode in self._columns}
+        self._appends = [self._data[name].append for name, _ in self._columns]
+
+    def __len__(self):
+        return len(self._data[self._columns[0][0]])
+
+    def __getstate__(self):
+        return self._data
+
+    def __setstate__(self, state):
+        self._data = state
+        self._appends = [self._data[name].append for name, _ in self._columns]
+
+    def __iter__(self) -> Iterator:
+        return (self[i] for i in range(len(self)))
+
+    def column(self, name: str) -> Union[array, List]:
+        """
+        Values of one field. The returned object is the storage itself, do not modify it.
+        :param name: field name
+        """
+        return self._data[name]
+
+    @property
+    def columns(self) -> List[str]:
+        return [name for name, _ in self._columns]
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Bytes of the numeric buffers. Objects referenced by the list columns are not counted.
+        """
+        return sum(column.itemsize * len(column) for column in self._data.values() if isinstance(column, array))
+
+    def to_numpy(self) -> Dict[str, 'numpy.ndarray']:
+        """
+        Convert to one NumPy array per field.
+        Numeric fields are views on the batch buffers and are not copied. While a view is alive the batch cannot grow.
+        Other fields become `object` arrays.
+        """
+        numpy = lazy_import('numpy', 'to_numpy')
+        result = {}
+        for name, typecode in self._columns:
+            column = self._data[name]
+            if typecode:
+                result[name] = numpy.frombuffer(column, dtype=column.typecode) if column else \
+                    numpy.empty(0, dtype=column.typecode)
+            else:
+                result[name] = numpy.array(column, dtype=object)
+        return result
+
+    def to_pandas(self) -> 'pandas.DataFrame':
+        """
+        Convert to `pandas.DataFrame`. Numeric fields are not copied when pandas can keep them as they are.
+        """
+        pandas = lazy_import('pandas', 'to_pandas')
+        return pandas.DataFrame(self.to_numpy(), copy=False)
+
+    def to_arrow(self) -> 'pyarrow.Table':
+        """
+        Convert to `pyarrow.Table`. Numeric fields wrap the batch buffers and are not copied.
+        """
+        pyarrow = lazy_import('pyarrow', 'to_arrow')
+        arrays = []
+        for name, typecode in self._columns:
+            column = self._data[name]
+            if typecode:
+                arrays.append(pyarrow.Array.from_buffers(pyarrow.type_for_alias(ARROW_TYPES[typecode]), len(column),
+                                                         [None, pyarrow.py_buffer(column)]))
+            else:
+                arrays.append(pyarrow.array(column, type=pyarrow.string()))
+        return pyarrow.Table.from_arrays(arrays, names=self.columns)
+
+    def _append(self, values: Iterable):
+        for append, value in zip(self._appends, values):
+            append(value)
+
+
+class ReviewBatch(_Batch):
+    """
+    Reviews of any number of products, one column per field of `Review` plus `asin`.
+    Missing `rating` is stored as 0.
+    """
+    _columns = (('asin', None), ('reviewer', None), ('reviewer_url', None), ('review_url', None), ('title', None),
+                ('rating', 'b'), ('helpful', 'q'), ('body', None))
+
+    def __init__(self, reviews: Optional[Iterable[ReviewList]] = None):
+        """
+        :param reviews: instances of `ReviewList` to start with
+        """
+        super().__init__()
+        for review_list in reviews or ():
+            self.extend(review_list)
+
+    def append(self, review: Review, asin: str):
+        self._append((asin, review.reviewer, review.reviewer_url, review.review_url, review.title,
+                      review.rating or 0, review.helpful, review.body))
+
+    def extend(self, reviews: Union[ReviewList, Iterable[Review]], asin: Optional[str] = None):
+        """
+        :param reviews: Instance of `ReviewList` or iterable of `Review`
+        :param asin: ASIN of the reviews. Defaults to `reviews.asin` of `ReviewList`.
+        """
+        if isinstance(reviews, ReviewList):
+            asin = asin or reviews.asin
+            reviews = reviews.reviews
+        for review in reviews:
+            self.append(review, asin)
+
+    def __getitem__(self, index: int) -> Review:
+        data = self._data
+        rating = data['rating'][index]
+        return Review(data['reviewer'][index], data['reviewer_url'][index], data['review_url'][index],
+                      data['title'][index], rating or None, data['helpful'][index], data['body'][index])
+
+    def asin(self, index: int) -> str:
+        return self._data['asin'][index]
+
+    def __repr__(self):
+        return 'ReviewBatch(len={}, asins={})'.format(len(self), len(set(self._data['asin'])))
+
+
+class OfferBatch(_Batch):
+    """
+    Offers of any number of listing pages, one column per field of `Offer`.
+    `price` is stored as float. Missing `price` and `approx_review` are stored as NaN.
+    """
+    _columns = (('price', 'd'), ('currency', None), ('approx_review', 'd'), ('condition', None),
+                ('ships_from', None), ('sold_by', None), ('sold_by_url', None))
+
+    def __init__(self, offers: Optional[Iterable[OfferList]] = None):
+        """
+        :param offers: instances of `OfferList` to start with
+        """
+        super().__init__()
+        for offer_list in offers or ():
+            self.extend(offer_list)
+
+    def append(self, offer: Offer):
+        self._append((NAN if offer.price is None else offer.price, offer.currency,
+                      NAN if offer.approx_review is None else offer.approx_review, offer.condition,
+                      offer.ships_from, offer.sold_by, offer.sold_by_url))
+
+    def extend(self, offers: Union[OfferList, Iterable[Offer]]):
+        """
+        :param offers: Instance of `OfferList` or iterable of `Offer`
+        """
+        if isinstance(offers, OfferList):
+            offers = offers.offers
+        for offer in offers:
+            self.append(offer)
+
+    def __getitem__(self, index: int) -> Offer:
+        data = self._data
+        price, approx_review = data['price'][index], data['approx_review'][index]
+        return Offer(None if price != price else price, data['currency'][index],
+                     None if approx_review != approx_review else approx_review, data['condition'][index],
+                     data['ships_from'][index], data['sold_by'][index], data['sold_by_url'][index])
+
+    def __repr__(self):
+        return 'OfferBatch(len={})'.format(len(self))
+
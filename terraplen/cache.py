@@ -0,0 +1,183 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from collections import namedtuple, OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+from urllib.parse import urlencode
+
+CachedResponse = namedtuple('CachedResponse', ['url', 'status_code', 'headers', 'content', 'encoding'])
+
+
+class HTTPCache:
+    default_ttl = {'rating': 24 * 60 * 60, 'offers': 15 * 60, 'reviews': 60 * 60}
+
+    def __init__(self, path: str, ttl: Optional[Dict[str, float]] = None, max_bytes: int = 256 * 1024 * 1024,
+                 compress_level: int = 6):
+        """
+        On-disk cache of raw responses, stored compressed in SQLite.
+        Stale entries are revalidated with `If-None-Match` / `If-Modified-Since` when the server sent `ETag` / `Last-Modified`.
+        :param path: path of the SQLite database. `':memory:'` keeps the cache in memory.
+        :param ttl: seconds a response stays fresh, per endpoint: `'rating'`, `'offers'` and `'reviews'`. Merged into `HTTPCache.default_ttl`. 0 disables caching of the endpoint.
+        :param max_bytes: maximum total size of stored bodies. Least recently used entries are evicted beyond it.
+        :param compress_level: zlib compression level of stored bodies
+        """
+        self.ttl = {**self.default_ttl, **(ttl or {})}
+        self.max_bytes = max_bytes
+        self.compress_level = compress_level
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS responses ('
+                                 'key TEXT PRIMARY KEY, endpoint TEXT, url TEXT, status_code INTEGER, headers TEXT, '
+                                 'encoding TEXT, content BLOB, etag TEXT, last_modified TEXT, size INTEGER, '
+                                 'stored_at REAL, accessed_at REAL)')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+
+    @staticmethod
+    def key(method: str, url: str, data: Optional[Dict], domain: str, language: str, currency: str) -> str:
+        """
+        Cache key of a request.
+        """
+        body = urlencode(sorted(data.items())) if data else ''
+        return hashlib.sha256('\n'.join((method.upper(), url, body, domain, language, currency)).encode()).hexdigest()
+
+    def enabled(self, endpoint: str) -> bool:
+        return self.ttl.get(endpoint, 0) > 0
+
+    def lookup(self, key: str, endpoint: str) -> Tuple[Optional[CachedResponse], bool, Dict[str, str]]:
+        """
+        Find a stored response.
+        :return: `(response, fresh, validators)`. `response` is None on miss. `validators` are the conditional request headers to revalidate a stale response.
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT url, status_code, headers, encoding, content, etag, last_modified, '
+                                           'stored_at FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None, False, {}
+            self._connection.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (time.time(), key))
+
+        url, status_code, headers, encoding, content, etag, last_modified, stored_at = row
+        response = CachedResponse(url, status_code, json.loads(headers), zlib.decompress(content), encoding)
+        fresh = time.time() - stored_at < self.ttl.get(endpoint, 0)
+        validators = {}
+        if etag:
+            validators['If-None-Match'] = etag
+        if last_modified:
+            validators['If-Modified-Since'] = last_modified
+        return response, fresh, validators
+
+    def store(self, key: str, endpoint: str, response: CachedResponse):
+        content = zlib.compress(response.content, self.compress_level)
+        # header names are case-insensitive, and servers may send `etag` or `last-modified`
+        headers = {name.lower(): value for name, value in response.headers.items()}
+        now = time.time()
+        with self._lock:
+            self._connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                     (key, endpoint, response.url, response.status_code, json.dumps(response.headers),
+                                      response.encoding, content, headers.get('etag'),
+                                      headers.get('last-modified'), len(content), now, now))
+            self._evict()
+
+    def refresh(self, key: str):
+        """
+        Mark a stored response fresh again, after the server answered `304 Not Modified`.
+        """
+        now = time.time()
+        with self._lock:
+            self._connection.execute('UPDATE responses SET stored_at = ?, accessed_at = ? WHERE key = ?',
+                                     (now, now, key))
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute('DELETE FROM responses')
+
+    def close(self):
+        self._connection.close()
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            return self._total_size()
+
+    def _total_size(self) -> int:
+        return self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def _evict(self):
+        excess = self._total_size() - self.max_bytes
+        if excess <= 0:
+            return
+        keys = []
+        for key, size in self._connection.execute('SELECT key, size FROM responses ORDER BY accessed_at'):
+            keys.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._connection.executemany('DELETE FROM responses WHERE key = ?', keys)
+
+
+class ResultCache:
+    default_ttl = {'get_rating': 10 * 60, 'get_offers': 60, 'get_review': 5 * 60}
+
+    def __init__(self, max_entries: int = 10000, ttl: Optional[Dict[str, float]] = None):
+        """
+        In-process cache of parsed results of `Scraper.get_rating`, `get_offers` and `get_review`.
+        Cached objects are shared between callers, so do not modify them.
+        :param max_entries: maximum number of results kept. Least recently used ones are evicted beyond it.
+        :param ttl: seconds a result stays valid, per method name. Merged into `ResultCache.default_ttl`. 0 disables caching of the method.
+        """
+        self.max_entries = max_entries
+        self.ttl = {**self.default_ttl, **(ttl or {})}
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._stats = {}  # method -> {'hits': int, 'misses': int, 'evictions': int}
+
+    def enabled(self, method: str) -> bool:
+        return self.ttl.get(method, 0) > 0
+
+    def get(self, method: str, key: Hashable) -> Tuple[bool, Any]:
+        """
+        :return: `(found, value)`
+        """
+        with self._lock:
+            stats = self._method_stats(method)
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                stats['misses'] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            stats['hits'] += 1
+            return True, entry[1]
+
+    def set(self, method: str, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl.get(method, 0), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._method_stats(evicted[0])['evictions'] += 1
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Hit, miss and eviction counts per method.
+        """
+        with self._lock:
+            return {method: dict(stats) for method, stats in self._stats.items()}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _method_stats(self, method: str) -> Dict[str, int]:
+        if method not in self._stats:
+            self._stats[method] = {'hits': 0, 'misses': 0, 'evictions': 0}
+        return self._stats[method]
@@ -0,0 +1,79 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from typing import List, Optional, Sequence, Set
+
+from terraplen.models import Country
+
+Checkpoint = namedtuple('Checkpoint', ['asin', 'country', 'review_ids', 'synced', 'updated_at'])
+
+_review_id = re.compile(r'/customer-reviews/([A-Za-z0-9]+)')
+
+
+def review_id(review_url: Optional[str]) -> Optional[str]:
+    """
+    ID of a review such as `'R099069604633'`, taken from its `review_url`. None if the url has none.
+    """
+    match = _review_id.search(review_url or '')
+    return match.group(1) if match else None
+
+
+class CheckpointStore:
+    def __init__(self, path: str, keep: int = 20):
+        """
+        Newest review IDs already synced, per ASIN and marketplace, stored in SQLite. Used by `Scraper.sync_reviews`.
+        :param path: path of the SQLite database. `':memory:'` keeps the checkpoints in memory.
+        :param keep: number of newest review IDs kept per checkpoint. More than one, so a sync still stops when the newest known review was deleted.
+        """
+        self.keep = keep
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS checkpoints ('
+                                 'asin TEXT, country TEXT, review_ids TEXT, synced INTEGER, updated_at REAL, '
+                                 'PRIMARY KEY (asin, country))')
+
+    def get(self, asin: str, country: Country) -> Optional[Checkpoint]:
+        with self._lock:
+            row = self._connection.execute('SELECT review_ids, synced, updated_at FROM checkpoints '
+                                           'WHERE asin = ? AND country = ?', (asin, country.value)).fetchone()
+        if row is None:
+            return None
+        return Checkpoint(asin, country, json.loads(row[0]), row[1], row[2])
+
+    def known(self, asin: str, country: Country) -> Set[str]:
+        """
+        Review IDs a sync of `asin` stops at. Empty before the first sync.
+        """
+        checkpoint = self.get(asin, country)
+        return set(checkpoint.review_ids) if checkpoint else set()
+
+    def update(self, asin: str, country: Country, review_ids: Sequence[str]) -> Checkpoint:
+        """
+        Record newly synced reviews.
+        :param review_ids: IDs of the new reviews, newest first. Put in front of the ones already known.
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT review_ids, synced FROM checkpoints WHERE asin = ? AND country = ?',
+                                           (asin, country.value)).fetchone()
+            known: List[str] = json.loads(row[0]) if row else []
+            synced = (row[1] if row else 0) + len(review_ids)
+            kept = list(dict.fromkeys(list(review_ids) + known))[:self.keep]
+            now = time.time()
+            self._connection.execute('INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?)',
+                                     (asin, country.value, json.dumps(kept), synced, now))
+        return Checkpoint(asin, country, kept, synced, now)
+
+    def delete(self, asin: str, country: Country):
+        """
+        Forget the checkpoint, so the next sync walks every page again.
+        """
+        with self._lock:
+            self._connection.execute('DELETE FROM checkpoints WHERE asin = ? AND country = ?', (asin, country.value))
+
+    def close(self):
+        self._connection.close()
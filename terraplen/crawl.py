@@ -0,0 +1,382 @@
+import multiprocessing
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from terraplen.exception import ProductNotFoundException
+from terraplen.models import Country, OfferList, ReviewList, ReviewSettings
+from terraplen.throttle import backoff_delay
+
+KINDS = ('rating', 'offers', 'reviews')
+
+Job = namedtuple('Job', ['id', 'asin', 'country', 'kind', 'page', 'priority', 'status', 'attempts', 'error'])
+Job.__doc__ = """
+One request of a crawl. `status` is `'pending'`, `'leased'`, `'done'` or `'failed'`.
+`attempts` counts the leases so far and identifies the current one.
+"""
+
+_columns = 'id, asin, country, kind, page, priority, status, attempts, error'
+
+
+def _job(row) -> Job:
+    return Job(row[0], row[1], Country(row[2]), *row[3:])
+
+
+class JobQueue:
+    def __init__(self, path: str, lease_time: float = 60.0, max_attempts: int = 3, backoff_base: float = 1.0,
+                 backoff_cap: float = 300.0):
+        """
+        Durable queue of crawl jobs and their results, stored in SQLite. Used by `Crawler`.
+        Thread safe, and safe to open from several processes at once: each process opens its own `JobQueue`
+        of the same path.
+        A job is one `(asin, country, kind, page)` and is stored once, so putting it again does nothing,
+        even after it is done. A leased job goes back to the queue when its lease expires without an outcome,
+        such as when its worker crashed.
+        :param path: path of the SQLite database. `':memory:'` only works within one process.
+        :param lease_time: seconds a worker has to finish a job before it is handed to another worker
+        :param max_attempts: leases of a job before it is given up as failed
+        :param backoff_base: base of the delay before a failed job is retried, in seconds. See `terraplen.throttle.backoff_delay`.
+        :param backoff_cap: maximum delay before a failed job is retried, in seconds
+        """
+        self.path = path
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                                 'id INTEGER PRIMARY KEY, asin TEXT, country TEXT, kind TEXT, page INTEGER, '
+                                 'priority INTEGER, status TEXT, attempts INTEGER, error TEXT, not_before REAL, '
+                                 'lease_until REAL, worker TEXT, updated_at REAL, UNIQUE (asin, country, kind, page))')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS jobs_order ON jobs (status, priority DESC, id)')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS results (id INTEGER PRIMARY KEY, value BLOB)')
+
+    def __enter__(self) -> 'JobQueue':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def put(self, asin: str, country: Union[Country, str], kind: str, page: int = 1, priority: int = 0) -> bool:
+        """
+        Add a job, unless it is already in the queue.
+        :param country: marketplace, as `terraplen.Country` or `str`
+        :param kind: `'rating'`, `'offers'` or `'reviews'`
+        :param page: page of offers or reviews. Always 1 for rating.
+        :param priority: jobs of higher priority are leased first, then the oldest
+        :return: whether the job was added
+        """
+        return self.put_many([(asin, country, kind, page)], priority) == 1
+
+    def put_many(self, jobs: Iterable[Tuple[str, Union[Country, str], str, int]], priority: int = 0) -> int:
+        """
+        Add many `(asin, country, kind, page)` jobs in one transaction. See `put`.
+        :return: number of jobs added
+        """
+        rows = [self._row(*job, priority=priority) for job in jobs]
+        with self._lock, self._transaction():
+            return self._insert(rows)
+
+    def lease(self, worker: str = '') -> Optional[Job]:
+        """
+        Take the next job: the pending one of highest priority, or one whose lease expired.
+        Report its outcome with `complete` or `fail` within `lease_time` seconds.
+        :param worker: name of the worker, kept for `Job` inspection
+        :return: None if no job is ready now
+        """
+        now = time.time()
+        with self._lock, self._transaction():
+            self._connection.execute("UPDATE jobs SET status = 'failed', error = 'lease expired', updated_at = ? "
+                                     "WHERE status = 'leased' AND lease_until <= ? AND attempts >= ?",
+                                     (now, now, self.max_attempts))
+            row = self._connection.execute('SELECT {} FROM jobs WHERE (status = ? AND not_before <= ?) '
+                                           'OR (status = ? AND lease_until <= ?) '
+                                           'ORDER BY priority DESC, id LIMIT 1'.format(_columns),
+                                           ('pending', now, 'leased', now)).fetchone()
+            if row is None:
+                return None
+            job = _job(row)._replace(status='leased', attempts=row[7] + 1)
+            self._connection.execute("UPDATE jobs SET status = 'leased', attempts = ?, lease_until = ?, worker = ?, "
+                                     "updated_at = ? WHERE id = ?",
+                                     (job.attempts, now + self.lease_time, worker, now, job.id))
+        return job
+
+    def complete(self, job: Job, result: Any, follow_ups: Iterable[Tuple[str, int]] = ()) -> bool:
+        """
+        Store the result of a leased job and add the jobs it leads to, at once, so a crash never loses one of them.
+        :param result: picklable result, such as what `Scraper.get_offers` returned
+        :param follow_ups: `(kind, page)` of further jobs of the same ASIN and marketplace, with the same priority
+        :return: False if the lease was lost to another worker. Nothing is stored then.
+        """
+        value = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+        rows = [self._row(job.asin, job.country, kind, page, priority=job.priority) for kind, page in follow_ups]
+        with self._lock, self._transaction():
+            if not self._finish(job, 'done', None, None):
+                return False
+            self._connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?)', (job.id, value))
+            self._insert(rows)
+        return True
+
+    def fail(self, job: Job, error: Union[Exception, str], retry: bool = True, delay: Optional[float] = None) -> bool:
+        """
+        Record a failed attempt. The job is retried after a backoff, unless `retry` is False or it ran out of attempts.
+        :param delay: seconds before the retry. Defaults to exponential backoff with jitter.
+        :return: False if the lease was lost to another worker
+        """
+        if isinstance(error, Exception):
+            error = '{}: {}'.format(type(error).__name__, error)
+        if retry and job.attempts < self.max_attempts:
+            if delay is None:
+                delay = backoff_delay(job.attempts - 1, self.backoff_base, self.backoff_cap)
+            status, not_before = 'pending', time.time() + delay
+        else:
+            status, not_before = 'failed', None
+        with self._lock, self._transaction():
+            return self._finish(job, status, error, not_before)
+
+    def retry_failed(self, kind: Optional[str] = None) -> int:
+        """
+        Queue failed jobs again with fresh attempts, such as after fixing what made them fail.
+        :param kind: only jobs of this kind
+        :return: number of jobs queued again
+        """
+        with self._lock:
+            return self._connection.execute("UPDATE jobs SET status = 'pending', attempts = 0, not_before = 0 "
+                                            "WHERE status = 'failed' AND kind LIKE ?", (kind or '%',)).rowcount
+
+    def get(self, job_id: int) -> Optional[Job]:
+        with self._lock:
+            row = self._connection.execute('SELECT {} FROM jobs WHERE id = ?'.format(_columns), (job_id,)).fetchone()
+        return _job(row) if row else None
+
+    def jobs(self, status: Optional[str] = None) -> List[Job]:
+        """
+        Every job, oldest first.
+        :param status: only jobs of this status
+        """
+        with self._lock:
+            rows = self._connection.execute('SELECT {} FROM jobs WHERE status LIKE ? ORDER BY id'.format(_columns),
+                                            (status or '%',)).fetchall()
+        return [_job(row) for row in rows]
+
+    def results(self, kind: Optional[str] = None) -> Iterator[Tuple[Job, Any]]:
+        """
+        Yield `(job, result)` of every job done, oldest first.
+        :param kind: only results of this kind
+        """
+        last = 0
+        while True:  # in chunks, so the results never have to fit in memory at once
+            with self._lock:
+                rows = self._connection.execute('SELECT {}, value FROM jobs JOIN results USING (id) '
+                                                'WHERE id > ? AND kind LIKE ? ORDER BY id LIMIT 500'
+                                                .format(', '.join('jobs.' + column for column in _columns.split(', '))),
+                                                (last, kind or '%')).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield _job(row[:-1]), pickle.loads(row[-1])
+            last = rows[-1][0]
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Number of jobs of every status.
+        """
+        with self._lock:
+            rows = self._connection.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        return {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0, **dict(rows)}
+
+    def unfinished(self) -> int:
+        """
+        Number of jobs pending or leased, including ones waiting for their retry.
+        """
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM jobs "
+                                            "WHERE status IN ('pending', 'leased')").fetchone()[0]
+
+    def close(self):
+        self._connection.close()
+
+    @staticmethod
+    def _row(asin: str, country: Union[Country, str], kind: str, page: int = 1, priority: int = 0) -> Tuple:
+        if kind not in KINDS:
+            raise ValueError('kind must be one of {}, not `{}`'.format(KINDS, kind))
+        return asin, Country(country).value, kind, page if kind != 'rating' else 1, priority, time.time()
+
+    def _insert(self, rows: List[Tuple]) -> int:
+        before = self._connection.total_changes
+        self._connection.executemany("INSERT OR IGNORE INTO jobs (asin, country, kind, page, priority, status, "
+                                     "attempts, not_before, updated_at) VALUES (?, ?, ?, ?, ?, 'pending', 0, 0, ?)",
+                                     rows)
+        return self._connection.total_changes - before
+
+    def _finish(self, job: Job, status: str, error: Optional[str], not_before: Optional[float]) -> bool:
+        # `attempts` fences the lease: a worker whose lease expired and was taken over cannot overwrite the outcome
+        return self._connection.execute("UPDATE jobs SET status = ?, error = ?, not_before = ?, lease_until = NULL, "
+                                        "updated_at = ? WHERE id = ? AND status = 'leased' AND attempts = ?",
+                                        (status, error, not_before, time.time(), job.id, job.attempts)).rowcount == 1
+
+    def _transaction(self) -> '_Transaction':
+        return _Transaction(self._connection)
+
+
+class _Transaction:
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+    def __enter__(self):
+        # takes the write lock up front, so two processes never lease the same job
+        self.connection.execute('BEGIN IMMEDIATE')
+
+    def __exit__(self, exc_type, *exc):
+        self.connection.execute('COMMIT' if exc_type is None else 'ROLLBACK')
+
+
+def follow_ups(job: Job, result: Union[OfferList, ReviewList, Dict]) -> List[Tuple[str, int]]:
+    """
+    `(kind, page)` of the jobs the result of `job` leads to.
+    Reviews go on one page at a time until `ReviewList.last_page`. Offers go on one page at a time too, until a page
+    has no offer or the first page already holds all `OfferList.offer_count` of them. The page size of the listing is
+    not assumed, and offers without a price, which are left out of `OfferList.offers`, do not stop the walk early.
+    """
+    if job.kind == 'reviews' and not result.last_page:
+        return [('reviews', job.page + 1)]
+    if job.kind == 'offers' and result.offers:
+        if job.page == 1 and result.offer_count is not None and len(result.offers) >= result.offer_count:
+            return []
+        return [('offers', job.page + 1)]
+    return []
+
+
+class Crawler:
+    def __init__(self, path: str, workers: Optional[int] = None, factory: Optional[Callable[..., Any]] = None,
+                 review_settings: Optional[ReviewSettings] = None, offer_filters: Optional[Dict] = None,
+                 lease_time: float = 60.0, max_attempts: int = 3, backoff_base: float = 1.0,
+                 poll_interval: float = 0.5, kwargs_factory: Optional[Callable[[], Dict]] = None, **kwargs):
+        """
+        Drain a `JobQueue` with worker processes, each with its own Scraper per marketplace, and store the results
+        in the queue. Pagination adds follow-up jobs, see `follow_ups`.
+        Put jobs with `put` or `JobQueue.put`, run `run()`, read the results with `JobQueue.results`.
+        A crawl that crashed or was stopped resumes where it left off when `run()` is called again: finished jobs
+        are kept, and jobs leased by a dead worker are handed out again once their lease expires.
+        Each process has its own `Throttle`, so size its rate for one worker.
+        The Crawler is pickled into every worker process, so `factory`, `kwargs_factory` and `kwargs` must be
+        picklable: module level functions or classes and plain values, not lambdas.
+        :param path: path of the SQLite database of the queue
+        :param workers: number of worker processes. Defaults to `os.cpu_count()`.
+        :param factory: callable creating the Scraper of a marketplace in a worker, called as `factory(country, **kwargs)`. Defaults to `Scraper`.
+        :param review_settings: Instance of `terraplen.ReviewSettings` for every reviews job
+        :param offer_filters: filters of `get_offers`, except `page`, for every offers job
+        :param lease_time: see `JobQueue`. Longer than the slowest job, retries and throttling included.
+        :param max_attempts: see `JobQueue`
+        :param backoff_base: see `JobQueue`
+        :param poll_interval: seconds an idle worker waits before looking for a job again
+        :param kwargs_factory: callable returning more keyword arguments of the Scrapers, called once in every worker. Build what must not cross processes there, such as `SessionPool`, `ProxyPool` or `HTTPCache`.
+        :param kwargs: passed to every Scraper, such as `language` or `max_retries`
+        :raise ValueError: if `kwargs` cannot be pickled
+        """
+        try:
+            pickle.dumps(kwargs)
+        except Exception as e:
+            raise ValueError('kwargs of Crawler are sent to worker processes and must be picklable. '
+                             'Create them in `kwargs_factory` instead: {}'.format(e)) from e
+        self.path = path
+        self.workers = workers or os.cpu_count() or 1
+        self.factory = factory
+        self.review_settings = review_settings
+        self.offer_filters = offer_filters or {}
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.poll_interval = poll_interval
+        self.kwargs_factory = kwargs_factory
+        self.kwargs = kwargs
+
+    def queue(self) -> JobQueue:
+        """
+        New connection to the queue of this crawl. Close it when done.
+        """
+        return JobQueue(self.path, self.lease_time, self.max_attempts, self.backoff_base)
+
+    def put(self, asins: Iterable[str], countries: Iterable[Union[Country, str]],
+            kinds: Iterable[str] = KINDS, priority: int = 0) -> int:
+        """
+        Queue the first page of every kind for every ASIN on every marketplace.
+        :return: number of jobs added. Jobs already queued are not added again.
+        """
+        kinds, countries = list(kinds), list(countries)
+        with self.queue() as queue:
+            return queue.put_many(((asin, country, kind, 1) for asin in asins for country in countries
+                                   for kind in kinds), priority)
+
+    def run(self, mp_context: Optional[multiprocessing.context.BaseContext] = None) -> Dict[str, int]:
+        """
+        Start the worker processes and wait until no job is pending or leased.
+        :param mp_context: multiprocessing context starting the workers, such as `multiprocessing.get_context('spawn')`. Defaults to the default start method.
+        :return: `JobQueue.counts` after the run
+        """
+        processes = [(mp_context or multiprocessing).Process(target=self.work, args=('worker-{}'.format(i),), daemon=True)
+                     for i in range(self.workers)]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+        with self.queue() as queue:
+            return queue.counts()
+
+    def work(self, worker: str = 'worker'):
+        """
+        Body of one worker: lease, run and complete jobs until none is pending or leased.
+        Called in each process started by `run`. May also be called directly, such as on other machines
+        sharing the database file.
+        """
+        from terraplen.terraplen import Scraper
+
+        factory = self.factory or Scraper
+        owned = self.kwargs_factory() if self.kwargs_factory else {}  # this worker's own, closed when it is done
+        kwargs = {**self.kwargs, **owned}
+        queue = self.queue()
+        scrapers = {}
+        try:
+            while True:
+                job = queue.lease('{}:{}'.format(worker, os.getpid()))
+                if job is None:
+                    if not queue.unfinished():
+                        return
+                    time.sleep(self.poll_interval)  # retries are waiting, or other workers may add follow-ups
+                    continue
+                try:
+                    if job.country not in scrapers:
+                        scrapers[job.country] = factory(job.country, **kwargs)
+                    result = self._run(scrapers[job.country], job)
+                except ProductNotFoundException as e:
+                    queue.fail(job, e, retry=False)
+                except Exception as e:
+                    queue.fail(job, e, delay=getattr(e, 'retry_after', None))
+                else:
+                    queue.complete(job, result, follow_ups(job, result))
+        finally:
+            for scraper in scrapers.values():
+                scraper.session.close()
+            for value in owned.values():
+                if hasattr(value, 'close'):
+                    value.close()
+            queue.close()
+
+    def _run(self, scraper, job: Job):
+        if job.kind == 'rating':
+            return scraper.get_rating(job.asin)
+        if job.kind == 'offers':
+            return scraper.get_offers(job.asin, page=job.page, **self.offer_filters)
+        return scraper.get_review(job.asin, job.page, self.review_settings)
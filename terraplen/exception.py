@@ -1,5 +1,6 @@
 BotDetectedStatusCode = 503
 ProductNotFoundCode = 404
+BotDetectedPath = '/errors/validateCaptcha'  # Amazon redirects detected bots to a captcha page
 
 
 class DetectedAsBotException(RuntimeError):
@@ -8,3 +9,23 @@ class DetectedAsBotException(RuntimeError):
 
 class ProductNotFoundException(ValueError):
     pass
+
+
+class CircuitOpenException(DetectedAsBotException):
+    def __init__(self, retry_after: float):
+        """
+        Raised without sending the request while the marketplace is blocking us. See `terraplen.throttle.Throttle`.
+        :param retry_after: seconds until a request is let through again
+        """
+        super().__init__('too many bot detections in a row. retry after {:.1f} seconds'.format(retry_after))
+        self.retry_after = retry_after
+
+
+class NoProxyAvailableException(RuntimeError):
+    def __init__(self, retry_after: float):
+        """
+        Raised without sending the request while every proxy is quarantined. See `terraplen.ProxyPool`.
+        :param retry_after: seconds until a proxy comes out of quarantine
+        """
+        super().__init__('every proxy is quarantined. retry after {:.1f} seconds'.format(retry_after))
+        self.retry_after = retry_after
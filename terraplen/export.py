@@ -0,0 +1,243 @@
+import bz2
+import csv
+import gzip
+import json
+import lzma
+import os
+from typing import IO, Dict, Iterable, List, Optional, Tuple, Union
+
+from terraplen.models import Offer, OfferList, Review, ReviewList
+from terraplen.utils import lazy_import
+
+Record = Union[Review, Offer]
+
+# compression -> function opening a compressed text file
+TEXT_COMPRESSIONS = {'gzip': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}
+COMPRESSION_SUFFIXES = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz'}
+
+# arrow type of every field that is not a string. Fixed up front so all row groups share one schema.
+ARROW_FIELD_TYPES = {(Review, 'rating'): 'int8', (Review, 'helpful'): 'int64',
+                     (Offer, 'price'): 'double', (Offer, 'approx_review'): 'double'}
+
+
+class Sink:
+    """
+    Base of streaming writers. Rows are buffered and written every `batch_size` rows, so memory stays bounded
+    no matter how many records go through.
+    Use as `with JSONLSink('reviews.jsonl') as sink:` or call `close()` yourself.
+    """
+
+    def __init__(self, batch_size: int = 1000):
+        """
+        :param batch_size: number of rows buffered before they are written and flushed
+        """
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self.fields: Optional[List[str]] = None
+        self._record_type = None
+        self._columns: Tuple[str, ...] = ()
+        self._buffer = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, record: Record, **columns):
+        """
+        Add one record.
+        :param record: Instance of `Review` or `Offer`. Every record of a sink must be of the same type.
+        :param columns: extra columns such as `asin='B07WXL5YPW'`, added after the fields of the record. The first
+                        record fixes their names, and every later record must come with the same ones.
+        :raise TypeError: if `record` is not of the type of the first record
+        :raise ValueError: if the names of `columns` differ from the ones of the first record
+        """
+        if self.fields is None:
+            self._record_type = type(record)
+            self._columns = tuple(columns)
+            self.fields = list(record._fields) + list(columns)
+            self._buffer.append(tuple(record) + tuple(columns.values()))
+            self._open()  # after buffering, so a sink can look at the first row
+        else:
+            if type(record) is not self._record_type:
+                raise TypeError('`{}` accepts only `{}`, not `{}`'.format(type(self).__name__,
+                                                                          self._record_type.__name__,
+                                                                          type(record).__name__))
+            if columns.keys() != set(self._columns):
+                raise ValueError('extra columns must be {}, the ones of the first record, not {}'.format(
+                    list(self._columns), list(columns)))
+            self._buffer.append(tuple(record) + tuple(columns[name] for name in self._columns))
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def write_many(self, records: Iterable[Union[Record, ReviewList, OfferList]], **columns):
+        """
+        Add records from any iterable, consumed lazily, such as `Scraper.iter_reviews`.
+        `ReviewList` and `OfferList` in it are expanded into their records.
+        :param columns: extra columns added to every record. See `write`.
+        """
+        for record in records:
+            if isinstance(record, ReviewList):
+                self.write_many(record.reviews, **columns)
+            elif isinstance(record, OfferList):
+                self.write_many(record.offers, **columns)
+            else:
+                self.write(record, **columns)
+
+    def flush(self):
+        """
+        Write buffered rows.
+        """
+        if self._buffer:
+            self._write_rows(self._buffer)
+            self.rows_written += len(self._buffer)
+            self._buffer = []
+
+    def close(self):
+        self.flush()
+        self._close()
+
+    def _open(self):
+        raise NotImplementedError
+
+    def _write_rows(self, rows: List[tuple]):
+        raise NotImplementedError
+
+    def _close(self):
+        raise NotImplementedError
+
+
+class _TextSink(Sink):
+    def __init__(self, file: Union[str, IO[str]], compression: Optional[str] = None, batch_size: int = 1000):
+        """
+        :param file: path, or text file object which is left open
+        :param compression: `'gzip'`, `'bz2'`, `'xz'` or None. Ignored if `file` is a file object.
+        :param batch_size: number of rows buffered before they are written and flushed
+        """
+        super().__init__(batch_size)
+        if compression is not None and compression not in TEXT_COMPRESSIONS:
+            raise ValueError('unknown compression `{}`. Choose from {}'.format(compression, list(TEXT_COMPRESSIONS)))
+        self.file = file
+        self.compression = compression
+        self._stream: Optional[IO[str]] = None
+        self._owns_stream = isinstance(file, (str, os.PathLike))
+
+    def _open(self):
+        if not self._owns_stream:
+            self._stream = self.file
+        elif self.compression:
+            self._stream = TEXT_COMPRESSIONS[self.compression](self.file, 'wt', encoding='utf-8', newline='')
+        else:
+            self._stream = open(self.file, 'w', encoding='utf-8', newline='')
+
+    def _close(self):
+        if self._stream is None:  # nothing was written. still leave a valid, empty file behind
+            self._open()
+        if self._owns_stream:
+            self._stream.close()
+        else:
+            self._stream.flush()
+
+
+class JSONLSink(_TextSink):
+    """
+    One JSON object per line.
+    """
+
+    def _write_rows(self, rows: List[tuple]):
+        fields = self.fields
+        self._stream.write(''.join(json.dumps(dict(zip(fields, row)), ensure_ascii=False) + '\n' for row in rows))
+        self._stream.flush()
+
+
+class CSVSink(_TextSink):
+    """
+    CSV with a header row. None is written as an empty cell.
+    """
+
+    def _open(self):
+        super()._open()
+        self._writer = csv.writer(self._stream)
+        if self.fields is not None:
+            self._writer.writerow(self.fields)
+
+    def _write_rows(self, rows: List[tuple]):
+        self._writer.writerows(rows)
+        self._stream.flush()
+
+
+class ParquetSink(Sink):
+    """
+    Parquet file written one row group per `batch_size` rows. Requires `pyarrow`.
+    The schema comes from the first record, so no file is created if nothing was written.
+    """
+
+    def __init__(self, file: Union[str, IO[bytes]], compression: Optional[str] = 'snappy', batch_size: int = 10000,
+                 column_types: Optional[Dict[str, str]] = None):
+        """
+        :param file: path, or binary file object
+        :param compression: any codec of `pyarrow.parquet.ParquetWriter` such as `'snappy'`, `'zstd'` or `'gzip'`. None for no compression.
+        :param batch_size: number of rows per row group
+        :param column_types: arrow type of extra columns, such as `{'page': 'int32'}`. Those not given are inferred from their value in the first row, and are strings if it is None.
+        """
+        self._pyarrow = lazy_import('pyarrow', 'ParquetSink')
+        self._parquet = lazy_import('pyarrow.parquet', 'ParquetSink', 'pyarrow')
+        super().__init__(batch_size)
+        self.file = file
+        self.compression = compression or 'none'
+        self.column_types = column_types or {}
+        self._writer = None
+        self._schema = None
+
+    def _open(self):
+        pyarrow = self._pyarrow
+        fields = self._record_type._fields
+        types = {name: ARROW_FIELD_TYPES.get((self._record_type, name), 'string') for name in fields}
+        for name, value in zip(self._columns, self._buffer[0][len(fields):]):  # extra columns, from the first row
+            inferred = pyarrow.infer_type([value]) if value is not None else 'string'
+            types[name] = self.column_types.get(name, inferred)
+        self._schema = pyarrow.schema([(name, types[name]) for name in self.fields])
+        self._writer = self._parquet.ParquetWriter(self.file, self._schema, compression=self.compression)
+
+    def _write_rows(self, rows: List[tuple]):
+        pyarrow = self._pyarrow
+        columns = [pyarrow.array(column, type=field.type) for column, field in zip(zip(*rows), self._schema)]
+        self._writer.write_table(pyarrow.Table.from_arrays(columns, schema=self._schema))
+
+    def _close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+_sinks = {'.jsonl': JSONLSink, '.csv': CSVSink, '.parquet': ParquetSink}
+
+
+def open_sink(path: str, **kwargs) -> Sink:
+    """
+    Open a sink chosen by file extension: `.jsonl`, `.csv` or `.parquet`.
+    `.gz`, `.bz2` or `.xz` after `.jsonl` or `.csv` turns on compression, as in `reviews.jsonl.gz`.
+    :param path: destination path
+    :param kwargs: passed to the sink
+    """
+    root, extension = os.path.splitext(path)
+    if extension in COMPRESSION_SUFFIXES and os.path.splitext(root)[1] in ('.jsonl', '.csv'):
+        kwargs.setdefault('compression', COMPRESSION_SUFFIXES[extension])
+        extension = os.path.splitext(root)[1]
+    if extension not in _sinks:
+        raise ValueError('cannot tell the format of `{}`. Use one of {}'.format(path, list(_sinks)))
+    return _sinks[extension](path, **kwargs)
+
+
+def export_records(records: Iterable[Union[Record, ReviewList, OfferList]], path: str, **columns) -> int:
+    """
+    Write records to `path` as they come, with the format chosen by `open_sink`.
+    `export_records(scraper.iter_reviews(asin), 'reviews.jsonl.gz', asin=asin)`
+    :param records: iterable of `Review`, `Offer`, `ReviewList` or `OfferList`
+    :param path: destination path
+    :param columns: extra columns added to every record
+    :return: number of rows written
+    """
+    with open_sink(path) as sink:
+        sink.write_many(records, **columns)
+    return sink.rows_written
@@ -0,0 +1,204 @@
+import bisect
+import threading
+from typing import TYPE_CHECKING, Callable, Dict, List, Sequence, Tuple
+
+if TYPE_CHECKING:  # pragma: no cover
+    from http.server import ThreadingHTTPServer
+
+# seconds. shared by network latency and parse time, so both can be read on one scale
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Hook = Callable[[str, Dict], None]
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str]):
+        """
+        Monotonically increasing value per label set.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_values(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_values(self.labelnames, labels), 0)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            return [(self.name, dict(zip(self.labelnames, key)), value) for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """
+        Distribution of observed values per label set, counted into cumulative buckets.
+        :param buckets: upper bounds of the buckets, ascending. `+Inf` is added.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], List] = {}  # labels -> [count per bucket and +Inf, sum]
+
+    def observe(self, value: float, **labels):
+        key = _label_values(self.labelnames, labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+
+    def count(self, **labels) -> int:
+        state = self._values.get(_label_values(self.labelnames, labels))
+        return sum(state[0]) if state else 0
+
+    def sum(self, **labels) -> float:
+        state = self._values.get(_label_values(self.labelnames, labels))
+        return state[1] if state else 0.0
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        result = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                labels = dict(zip(self.labelnames, key))
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    result.append((self.name + '_bucket', {**labels, 'le': _format_value(bound)}, cumulative))
+                result.append((self.name + '_sum', labels, total))
+                result.append((self.name + '_count', labels, cumulative))
+        return result
+
+
+class Metrics:
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """
+        Counters and histograms of Scraper activity, labeled by endpoint (`'top'`, `'rating'`, `'offers'`, `'reviews'`)
+        and marketplace. Thread safe. May be shared between Scrapers.
+        Pass it as `Scraper(metrics=...)`, read it with `to_prometheus()`, or `subscribe` to the raw events.
+
+        `requests` does not expose DNS and connect time, so with `Scraper` they are included in TTFB.
+        `AsyncScraper` records them separately from aiohttp tracing.
+        :param buckets: upper bounds, in seconds, of the latency and parse time histograms
+        """
+        self.requests = Counter('terraplen_requests_total', 'Responses received, by status code.',
+                                ('endpoint', 'marketplace', 'status'))
+        self.latency = Histogram('terraplen_request_seconds', 'Request latency by phase: dns, connect, ttfb, total.',
+                                 ('endpoint', 'marketplace', 'phase'), buckets)
+        self.response_bytes = Counter('terraplen_response_bytes_total', 'Bytes of response bodies.',
+                                      ('endpoint', 'marketplace'))
+        self.cache_hits = Counter('terraplen_cache_hits_total', 'Responses served from HTTPCache.',
+                                  ('endpoint', 'marketplace'))
+        self.parse_time = Histogram('terraplen_parse_seconds', 'Time spent parsing one response.',
+                                    ('endpoint', 'marketplace', 'backend'), buckets)
+        self.fallbacks = Counter('terraplen_parse_fallbacks_total', 'Responses the fast path could not read, so the DOM '
+                                 'was parsed.', ('endpoint', 'marketplace'))
+        self.items = Counter('terraplen_items_total', 'Offers and reviews parsed.', ('endpoint', 'marketplace'))
+        self.coalesced = Counter('terraplen_coalesced_total', 'Calls that waited on an identical request in flight.',
+                                 ('endpoint', 'marketplace'))
+        self.retries = Counter('terraplen_retries_total', 'Retries after being detected as bot.',
+                               ('endpoint', 'marketplace'))
+        self.bot_detections = Counter('terraplen_bot_detections_total', 'Responses detected as bot.',
+                                      ('marketplace',))
+        self.metrics = [self.requests, self.latency, self.response_bytes, self.cache_hits, self.parse_time,
+                        self.fallbacks, self.items, self.coalesced, self.retries, self.bot_detections]
+        self._hooks: List[Hook] = []
+
+    def subscribe(self, hook: Hook):
+        """
+        Call `hook(event, fields)` on every event, after the metrics are recorded.
+        Events are `'response'`, `'cache_hit'`, `'parse'`, `'fallback'`, `'coalesced'`, `'retry'` and `'bot_detected'`.
+        A hook runs on the thread that made the request, so keep it fast.
+        """
+        self._hooks.append(hook)
+
+    def record(self, event: str, **fields):
+        """
+        Record one event. Called by the Scrapers.
+        """
+        labels = {'endpoint': fields.get('endpoint'), 'marketplace': fields.get('marketplace')}
+        if event == 'response':
+            self.requests.inc(status=str(fields['status']), **labels)
+            self.response_bytes.inc(fields['bytes'], **labels)
+            for phase in ('dns', 'connect', 'ttfb', 'total'):
+                if fields.get(phase) is not None:
+                    self.latency.observe(fields[phase], phase=phase, **labels)
+        elif event == 'cache_hit':
+            self.cache_hits.inc(**labels)
+        elif event == 'parse':
+            self.parse_time.observe(fields['seconds'], backend=fields['backend'], **labels)
+            if fields.get('items') is not None:
+                self.items.inc(fields['items'], **labels)
+        elif event == 'fallback':
+            self.fallbacks.inc(**labels)
+        elif event == 'coalesced':
+            self.coalesced.inc(**labels)
+        elif event == 'retry':
+            self.retries.inc(**labels)
+        elif event == 'bot_detected':
+            self.bot_detections.inc(marketplace=labels['marketplace'])
+        for hook in self._hooks:
+            hook(event, fields)
+
+    def to_prometheus(self) -> str:
+        """
+        Every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append('# HELP {} {}'.format(metric.name, metric.documentation))
+            lines.append('# TYPE {} {}'.format(metric.name, 'histogram' if isinstance(metric, Histogram)
+                                               else 'counter'))
+            for name, labels, value in metric.samples():
+                label_text = ','.join('{}="{}"'.format(key, _escape(value)) for key, value in labels.items())
+                lines.append('{}{} {}'.format(name, '{' + label_text + '}' if label_text else '',
+                                              _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port: int, address: str = '127.0.0.1') -> 'ThreadingHTTPServer':
+        """
+        Serve `to_prometheus()` over HTTP from a daemon thread, for Prometheus to scrape.
+        :return: the server. Call `shutdown()` on it to stop.
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.to_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((address, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def _label_values(labelnames: Tuple[str, ...], labels: Dict) -> Tuple[str, ...]:
+    return tuple(str(labels.get(name, '')) for name in labelnames)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value)
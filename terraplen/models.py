@@ -1,5 +1,6 @@
+from collections import namedtuple
 from enum import Enum
-from typing import List, Dict, Union, Tuple
+from typing import List, Dict, Optional, Sequence, Union, Tuple
 
 
 class UserAgents:
@@ -135,40 +136,59 @@ class Country(Enum):
     UnitedStates = "com"
 
     def lang_and_currency(self) -> Tuple[Language, Currency]:
-        return {
-            Country.Australia: (Language.EnglishAustralia, Currency.AustralianDollar),
-            Country.Brazil: (Language.Portuguese, Currency.BrazilianReal),
-            Country.Canada: (Language.EnglishCanada, Currency.CanadianDollar),
-            Country.ChinaMainland: (Language.SimplifiedChinese, Currency.ChineseYuanRenminbi),
-            Country.France: (Language.French, Currency.Euro),
-            Country.Germany: (Language.German, Currency.Euro),
-            Country.India: (Language.Hindi, Currency.IndianRupee),
-            Country.Italy: (Language.Italian, Currency.Euro),
-            Country.Japan: (Language.Japanese, Currency.JapaneseYen),
-            Country.Mexico: (Language.SpanishMexico, Currency.MexicoPeso),
-            Country.Netherlands: (Language.Dutch, Currency.Euro),
-            Country.Poland: (Language.Polish, Currency.PolishZloty),
-            Country.SaudiArabia: (Language.Arabic, Currency.SaudiArabianRiyal),
-            Country.Singapore: (Language.EnglishSingapore, Currency.SingaporeDollar),
-            Country.Spain: (Language.Spanish, Currency.Euro),
-            Country.Sweden: (Language.Swedish, Currency.SwedishKrona),
-            Country.Turkey: (Language.Turkish, Currency.TurkishLira),
-            Country.UnitedArabEmirates: (Language.EnglishUnitedArabEmirates, Currency.ArabEmiratesDirham),
-            Country.UnitedKingdom: (Language.EnglishUnitedKingdom, Currency.Pounds),
-            Country.UnitedStates: (Language.English, Currency.USDollar)
-        }[self]
-
-
-class Offer:
-    def __init__(self, price: Union[float, None], currency: str, rating: float, condition: str, ships_from: str,
-                 sold_by: str, sold_by_url: str):
-        self.price = price
-        self.currency = currency
-        self.approx_review = rating
-        self.condition = condition
-        self.ships_from = ships_from
-        self.sold_by = sold_by
-        self.sold_by_url = sold_by_url
+        return _lang_and_currency[self]
+
+
+_lang_and_currency = {
+    Country.Australia: (Language.EnglishAustralia, Currency.AustralianDollar),
+    Country.Brazil: (Language.Portuguese, Currency.BrazilianReal),
+    Country.Canada: (Language.EnglishCanada, Currency.CanadianDollar),
+    Country.ChinaMainland: (Language.SimplifiedChinese, Currency.ChineseYuanRenminbi),
+    Country.France: (Language.French, Currency.Euro),
+    Country.Germany: (Language.German, Currency.Euro),
+    Country.India: (Language.Hindi, Currency.IndianRupee),
+    Country.Italy: (Language.Italian, Currency.Euro),
+    Country.Japan: (Language.Japanese, Currency.JapaneseYen),
+    Country.Mexico: (Language.SpanishMexico, Currency.MexicoPeso),
+    Country.Netherlands: (Language.Dutch, Currency.Euro),
+    Country.Poland: (Language.Polish, Currency.PolishZloty),
+    Country.SaudiArabia: (Language.Arabic, Currency.SaudiArabianRiyal),
+    Country.Singapore: (Language.EnglishSingapore, Currency.SingaporeDollar),
+    Country.Spain: (Language.Spanish, Currency.Euro),
+    Country.Sweden: (Language.Swedish, Currency.SwedishKrona),
+    Country.Turkey: (Language.Turkish, Currency.TurkishLira),
+    Country.UnitedArabEmirates: (Language.EnglishUnitedArabEmirates, Currency.ArabEmiratesDirham),
+    Country.UnitedKingdom: (Language.EnglishUnitedKingdom, Currency.Pounds),
+    Country.UnitedStates: (Language.English, Currency.USDollar)
+}
+
+
+class _Frozen:
+    """
+    Base of slotted classes whose attributes are set once, in `__init__`.
+    """
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError('`{}` is immutable'.format(type(self).__name__))
+
+    def __delattr__(self, name):
+        raise AttributeError('`{}` is immutable'.format(type(self).__name__))
+
+
+class Offer(namedtuple('Offer', ['price', 'currency', 'approx_review', 'condition', 'ships_from', 'sold_by',
+                                 'sold_by_url'])):
+    """
+    One offer of a product. Immutable and without per-instance `__dict__`.
+    """
+    __slots__ = ()
+
+    def __new__(cls, price: Union[float, None], currency: str, rating: float, condition: str, ships_from: str,
+                sold_by: str, sold_by_url: str):
+        return tuple.__new__(cls, (price, currency, rating, condition, ships_from, sold_by, sold_by_url))
+
+    def to_dict(self) -> Dict:
+        return dict(zip(self._fields, self))
 
     def __repr__(self):
         return ('Offer(price={}, currency={}, approx_review={}, condition={}, '
@@ -178,13 +198,20 @@ class Offer:
                                                                      repr(self.sold_by_url))
 
 
-class OfferList:
-    def __init__(self, product_name: str, offer_count: int, offers: List[Offer], settings: Dict[str, bool]):
-        self.product_name = product_name
-        self.offer_count = offer_count
-        self.offers = offers
-        self.page = settings['page']
-        self.settings = settings
+class OfferList(_Frozen):
+    __slots__ = ('product_name', 'offer_count', 'offers', 'page', 'settings')
+
+    def __init__(self, product_name: Optional[str], offer_count: Optional[int], offers: Sequence[Offer],
+                 settings: Dict[str, bool]):
+        _set = object.__setattr__
+        _set(self, 'product_name', product_name)
+        _set(self, 'offer_count', offer_count)
+        _set(self, 'offers', tuple(offers))
+        _set(self, 'page', settings['page'])
+        _set(self, 'settings', settings)
+
+    def __reduce__(self):
+        return OfferList, (self.product_name, self.offer_count, self.offers, self.settings)
 
     def __repr__(self):
         offers_repr_length = 100
@@ -197,16 +224,14 @@ class OfferList:
                                                          print_offers, self.page, repr(self.settings)[:30] + '...')
 
 
-class Review:
-    def __init__(self, reviewer: str, reviewer_url: str, review_url: str, title: str, rating: int, helpful: int,
-                 body: str):
-        self.reviewer = reviewer
-        self.reviewer_url = reviewer_url
-        self.review_url = review_url
-        self.title = title
-        self.rating = rating
-        self.helpful = helpful
-        self.body = body
+class Review(namedtuple('Review', ['reviewer', 'reviewer_url', 'review_url', 'title', 'rating', 'helpful', 'body'])):
+    """
+    One customer review. Immutable and without per-instance `__dict__`.
+    """
+    __slots__ = ()
+
+    def to_dict(self) -> Dict:
+        return dict(zip(self._fields, self))
 
     def __repr__(self):
         body_repr_length = 100
@@ -219,14 +244,20 @@ class Review:
             repr(self.title), self.rating, self.helpful, print_body)
 
 
-class ReviewList:
-    def __init__(self, reviews: List[Review], asin: str, country: Country, settings: Dict, last_page=False):
-        self.reviews = reviews
-        self.asin = asin
-        self.country = country
-        self.settings = settings
-        self.page = settings['pageNumber']
-        self.last_page = last_page
+class ReviewList(_Frozen):
+    __slots__ = ('reviews', 'asin', 'country', 'settings', 'page', 'last_page')
+
+    def __init__(self, reviews: Sequence[Review], asin: str, country: Country, settings: Dict, last_page=False):
+        _set = object.__setattr__
+        _set(self, 'reviews', tuple(reviews))
+        _set(self, 'asin', asin)
+        _set(self, 'country', country)
+        _set(self, 'settings', settings)
+        _set(self, 'page', settings['pageNumber'])
+        _set(self, 'last_page', last_page)
+
+    def __reduce__(self):
+        return ReviewList, (self.reviews, self.asin, self.country, self.settings, self.last_page)
 
     def __repr__(self):
         reviews_repr_length = 100
@@ -298,9 +329,59 @@ class ReviewParameter:
 class ReviewSettings:
     def __init__(self,
                  sort_by: ReviewParameter.SortBy = ReviewParameter.SortBy.Helpful,
-                 reviewer_type: ReviewParameter.SortBy = ReviewParameter.ReviewerType.AllReviews,
+                 reviewer_type: ReviewParameter.ReviewerType = ReviewParameter.ReviewerType.AllReviews,
                  format_type: ReviewParameter.FormatType = ReviewParameter.FormatType.AllFormats,
                  media_type: ReviewParameter.MediaType = ReviewParameter.MediaType.AllContents,
                  filter_by_star: ReviewParameter.FilterByStar = ReviewParameter.FilterByStar.AllStars,
-                 page_number: int = 1, filter_by_language: str = ''):
-        pass
+                 filter_by_language: Union[Language, str] = '', filter_by_keyword: str = '', page_size: int = 20):
+        """
+        Filters and ordering of reviews. Filtering is done by Amazon, so dropped reviews are never downloaded.
+        :param sort_by: Instance of `ReviewParameter.SortBy` or `str`
+        :param reviewer_type: Instance of `ReviewParameter.ReviewerType` or `str`. `AVPOnlyReviews` keeps verified purchases only.
+        :param format_type: Instance of `ReviewParameter.FormatType` or `str`
+        :param media_type: Instance of `ReviewParameter.MediaType` or `str`
+        :param filter_by_star: Instance of `ReviewParameter.FilterByStar` or `str`
+        :param filter_by_language: Instance of `terraplen.Language` or `str` such as `'en_US'`. Empty means all languages.
+        :param filter_by_keyword: Show only reviews containing this keyword. Empty means no keyword.
+        :param page_size: Number of reviews per page. 1 to 20.
+        """
+        # These will raise `ValueError` if a value is invalid.
+        self.sort_by = ReviewParameter.SortBy(sort_by)
+        self.reviewer_type = ReviewParameter.ReviewerType(reviewer_type)
+        self.format_type = ReviewParameter.FormatType(format_type)
+        self.media_type = ReviewParameter.MediaType(media_type)
+        self.filter_by_star = ReviewParameter.FilterByStar(filter_by_star)
+        self.filter_by_language = Language(filter_by_language) if filter_by_language else None
+        self.filter_by_keyword = filter_by_keyword
+
+        if not 1 <= page_size <= 20:
+            raise ValueError('page_size must be between 1 and 20, not `{}`'.format(page_size))
+        self.page_size = page_size
+
+    def to_dict(self, asin: str, page=1) -> Dict:
+        """
+        Build the form data of the reviews request.
+        :param asin: ASIN of the product
+        :param page: page number
+        """
+        return {'sortBy': self.sort_by.value,
+                'reviewerType': self.reviewer_type.value,
+                'formatType': self.format_type.value,
+                'mediaType': self.media_type.value,
+                'filterByStar': self.filter_by_star.value,
+                'pageNumber': page,
+                'filterByLanguage': self.filter_by_language.value if self.filter_by_language else '',
+                'filterByKeyword': self.filter_by_keyword,
+                'shouldAppend': 'undefined',
+                'deviceType': 'desktop',
+                'canShowIntHeader': 'undefined',
+                'reftag': 'cm_cr_getr_d_paging_btm_next_{}'.format(page),
+                'pageSize': self.page_size,
+                'asin': asin,
+                'scope': 'reviewsAjax1'}
+
+    def __repr__(self):
+        return ('ReviewSettings(sort_by={}, reviewer_type={}, format_type={}, media_type={}, filter_by_star={}, '
+                'filter_by_language={}, filter_by_keyword={}, page_size={})').format(
+            self.sort_by, self.reviewer_type, self.format_type, self.media_type, self.filter_by_star,
+            self.filter_by_language, repr(self.filter_by_keyword), self.page_size)
@@ -0,0 +1,122 @@
+import threading
+from collections import namedtuple
+from typing import Any, Callable, Dict, Iterable, Optional, Union
+
+from terraplen.models import Country, Currency, OfferList
+from terraplen.terraplen import Scraper
+from terraplen.utils import map_unordered
+
+MarketResult = namedtuple('MarketResult', ['country', 'currency', 'result', 'error'])
+MarketResult.__doc__ = """
+Outcome of one marketplace. `result` is None and `error` holds the exception if the request failed.
+`currency` is the currency prices of `result` are shown in.
+"""
+
+
+class MultiMarketScraper:
+    def __init__(self, countries: Optional[Iterable[Union[Country, str]]] = None, currency: Optional[Currency] = None,
+                 max_workers: Optional[int] = None, factory: Optional[Callable[..., Scraper]] = None, **kwargs):
+        """
+        One warm `Scraper` per marketplace, with requests for an ASIN fanned out to every marketplace at once.
+        A marketplace is bootstrapped on its first request, concurrently with the others, and reused after.
+        Use as `with MultiMarketScraper() as scraper:` or call `close()` yourself.
+        :param countries: marketplaces requested by default. Defaults to every `terraplen.Country`.
+        :param currency: Instance of `terraplen.Currency` to show every price in. Defaults to the currency of each marketplace. A marketplace may refuse it, so check `currency` of each `MarketResult`.
+        :param max_workers: number of marketplaces requested at once. Defaults to all of them.
+        :param factory: callable creating the Scraper of a marketplace, called as `factory(country, currency=..., **kwargs)`. Defaults to `Scraper`.
+        :param kwargs: passed to every Scraper, such as `session_pool`, `cache` or `metrics`
+        """
+        self.countries = [Country(country) for country in (countries or Country)]
+        self.currency = Currency(currency) if currency else None
+        self.max_workers = max_workers
+        self.factory = factory or Scraper
+        self.kwargs = kwargs
+
+        self._scrapers: Dict[Country, Scraper] = {}
+        self._locks = {country: threading.Lock() for country in Country}
+
+    def __enter__(self) -> 'MultiMarketScraper':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def scraper(self, country: Country) -> Scraper:
+        """
+        Scraper of `country`, created and bootstrapped on first use.
+        """
+        with self._locks[country]:  # per marketplace, so bootstraps of different marketplaces run at once
+            if country not in self._scrapers:
+                self._scrapers[country] = self.factory(country, currency=self.currency, **self.kwargs)
+            return self._scrapers[country]
+
+    def warm(self, countries: Optional[Iterable[Union[Country, str]]] = None) -> Dict[Country, Optional[Exception]]:
+        """
+        Bootstrap the Scrapers of `countries` concurrently, ahead of the first request.
+        :return: the exception of every marketplace that failed, None for the others
+        """
+        return {country: result.error for country, result in self._fan_out(self.scraper, countries).items()}
+
+    def get_rating(self, asin: str,
+                   countries: Optional[Iterable[Union[Country, str]]] = None) -> Dict[Country, MarketResult]:
+        """
+        Run `Scraper.get_rating` on every marketplace concurrently.
+        :param asin: ASIN of the product
+        :param countries: marketplaces to request. Defaults to `self.countries`.
+        :return: result of every marketplace, in the order of `countries`
+        """
+        return self._fan_out(lambda country: self.scraper(country).get_rating(asin), countries)
+
+    def get_offers(self, asin: str, countries: Optional[Iterable[Union[Country, str]]] = None,
+                   **kwargs) -> Dict[Country, MarketResult]:
+        """
+        Run `Scraper.get_offers` on every marketplace concurrently.
+        :param asin: ASIN of the product
+        :param countries: marketplaces to request. Defaults to `self.countries`.
+        :param kwargs: filters passed to `get_offers`
+        :return: result of every marketplace, in the order of `countries`
+        """
+        return self._fan_out(lambda country: self.scraper(country).get_offers(asin, **kwargs), countries)
+
+    @staticmethod
+    def lowest_prices(results: Dict[Country, MarketResult]) -> Dict[Country, MarketResult]:
+        """
+        Lowest offer price of every marketplace in the results of `get_offers`, cheapest first.
+        Marketplaces that failed or have no priced offer are left out. Prices are only comparable if they
+        share a currency, see `currency` of `MultiMarketScraper`.
+        :return: `MarketResult` whose `result` is the lowest price
+        """
+        lowest = {}
+        for country, market in results.items():
+            if not isinstance(market.result, OfferList):
+                continue
+            prices = [offer.price for offer in market.result.offers if offer.price is not None]
+            if prices:
+                lowest[country] = market._replace(result=min(prices))
+        return dict(sorted(lowest.items(), key=lambda item: item[1].result))
+
+    def close(self):
+        """
+        Close the session of every Scraper.
+        """
+        for scraper in self._scrapers.values():
+            scraper.session.close()
+        self._scrapers.clear()
+
+    def _fan_out(self, func: Callable[[Country], Any],
+                 countries: Optional[Iterable[Union[Country, str]]]) -> Dict[Country, MarketResult]:
+        countries = [Country(country) for country in countries] if countries is not None else self.countries
+
+        def call(country: Country):
+            result = func(country)
+            return self.scraper(country).currency, result  # read after the call, the server may have overridden it
+
+        results = {}
+        for country, outcome in map_unordered(call, countries, self.max_workers or max(len(countries), 1)):
+            if isinstance(outcome, Exception):
+                scraper = self._scrapers.get(country)
+                currency = scraper.currency if scraper else self.currency or country.lang_and_currency()[1]
+                results[country] = MarketResult(country, currency, None, outcome)
+            else:
+                results[country] = MarketResult(country, outcome[0], outcome[1], None)
+        return {country: results[country] for country in countries}
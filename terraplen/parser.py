@@ -0,0 +1,370 @@
+import ast
+import importlib.util
+import json
+import re
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Union
+from urllib.parse import urljoin
+
+from terraplen import selector
+from terraplen.models import Offer, OfferList, Review, ReviewList, Country, ReviewParameter, ReviewSettings
+from terraplen.utils import find_number, lazy_import, remove_whitespace
+
+# every CSS selector the scraper evaluates. The lxml backend compiles them into XPath once, when first created.
+SELECTORS = (selector.Rating.Value,
+
+             selector.Offer.ProductName, selector.Offer.Pinned, selector.Offer.Count, selector.Offer.Price,
+             selector.Offer.PriceFraction, selector.Offer.PriceSymbol, selector.Offer.SellerRating,
+             selector.Offer.Heading, selector.Offer.PinnedOffer, selector.Offer.Offers, selector.Offer.ShipsFrom,
+             selector.Offer.SoldBy,
+
+             selector.Review.Reviews, selector.Review.RatingIcon, selector.Review.ReviewURL, selector.Review.Title,
+             selector.Review.Helpful, selector.Review.Body, selector.Review.Reviewer, selector.Review.ReviewerURL)
+
+
+class ParserBackend:
+    """
+    Minimal DOM interface the parsing code is written against.
+    """
+    name = ''
+
+    def parse(self, text: str, only: Optional[Dict[str, Union[str, List[str]]]] = None):
+        """
+        :param text: document to parse
+        :param only: attributes of the elements the caller reads, such as `{'id': ['aod-offer']}`. A backend may leave everything outside them out of the tree.
+        """
+        raise NotImplementedError
+
+    def select(self, node, css: str) -> List:
+        raise NotImplementedError
+
+    def select_one(self, node, css: str):
+        raise NotImplementedError
+
+    def text(self, node) -> str:
+        raise NotImplementedError
+
+    def attr(self, node, name: str, default: Optional[str] = None) -> Optional[str]:
+        raise NotImplementedError
+
+    def classes(self, node) -> List[str]:
+        raise NotImplementedError
+
+    def tag(self, node) -> str:
+        raise NotImplementedError
+
+
+class SoupBackend(ParserBackend):
+    """
+    BeautifulSoup (with lxml tree builder) and soupsieve. Slower, kept as a fallback.
+    """
+    name = 'soup'
+
+    def __init__(self):
+        from bs4 import BeautifulSoup, SoupStrainer
+        self._beautiful_soup = BeautifulSoup
+        self._soup_strainer = SoupStrainer
+
+    def parse(self, text: str, only: Optional[Dict[str, Union[str, List[str]]]] = None):
+        if only is None:
+            return self._beautiful_soup(text, 'lxml')
+        # elements outside `only` never become Tag objects, which is most of the cost of this backend
+        return self._beautiful_soup(text, 'lxml', parse_only=self._soup_strainer(attrs=only))
+
+    def select(self, node, css: str) -> List:
+        return node.select(css)
+
+    def select_one(self, node, css: str):
+        return node.select_one(css)
+
+    def text(self, node) -> str:
+        return node.text
+
+    def attr(self, node, name: str, default: Optional[str] = None) -> Optional[str]:
+        value = node.get(name, default)
+        if isinstance(value, list):  # multi-valued attribute such as `class`
+            return ' '.join(value)
+        return value
+
+    def classes(self, node) -> List[str]:
+        return node.get('class', [])
+
+    def tag(self, node) -> str:
+        return node.name
+
+
+class LxmlBackend(ParserBackend):
+    """
+    Raw `lxml.html` tree with every selector in `SELECTORS` precompiled into XPath.
+    """
+    name = 'lxml'
+
+    _translator = None
+    _compiled = {}  # css -> (XPath selecting all matches, XPath selecting the first match)
+
+    def __init__(self):
+        # lxml and cssselect are imported, and `SELECTORS` compiled, by the first instance only
+        self._etree = lazy_import('lxml.etree', 'LxmlBackend', 'lxml')
+        self._html = lazy_import('lxml.html', 'LxmlBackend', 'lxml')
+        if LxmlBackend._translator is None:
+            LxmlBackend._translator = lazy_import('cssselect', 'LxmlBackend').HTMLTranslator()
+            for css in SELECTORS:
+                self.compile(css)
+
+    def compile(self, css: str):
+        compiled = self._compiled.get(css)
+        if compiled is None:
+            expression = self._translator.css_to_xpath(css, prefix='descendant::')
+            compiled = self._compiled[css] = (self._etree.XPath(expression),
+                                              self._etree.XPath('({})[1]'.format(expression)))
+        return compiled
+
+    def parse(self, text: str, only: Optional[Dict[str, Union[str, List[str]]]] = None):
+        # `only` is ignored. libxml2 builds the whole tree in C faster than a parser target or iterparse
+        # can hand the events to Python, even with no work done on them.
+        if not text.strip():
+            return self._html.document_fromstring('<html></html>')
+        try:
+            return self._html.document_fromstring(text)
+        except ValueError:  # str with an XML encoding declaration
+            return self._html.document_fromstring(text.encode('utf-8'),
+                                                  parser=self._html.HTMLParser(encoding='utf-8'))
+
+    def select(self, node, css: str) -> List:
+        return self.compile(css)[0](node)
+
+    def select_one(self, node, css: str):
+        found = self.compile(css)[1](node)
+        return found[0] if found else None
+
+    def text(self, node) -> str:
+        return node.text_content()
+
+    def attr(self, node, name: str, default: Optional[str] = None) -> Optional[str]:
+        return node.get(name, default)
+
+    def classes(self, node) -> List[str]:
+        return node.get('class', '').split()
+
+    def tag(self, node) -> str:
+        return node.tag
+
+
+_backends = {SoupBackend.name: SoupBackend, LxmlBackend.name: LxmlBackend}
+_instances: Dict[str, ParserBackend] = {}
+
+
+@lru_cache(maxsize=None)
+def _default_backend() -> str:
+    # looks for cssselect without importing it
+    return LxmlBackend.name if importlib.util.find_spec('cssselect') is not None else SoupBackend.name
+
+
+def get_backend(backend: Union[str, ParserBackend, None] = None) -> ParserBackend:
+    """
+    Get parser backend.
+    :param backend: `'lxml'`, `'soup'` or instance of `ParserBackend`. Defaults to `'lxml'` if `cssselect` is installed, otherwise `'soup'`.
+    """
+    if isinstance(backend, ParserBackend):
+        return backend
+    if backend is None:
+        backend = _default_backend()
+    if backend not in _backends:
+        raise ValueError('unknown parser backend `{}`. Choose from {}'.format(backend, list(_backends)))
+    if backend not in _instances:
+        _instances[backend] = _backends[backend]()
+    return _instances[backend]
+
+
+def decode_review_stream(text: str) -> Iterator[str]:
+    """
+    Decode the reviews AJAX stream and yield the HTML fragment of every non-empty `append` chunk.
+    Chunks are JSON arrays such as `["append", "#cm_cr-review_list", "<div ...>"]` separated by `selector.Review.StreamStrip`.
+    Other chunks are skipped without being decoded.
+    :param text: body of the reviews response
+    """
+    for chunk in text.split(selector.Review.StreamStrip):
+        chunk = chunk.strip()
+        if selector.Review.StreamIndex0 not in chunk[:16]:  # cheap check on `["append",` before decoding
+            continue
+        try:
+            data = json.loads(chunk)
+        except ValueError:  # not strict JSON, e.g. single quoted. still never evaluated as code
+            data = ast.literal_eval(chunk)
+        if data[0] == selector.Review.StreamIndex0 and data[2]:
+            yield data[2]
+
+
+_review_hook = re.compile(r'{}\s*=\s*["\']?{}["\'\s>]'.format(selector.Review.Hook, selector.Review.HookReview))
+
+# `scan_rating` looks for the attribute name, which is rare, then checks the tag around it
+_rating_value = r'aria-valuenow\s*=\s*(["\']?)\s*(\d+)\s*%?\s*\1(?=[\s/>])'
+_rating_class = r'\bclass\s*=\s*["\']([^"\']*)["\']'
+_rating_div = r'<div\s'
+_rating_patterns = {kind: (re.compile(convert(_rating_value)), re.compile(convert(_rating_class)),
+                           re.compile(convert(_rating_div)), convert('<'), convert('>'), convert('a-meter'))
+                    for kind, convert in ((str, str), (bytes, str.encode))}
+
+
+def scan_rating(html: Union[str, bytes]) -> Optional[Dict[int, int]]:
+    """
+    Read the rating popover with regular expressions over the raw text, without building a DOM.
+    Finds the same `div.a-meter` elements as `parse_rating`, from their opening tags only.
+    :param html: body of the rating popover response, decoded or not
+    :return: percentage of reviews per star, or None unless exactly five values between 0 and 100 were found
+    """
+    value, class_attribute, div, tag_start, tag_end, meter = _rating_patterns[type(html)]
+    values = []
+    for match in value.finditer(html):
+        tag = html[html.rfind(tag_start, 0, match.start()):html.find(tag_end, match.end())]
+        if not div.match(tag):
+            continue
+        classes = class_attribute.search(tag)
+        if classes is not None and meter in classes.group(1).split():
+            values.append(int(match.group(2)))
+    if len(values) != 5 or not all(0 <= value <= 100 for value in values):
+        return None
+    return dict(zip(range(5, 0, -1), values))
+
+
+def parse_rating(html: Union[str, bytes], backend: Union[str, ParserBackend, None] = None,
+                 fast: bool = True) -> Dict[int, int]:
+    """
+    Parse the rating popover.
+    :param html: body of the rating popover response
+    :param backend: parser backend. See `get_backend`.
+    :param fast: Whether try `scan_rating` first. The DOM is parsed only if it finds no valid rating.
+    :return: percentage of reviews per star, as `star -> percentage`
+    """
+    if fast:
+        rating = scan_rating(html)
+        if rating is not None:
+            return rating
+    parser = get_backend(backend)
+    root = parser.parse(html)
+    return {i: int(parser.attr(elem, selector.Rating.DataName).rstrip('%')) for elem, i in
+            zip(parser.select(root, selector.Rating.Value), range(5, 0, -1))}
+
+
+def parse_offers(html: str, domain: str, settings: Dict, backend: Union[str, ParserBackend, None] = None) -> OfferList:
+    """
+    Parse one page of the offer listing.
+    :param html: body of the offers response
+    :param domain: domain the response came from, such as `'www.amazon.com'`. Used to make seller URLs absolute.
+    :param settings: filters and page the offers were requested with. See `BaseScraper._offer_settings`.
+    :param backend: parser backend. See `get_backend`.
+    :raise ValueError: if the first page has no product name or offer count. On later pages they are None instead.
+    """
+    parser = get_backend(backend)
+    root = parser.parse(html, only={'id': list(selector.Offer.Containers)})
+    title, count = parser.select_one(root, selector.Offer.ProductName), parser.select_one(root, selector.Offer.Count)
+    if (title is None or count is None) and settings.get('page', 1) <= 1:
+        raise ValueError('the offers response has no product name or offer count')
+    # later pages may come without the header. What they lack is None
+    product_name = parser.text(title).strip() if title is not None else None
+    offer_count = None
+    if count is not None:
+        offer_count = (bool(parser.select_one(root, selector.Offer.Pinned) is not None) +
+                       int(find_number(parser.text(count) + '0')))
+    offers = []
+    for offer in parser.select(root, selector.Offer.PinnedOffer) + parser.select(root, selector.Offer.Offers):
+        (price, price_fraction, currency,
+         rating, heading, ships_from, sold_by) = (parser.select_one(offer, selector.Offer.Price),
+                                                  parser.select_one(offer, selector.Offer.PriceFraction),
+                                                  parser.select_one(offer, selector.Offer.PriceSymbol),
+                                                  parser.select_one(offer, selector.Offer.SellerRating),
+                                                  parser.select_one(offer, selector.Offer.Heading),
+                                                  parser.select_one(offer, selector.Offer.ShipsFrom),
+                                                  parser.select_one(offer, selector.Offer.SoldBy))
+        if price is None:
+            continue
+        if price_fraction is not None:
+            price = float(parser.text(price).replace(',', '') + parser.text(price_fraction))
+        else:
+            price = int(parser.text(price).replace(',', ''))
+
+        currency = parser.text(currency)
+        heading = remove_whitespace(parser.text(heading))
+        ships_from = parser.text(ships_from).strip()
+        if parser.tag(sold_by) == 'a':
+            sold_by_url = _abs_path(domain, parser.attr(sold_by, 'href'))
+        else:
+            sold_by_url = None
+        sold_by = parser.text(sold_by).strip()
+
+        if rating is not None:
+            for cls in parser.classes(rating):
+                if cls.startswith(selector.Offer.StarClassPrefix):
+                    cls = cls.lstrip(selector.Offer.StarClassPrefix)
+                    rating = float(cls.replace('-', '.'))
+                    break
+
+        offers.append(Offer(price=price, currency=currency, rating=rating,
+                            condition=heading, ships_from=ships_from, sold_by=sold_by, sold_by_url=sold_by_url))
+    return OfferList(product_name, offer_count, offers, settings=settings)
+
+
+def parse_review_stream(text: str, asin: str, country: Country, settings: Optional[Dict] = None,
+                        backend: Union[str, ParserBackend, None] = None) -> ReviewList:
+    """
+    Parse one page of the reviews AJAX stream.
+    :param text: body of the reviews response
+    :param asin: ASIN of the product
+    :param country: marketplace the response came from. Used to make URLs absolute.
+    :param settings: form data the page was requested with. See `ReviewSettings.to_dict`. Defaults to the most recent reviews, 20 per page.
+    :param backend: parser backend. See `get_backend`.
+    """
+    if settings is None:
+        settings = ReviewSettings(sort_by=ReviewParameter.SortBy.Recent).to_dict(asin)
+    parser = get_backend(backend)
+    domain = 'www.amazon.{}'.format(country.value)
+    review = []
+
+    # every review fragment goes into one document, parsed once. Fragments without a review are left out.
+    fragments = (fragment for fragment in decode_review_stream(text) if _review_hook.search(fragment))
+    root = parser.parse('<html><body>{}</body></html>'.format(''.join(fragments)),
+                        only={selector.Review.Hook: selector.Review.HookReview})
+    for top in parser.select(root, selector.Review.Reviews):
+        rating = parser.select_one(top, selector.Review.RatingIcon)
+
+        if rating is not None:
+            for cls in parser.classes(rating):
+                if cls.startswith(selector.Review.StarClassPrefix):
+                    cls = cls.lstrip(selector.Review.StarClassPrefix)
+                    rating = int(cls)
+                    break
+
+        title = parser.select_one(top, selector.Review.Title)
+        if title is not None:
+            title = parser.text(title).strip()
+
+        helpful = parser.select_one(top, selector.Review.Helpful)
+        if helpful is not None:
+            try:
+                helpful = int(find_number(parser.text(helpful).strip()))
+            except ValueError:  # 'One person found this helpful'
+                helpful = 1
+        else:
+            helpful = 0
+
+        body = parser.select_one(top, selector.Review.Body)
+        if body is not None:
+            body = parser.text(body).strip()
+
+        reviewer = parser.select_one(top, selector.Review.Reviewer)
+        reviewer_url = parser.select_one(top, selector.Review.ReviewerURL)
+        if reviewer is not None:
+            reviewer = parser.text(reviewer).strip()
+        if reviewer_url is not None:
+            reviewer_url = _abs_path(domain, parser.attr(reviewer_url, 'href'))
+
+        review_url = parser.select_one(top, selector.Review.ReviewURL)
+        if review_url is not None:
+            review_url = _abs_path(domain, parser.attr(review_url, 'href'))
+
+        review.append(Review(reviewer, reviewer_url, review_url, title, rating, helpful, body))
+    return ReviewList(review, asin, country, settings, len(review) != settings['pageSize'])
+
+
+def _abs_path(domain: str, endpoint: str) -> str:
+    return urljoin('https://{}'.format(domain), endpoint)
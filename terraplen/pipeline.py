@@ -0,0 +1,92 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+from terraplen.models import OfferList, ReviewList, ReviewSettings
+from terraplen.parser import ParserBackend, parse_rating, parse_offers, parse_review_stream
+from terraplen.terraplen import Scraper
+from terraplen.utils import map_unordered
+
+
+class ParsePipeline:
+    def __init__(self, scraper: Scraper, fetch_workers: int = 16, parse_workers: Optional[int] = None,
+                 max_in_flight: Optional[int] = None):
+        """
+        Fetch on a thread pool and parse on a process pool, so parsing uses every core instead of
+        competing with the fetch threads for the GIL.
+        Use as `with ParsePipeline(scraper) as pipeline:` or call `close()` yourself.
+        :param scraper: Instance of `terraplen.Scraper` that fetches. Its parser backend is used in the worker processes.
+        :param fetch_workers: number of fetch threads. Keep it at most `pool_maxsize` of `scraper`. Fetches are paced by the throttle of `scraper`, 2 requests per second by default.
+        :param parse_workers: number of parse processes. Defaults to `os.cpu_count()`.
+        :param max_in_flight: maximum number of ASINs being fetched or parsed at once. Defaults to `(fetch_workers + parse_workers) * 2`.
+        """
+        parse_workers = parse_workers or os.cpu_count() or 1
+        self.scraper = scraper
+        self.fetch_workers = fetch_workers
+        self.max_in_flight = max_in_flight or (fetch_workers + parse_workers) * 2
+        self._backend = scraper.parser.name if isinstance(scraper.parser, ParserBackend) else scraper.parser
+        self._executor = ProcessPoolExecutor(max_workers=parse_workers)
+
+    def __enter__(self) -> 'ParsePipeline':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(cancel_futures=True)
+
+    def ratings(self, asins: Iterable[str]) -> Iterator[Tuple[str, Union[Dict[int, int], Exception]]]:
+        """
+        Same as `Scraper.get_ratings_many`, with parsing on the process pool.
+        """
+        return self._run(asins, lambda asin: self.scraper._fetch_rating(asin).text,
+                         lambda asin, text: (parse_rating, text, self._backend))
+
+    def offers(self, asins: Iterable[str], **filters) -> Iterator[Tuple[str, Union[OfferList, Exception]]]:
+        """
+        Same as `Scraper.get_offers_many`, with parsing on the process pool.
+        :param filters: filters passed to `get_offers`
+        """
+        settings = self.scraper._offer_settings(**filters)
+        return self._run(asins, lambda asin: self.scraper._fetch_offers(asin, settings).text,
+                         lambda asin, text: (parse_offers, text, self.scraper.domain, settings, self._backend))
+
+    def reviews(self, asins: Iterable[str], page=1, settings: Optional[ReviewSettings] = None
+                ) -> Iterator[Tuple[str, Union[ReviewList, Exception]]]:
+        """
+        Same as `Scraper.get_reviews_many`, with parsing on the process pool.
+        """
+
+        def fetch(asin):
+            data, resp = self.scraper._fetch_review(asin, page, settings)
+            return data, resp.text
+
+        return self._run(asins, fetch, lambda asin, fetched: (parse_review_stream, fetched[1], asin,
+                                                              self.scraper.country, fetched[0], self._backend))
+
+    def _run(self, asins: Iterable[str], fetch: Callable, parse_call: Callable) -> Iterator[Tuple[str, object]]:
+        pending = {}
+
+        def completed(block: bool):
+            done, _ = wait(pending, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+            for future in done:
+                asin = pending.pop(future)
+                exception = future.exception()
+                yield asin, exception if exception is not None else future.result()
+
+        fetched = map_unordered(fetch, asins, self.fetch_workers, self.max_in_flight)
+        try:
+            for asin, result in fetched:
+                if isinstance(result, Exception):
+                    yield asin, result
+                else:
+                    function, *args = parse_call(asin, result)
+                    pending[self._executor.submit(function, *args)] = asin
+                yield from completed(block=len(pending) >= self.max_in_flight)
+            while pending:
+                yield from completed(block=True)
+        finally:
+            fetched.close()
+            for future in pending:
+                future.cancel()
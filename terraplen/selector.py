@@ -16,6 +16,8 @@ class Offer:
 
     PinnedOffer = '#aod-pinned-offer'
     Offers = '#aod-offer'
+    # ids of every element the selectors above are evaluated in. The rest of the page is never read.
+    Containers = ('aod-asin-title-text', 'aod-filter-offer-count-string', 'aod-pinned-offer', 'aod-offer')
     StarClassPrefix = 'a-star-mini-'
 
     ShipsFrom = '#aod-offer-shipsFrom >* span.a-color-base'
@@ -25,9 +27,9 @@ class Offer:
 class Review:
     StreamStrip = '\n&&&\n'
     StreamIndex0 = 'append'
-    StreamTop = 'div'
-    DataAttr = 'data-hook'
-    ReviewDataAttr = 'review'
+    Reviews = 'div[data-hook="review"]'
+    Hook = 'data-hook'
+    HookReview = 'review'
     RatingIcon = 'i.review-rating'
     StarClassPrefix = 'a-star-'
 
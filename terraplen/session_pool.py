@@ -0,0 +1,219 @@
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Set
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+    import msvcrt
+
+from terraplen.models import Country
+
+if TYPE_CHECKING:  # pragma: no cover
+    from terraplen.terraplen import Scraper
+
+
+@contextmanager
+def _locked(path: str):
+    """
+    Hold an exclusive lock on `path`, created if missing, across processes.
+    """
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:  # pragma: no cover
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:  # pragma: no cover
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class Identity:
+    def __init__(self, country: Country, user_agent: str, cookies: List[Dict], created_at: float, expires_at: float,
+                 identity_id: Optional[str] = None):
+        """
+        Cookies and User-Agent of a bootstrapped session.
+        :param country: marketplace the session was bootstrapped on
+        :param user_agent: `User-Agent` the session was bootstrapped with
+        :param cookies: cookies as dicts with `name`, `value`, `domain`, `path`, `expires` and `secure`
+        :param created_at: unix time of the bootstrap
+        :param expires_at: unix time after which the identity is not handed out
+        :param identity_id: unique id. Generated if not provided.
+        """
+        self.country = country
+        self.user_agent = user_agent
+        self.cookies = cookies
+        self.created_at = created_at
+        self.expires_at = expires_at
+        self.identity_id = identity_id or uuid.uuid4().hex
+
+    @classmethod
+    def from_scraper(cls, scraper: 'Scraper', ttl: float) -> 'Identity':
+        now = time.time()
+        cookies = [{'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain, 'path': cookie.path,
+                    'expires': cookie.expires, 'secure': cookie.secure} for cookie in scraper.session.cookies]
+        return cls(scraper.country, scraper.headers['User-Agent'], cookies, now, now + ttl)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Identity':
+        return cls(Country(data['country']), data['user_agent'], data['cookies'], data['created_at'],
+                   data['expires_at'], data['identity_id'])
+
+    def to_dict(self) -> Dict:
+        return {'identity_id': self.identity_id, 'country': self.country.value, 'user_agent': self.user_agent,
+                'cookies': self.cookies, 'created_at': self.created_at, 'expires_at': self.expires_at}
+
+    @property
+    def expired(self) -> bool:
+        return time.time() >= self.expires_at
+
+    def apply(self, scraper: 'Scraper'):
+        """
+        Load the cookies and User-Agent into `scraper`. Its own language and currency are kept.
+        """
+        now = time.time()
+        for cookie in self.cookies:
+            if cookie['expires'] is not None and cookie['expires'] <= now:
+                continue
+            scraper.session.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'],
+                                        path=cookie['path'], expires=cookie['expires'], secure=cookie['secure'])
+        scraper.headers['User-Agent'] = self.user_agent
+        scraper.set_language(scraper.language)
+        scraper.set_currency(scraper.currency)
+        scraper.init_have_run = True
+
+    def __repr__(self):
+        return 'Identity(identity_id={}, country={}, user_agent={}, cookies={}, expires_at={})'.format(
+            repr(self.identity_id), self.country, repr(self.user_agent), len(self.cookies), self.expires_at)
+
+
+class SessionPool:
+    def __init__(self, path: str, size: int = 4, ttl: float = 6 * 60 * 60):
+        """
+        Bootstrapped sessions persisted to a JSON file, so new Scrapers start without downloading the homepage.
+        Pass it as `Scraper(session_pool=...)`. Identities are handed out in turn, spreading requests across them.
+        The file is replaced atomically on every change. Processes sharing it re-read it under a lock file next to it,
+        `path + '.lock'`, and merge before writing, so identities stored by the others are kept.
+        :param path: path of the JSON file. Created on first save.
+        :param size: number of identities `warm` keeps per marketplace
+        :param ttl: seconds an identity is handed out after its bootstrap
+        """
+        self.path = path
+        self.size = size
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._identities: Dict[str, Identity] = self._read()
+        self._added: Set[str] = set()  # changes since the file was last read, applied on top of it when saving
+        self._removed: Set[str] = set()
+        self._turn: Dict[Country, int] = {}
+
+    def identities(self, country: Country) -> List[Identity]:
+        """
+        Identities of `country` that have not expired.
+        """
+        with self._lock:
+            return self._valid(country)
+
+    def acquire(self, country: Country) -> Optional[Identity]:
+        """
+        Next identity of `country` in turn, or None if there is none left.
+        """
+        with self._lock:
+            identities = self._valid(country)
+            if not identities:
+                return None
+            turn = self._turn.get(country, random.randrange(len(identities)))  # processes start at different ones
+            self._turn[country] = turn + 1
+            return identities[turn % len(identities)]
+
+    def store(self, scraper: 'Scraper', replace: Optional[Identity] = None) -> Identity:
+        """
+        Save the cookies and User-Agent of `scraper` as an identity, and persist the pool.
+        :param replace: identity the new one supersedes, such as one detected as bot
+        """
+        identity = Identity.from_scraper(scraper, self.ttl)
+        with self._lock:
+            if replace is not None:
+                self._identities.pop(replace.identity_id, None)
+                self._removed.add(replace.identity_id)
+            self._identities[identity.identity_id] = identity
+            self._added.add(identity.identity_id)
+            self._save()
+        return identity
+
+    def discard(self, identity: Identity):
+        with self._lock:
+            self._identities.pop(identity.identity_id, None)
+            self._removed.add(identity.identity_id)  # another process may have stored it
+            self._save()
+
+    def warm(self, country: Country, count: Optional[int] = None,
+             factory: Optional[Callable[[Country], 'Scraper']] = None) -> int:
+        """
+        Bootstrap sessions until `country` has `count` identities that have not expired.
+        :param count: Defaults to `self.size`.
+        :param factory: callable returning a bootstrapped Scraper for a country. Defaults to `Scraper(country)`.
+        :return: number of sessions bootstrapped
+        """
+        if factory is None:
+            from terraplen.terraplen import Scraper
+            factory = Scraper
+        missing = (count or self.size) - len(self.identities(country))
+        for _ in range(missing):
+            self.store(factory(country))
+        return max(missing, 0)
+
+    def _valid(self, country: Country) -> List[Identity]:
+        return [identity for identity in self._identities.values()
+                if identity.country == country and not identity.expired]
+
+    def _read(self) -> Dict[str, Identity]:
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        identities = (Identity.from_dict(item) for item in data['identities'])
+        return {identity.identity_id: identity for identity in identities if not identity.expired}
+
+    def _save(self):
+        with _locked(self.path + '.lock'):
+            # other processes may have stored or discarded identities since the last read
+            identities = self._read()
+            for identity_id in self._removed:
+                identities.pop(identity_id, None)
+            for identity_id in self._added - self._removed:
+                identities[identity_id] = self._identities[identity_id]
+            self._identities = identities
+            self._added.clear()
+            self._removed.clear()
+            self._write()
+
+    def _write(self):
+        data = {'version': 1, 'identities': [identity.to_dict() for identity in self._identities.values()
+                                             if not identity.expired]}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp = tempfile.mkstemp(dir=directory, prefix='.terraplen-', suffix='.json')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp, self.path)
+        except BaseException:
+            os.unlink(temp)
+            raise
@@ -0,0 +1,89 @@
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        """
+        Coalescing of identical calls running at the same time: the first caller of a key runs the function,
+        and callers arriving while it runs wait for it and receive the same result or exception.
+        Nothing is kept once the call returns, see `ResultCache` for that. Thread safe.
+        """
+        self.coalesced = 0  # calls that waited instead of running the function
+
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run `func`, unless a call of `key` is in flight, and wait for it instead.
+        :return: `(result, shared)`. `shared` is True if the result came from the call of another caller.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+class AsyncSingleFlight:
+    def __init__(self):
+        """
+        Same as `SingleFlight`, for coroutines of one event loop.
+        The call runs as a task, so it goes on for the other callers if the first one is cancelled.
+        """
+        self.coalesced = 0
+
+        self._tasks: Dict[Hashable, Any] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable]) -> Tuple[Any, bool]:
+        """
+        Await `func()`, unless a call of `key` is in flight, and wait for it instead.
+        :return: `(result, shared)`. `shared` is True if the result came from the call of another caller.
+        """
+        import asyncio  # see `terraplen.wrappers._asyncio`
+
+        task = self._tasks.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            task = self._tasks[key] = asyncio.ensure_future(func())
+            task.add_done_callback(lambda done: self._tasks.pop(key) if self._tasks.get(key) is done else None)
+        return await asyncio.shield(task), shared
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
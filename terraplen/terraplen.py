@@ -1,37 +1,50 @@
-import requests
-
-from terraplen import selector
-from terraplen.wrappers import retry
-from terraplen.exception import (DetectedAsBotException, BotDetectedStatusCode,
+from terraplen.cache import CachedResponse, HTTPCache, ResultCache
+from terraplen.parser import (ParserBackend, get_backend, parse_rating, parse_offers, parse_review_stream,
+                              scan_rating)
+from terraplen.wrappers import retry, memoize
+from terraplen.exception import (DetectedAsBotException, BotDetectedStatusCode, BotDetectedPath,
                                  ProductNotFoundCode, ProductNotFoundException)
-from terraplen.utils import find_number, remove_whitespace
-from terraplen.models import (Offer, OfferList, Review, ReviewList, Country, UserAgents, Currency, Language)
-
-from bs4 import BeautifulSoup
+from terraplen.throttle import Throttle, backoff_delay, get_throttle
+from terraplen.session_pool import Identity, SessionPool
+from terraplen.metrics import Metrics
+from terraplen.checkpoint import CheckpointStore, review_id
+from terraplen.single_flight import SingleFlight
+from terraplen.proxy_pool import ProxyPool
+from terraplen.utils import map_unordered, iter_pages, take
+from terraplen.models import (Offer, OfferList, Review, ReviewList, Country, UserAgents, Currency, Language,
+                              ReviewParameter, ReviewSettings)
+
+import copy
 import json
+import time
 from urllib.parse import quote, urljoin
-from typing import Dict, Optional
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, Optional, Tuple, Union
 
 from warnings import warn
 
+if TYPE_CHECKING:  # pragma: no cover
+    import requests
 
-class Scraper:
+
+class BaseScraper:
+    """
+    Marketplace, cookie negotiation, URL building and parsing shared by `Scraper` and `AsyncScraper`.
+    Subclasses implement the transport and `_set_cookie`.
+    """
     user_agents = UserAgents('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko)',
                              ['Chrome/91.0.4472.106 Safari/537.36', 'Chrome/91.0.4472.77 Safari/537.36',
                               'Chrome/91.0.4472.114 Safari/537.36', 'Chrome/91.0.4472.101 Safari/537.36',
                               'Chrome/91.0.4472.124 Safari/537.36'])
 
     def __init__(self, country: Optional[Country] = Country.UnitedStates, language: Optional[Language] = None,
-                 currency: Optional[Currency] = None, run_init=True):
-        """
-        Create Scraper Instance
-        :param country: Instance of `terraplen.Country` or `str`. Language and currency will automatically be calculated if not provided. Defaults to `Country.UnitedStates.`
-        :param language: Instance of `terraplen.Language` or `str`
-        :param currency: Instance of `terraplen.Currency` or `str`
-        :param run_init: Whether run first setup. setup accesses to Amazon homepage.
-        """
+                 currency: Optional[Currency] = None, parser: Union[str, ParserBackend, None] = None,
+                 throttle: Union[Throttle, bool] = True, max_retries: int = 3, metrics: Optional[Metrics] = None):
+        self.parser = get_backend(parser)
+        self.max_retries = max_retries
+        self.metrics = metrics
+        self._shared_throttle = throttle is True
+        self.throttle = throttle if isinstance(throttle, Throttle) else None
         self.headers = {'User-Agent': self.user_agents.get_next_user_agent()}
-        self.cookie = {}
 
         if not country:
             country = Country.UnitedStates
@@ -51,51 +64,6 @@ class Scraper:
 
         self.init_have_run = False
 
-        if run_init:
-            self.init()
-
-    def init(self):
-        self.get_with_update_cookie(self._url_top_page())
-
-    def get_with_update_cookie(self, url: str) -> requests.Response:
-        resp = requests.get(url, headers=self._create_header())
-        if resp.status_code == DetectedAsBotException:
-            raise BotDetectedStatusCode
-        if resp.status_code == ProductNotFoundCode:
-            raise ProductNotFoundException
-        if self.language.value != resp.cookies.get(self._language_cookie_key, self.language.value):
-            warn('looks like language `{}` is not acceptable for `{}`. '
-                 'Server returned to set `{}`. Language updated'.format(self.language.value, self.domain,
-                                                                        resp.cookies[self._language_cookie_key]))
-            self.language = Language(resp.cookies[self._language_cookie_key])
-            self.set_language(resp.cookies[self._language_cookie_key])
-        if self.currency.value != resp.cookies.get('i18n-prefs', self.currency.value):
-            warn('looks like currency `{}` is not acceptable for `{}`. '
-                 'Server returned to set `{}`'.format(self.currency.value, self.domain,
-                                                      resp.cookies['i18n-prefs']))
-            self.set_currency(resp.cookies['i18n-prefs'])
-        self.cookie.update(resp.cookies)
-        return resp
-
-    def post_with_update_cookie(self, url: str, data: Dict) -> requests.Response:
-        resp = requests.post(url, data=data, headers=self._create_header())
-        if resp.status_code == DetectedAsBotException:
-            raise BotDetectedStatusCode
-        if resp.status_code == ProductNotFoundCode:
-            raise ProductNotFoundException
-        if self.language.value != resp.cookies.get(self._language_cookie_key, self.language.value):
-            warn('looks like language `{}` is not acceptable for `{}`. '
-                 'Server returned to set `{}`. Language updated'.format(self.language.value, self.domain,
-                                                                        resp.cookies[self._language_cookie_key]))
-            self.set_language(resp.cookies[self._language_cookie_key])
-        if self.currency.value != resp.cookies.get('i18n-prefs', self.currency.value):
-            warn('looks like currency `{}` is not acceptable for `{}`. '
-                 'Server returned to set `{}`'.format(self.currency.value, self.domain,
-                                                      resp.cookies['i18n-prefs']))
-            self.set_currency(resp.cookies['i18n-prefs'])
-        self.cookie.update(resp.cookies)
-        return resp
-
     def set_country(self, country: Country):
         if isinstance(country, Country):
             self.country = country
@@ -103,18 +71,27 @@ class Scraper:
             self.country = Country(country)  # This will raise `ValueError` if `country` is invalid.
 
         self.domain = 'www.amazon.{}'.format(self.country.value)
+        if self._shared_throttle:
+            self.throttle = get_throttle(self.country)
 
     def set_currency(self, currency: Currency):
         if isinstance(currency, str):
             currency = Currency(currency)  # This will raise `ValueError` if `currency` is invalid.
         self.currency = currency
-        self.cookie['i18n-prefs'] = currency.value
+        self._set_cookie('i18n-prefs', currency.value)
 
     def set_language(self, language: Language):
         if isinstance(language, str):
             language = Language(language)  # This will raise `ValueError` if `language` is invalid.
         self.language = language
-        self.cookie[self._language_cookie_key] = self.language.value
+        self._set_cookie(self._language_cookie_key, self.language.value)
+
+    def _set_cookie(self, name: str, value: str):
+        raise NotImplementedError
+
+    @property
+    def _cookie_domain(self) -> str:
+        return '.amazon.{}'.format(self.country.value)
 
     @property
     def _language_cookie_key(self):
@@ -123,148 +100,92 @@ class Scraper:
         else:
             return 'lc-acb{}'.format(self.country.value.split('.')[-1])
 
-    @retry
-    def get_rating(self, asin: str) -> Dict[int, int]:
-        resp = self.get_with_update_cookie(self._url_rating(asin))
-        if resp.status_code != 200:
-            raise ValueError("status code `{}` seems like invalid for `get_rating`".format(resp.status_code))
-        soup = BeautifulSoup(resp.text, 'lxml')
-        return {i: int(elem[selector.Rating.DataName].rstrip('%')) for elem, i in
-                zip(soup.select(selector.Rating.Value), range(5, 0, -1))}
-    # https://images-na.ssl-images-amazon.com/images/I/71IdKRlm8%2BL._AC_SL1417_.jpg
-    # https://images-na.ssl-images-amazon.com/images/I/51lJ2FZcw5L._AC_US40_.jpg
-
-    @retry
-    def get_offers(self, asin: str, prime_eligible=False, free_shipping=False, new=False, used_like_new=False,
-                   used_very_good=False, used_good=False, used_acceptable=False, merchant=None, page=1) -> OfferList:
-        resp = self.get_with_update_cookie(
-            self._url_offers(asin, prime_eligible=prime_eligible, free_shipping=free_shipping, new=new,
-                             used_like_new=used_like_new, used_very_good=used_very_good, used_good=used_good,
-                             used_acceptable=used_acceptable, merchant=merchant, page=page))
-        if resp.status_code != 200:
-            raise ValueError("status code `{}` seems like invalid for `get_offers`".format(resp.status_code))
-        soup = BeautifulSoup(resp.text, 'lxml')
-        product_name = soup.select_one(selector.Offer.ProductName).text.strip()
-        offer_count = (bool(soup.select_one(selector.Offer.Pinned)) +
-                       int(find_number(soup.select_one(selector.Offer.Count).text + '0')))
-        offers = []
-        for offer in soup.select(selector.Offer.PinnedOffer) + soup.select(selector.Offer.Offers):
-            (price, price_fraction, currency,
-             rating, heading, ships_from, sold_by) = (offer.select_one(selector.Offer.Price),
-                                                      offer.select_one(selector.Offer.PriceFraction),
-                                                      offer.select_one(selector.Offer.PriceSymbol),
-                                                      offer.select_one(selector.Offer.SellerRating),
-                                                      offer.select_one(selector.Offer.Heading),
-                                                      offer.select_one(selector.Offer.ShipsFrom),
-                                                      offer.select_one(selector.Offer.SoldBy))
-            if not price:
-                continue
-            if price_fraction:
-                price = float(price.text.replace(',', '') + price_fraction.text)
-            else:
-                price = int(price.text.replace(',', ''))
-
-            currency = currency.text
-            heading = remove_whitespace(heading.text)
-            ships_from = ships_from.text.strip()
-            if sold_by.name == 'a':
-                sold_by_url = self._abs_path(sold_by['href'])
-            else:
-                sold_by_url = None
-            sold_by = sold_by.text.strip()
-
-            if rating:
-                for cls in rating['class']:
-                    if cls.startswith(selector.Offer.StarClassPrefix):
-                        cls = cls.lstrip(selector.Offer.StarClassPrefix)
-                        rating = float(cls.replace('-', '.'))
-                        break
-
-            offers.append(Offer(price=price, currency=currency, rating=rating,
-                                condition=heading, ships_from=ships_from, sold_by=sold_by, sold_by_url=sold_by_url))
-        return OfferList(product_name, offer_count, offers,
-                         settings={"prime_eligible": prime_eligible, "free_shipping": free_shipping, "new": new,
-                                   "used_like_new": used_like_new, "used_very_good": used_very_good,
-                                   "used_good": used_good,
-                                   "used_acceptable": used_acceptable, "merchant": merchant, "page": page})
-
-    @retry
-    def get_review(self, asin: str, page=1) -> ReviewList:  # Should I add some `settings`?
-
-        page_size = 10
-
-        settings = {'sortBy': 'recent',  # 'recent' or 'helpful'(default)
-                    'reviewerType': 'all_reviews',
-                    # 'avp_only_reviews' (Verified purchase) or
-                    # 'all_reviews'(default)
-                    'formatType': '',
-                    # 'current_format' or 'all_formats'(default)
-                    'mediaType': '',
-                    # 'media_reviews_only' or 'all_contents'(default)
-                    'filterByStar': 'all_stars',
-                    # {'one', 'two', 'three', 'four', 'five'} + '_star' or
-                    # 'positive' or 'critical' or 'all_stars'(default)
-                    'pageNumber': page,  # default=1
-                    'filterByLanguage': '',
-                    'filterByKeyword': '',  # search
-                    'shouldAppend': 'undefined',
-                    'deviceType': 'desktop',
-                    'canShowIntHeader': 'undefined',
-                    'reftag': 'cm_cr_getr_d_paging_btm_next_{}'.format(page),
-                    'pageSize': page_size,  # default=10, max=20, min=1
-                    'asin': asin,
-                    'scope': 'reviewsAjax1'}
-
-        resp = self.post_with_update_cookie(self._url_reviews(page), data=settings)
-        review = []
-
-        for dat in resp.text.split(selector.Review.StreamStrip):
-            if not dat:
-                continue
-            data = eval(dat)
-            if data[0] == selector.Review.StreamIndex0 and data[2]:
-                soup = BeautifulSoup(data[2], 'lxml')
-                top = soup.select_one(selector.Review.StreamTop)
-                if top and top.get(selector.Review.DataAttr, None) == selector.Review.ReviewDataAttr:
-                    rating = top.select_one(selector.Review.RatingIcon)
-
-                    if rating:
-                        for cls in rating['class']:
-                            if cls.startswith(selector.Review.StarClassPrefix):
-                                cls = cls.lstrip(selector.Review.StarClassPrefix)
-                                rating = int(cls)
-                                break
-
-                    title = top.select_one(selector.Review.Title)
-                    if title:
-                        title = title.text.strip()
-
-                    helpful = top.select_one(selector.Review.Helpful)
-                    if helpful:
-                        try:
-                            helpful = int(find_number(helpful.text.strip()))
-                        except ValueError:  # 'One person found this helpful'
-                            helpful = 1
-                    else:
-                        helpful = 0
-
-                    body = top.select_one(selector.Review.Body)
-                    if body:
-                        body = body.text.strip()
-
-                    reviewer = top.select_one(selector.Review.Reviewer)
-                    reviewer_url = top.select_one(selector.Review.ReviewerURL)
-                    if reviewer:
-                        reviewer = reviewer.text.strip()
-                    if reviewer_url:
-                        reviewer_url = self._abs_path(reviewer_url['href'])
-
-                    review_url = top.select_one(selector.Review.ReviewURL)
-                    if review_url:
-                        review_url = self._abs_path(review_url['href'])
-
-                    review.append(Review(reviewer, reviewer_url, review_url, title, rating, helpful, body))
-        return ReviewList(review, asin, self.country, settings, len(review) != page_size)
+    def _check_response(self, status_code: int, cookies: Dict[str, str], url: str = ''):
+        """
+        Raise on error status and follow the language and currency the server asked to set.
+        Bot detections and other responses are reported to `self.throttle`.
+        :param status_code: status code of the response
+        :param cookies: cookies the response set, as `name -> value`
+        :param url: final URL of the response, after redirects
+        """
+        if status_code == BotDetectedStatusCode or BotDetectedPath in url:
+            self._emit('bot_detected')
+            if self.throttle is not None:
+                self.throttle.blocked()
+            raise DetectedAsBotException('detected as bot by `{}`'.format(self.domain))
+        if self.throttle is not None:
+            self.throttle.success()
+        if status_code == ProductNotFoundCode:
+            raise ProductNotFoundException
+        if self.language.value != cookies.get(self._language_cookie_key, self.language.value):
+            warn('looks like language `{}` is not acceptable for `{}`. '
+                 'Server returned to set `{}`. Language updated'.format(self.language.value, self.domain,
+                                                                        cookies[self._language_cookie_key]))
+            self.set_language(cookies[self._language_cookie_key])
+        if self.currency.value != cookies.get('i18n-prefs', self.currency.value):
+            warn('looks like currency `{}` is not acceptable for `{}`. '
+                 'Server returned to set `{}`'.format(self.currency.value, self.domain,
+                                                      cookies['i18n-prefs']))
+            self.set_currency(cookies['i18n-prefs'])
+
+    def _backoff(self, attempt: int) -> float:
+        if self.throttle is not None:
+            return self.throttle.backoff(attempt)
+        return backoff_delay(attempt)
+
+    def _emit(self, event: str, **fields):
+        if self.metrics is not None:
+            self.metrics.record(event, marketplace=self.country.name, **fields)
+
+    def _parse_rating(self, text: Union[str, bytes]) -> Dict[int, int]:
+        return self._timed_parse('rating', self._scan_or_parse_rating, text)
+
+    def _scan_or_parse_rating(self, text: Union[str, bytes]) -> Dict[int, int]:
+        rating = scan_rating(text)
+        if rating is None:
+            self._emit('fallback', endpoint='rating')
+            rating = parse_rating(text, self.parser, fast=False)
+        return rating
+
+    def _parse_offers(self, text: str, settings: Dict) -> OfferList:
+        return self._timed_parse('offers', parse_offers, text, self.domain, settings, self.parser)
+
+    def _parse_reviews(self, text: str, asin: str, settings: Dict) -> ReviewList:
+        return self._timed_parse('reviews', parse_review_stream, text, asin, self.country, settings, self.parser)
+
+    def _flight_key(self, method: str, url: str, data: Optional[Dict]) -> str:
+        # the same request as far as Amazon can tell, so callers of one key may share the response
+        return HTTPCache.key(method, url, data, self.domain, self.language.value, self.currency.value)
+
+    def _timed_parse(self, endpoint: str, parse: Callable, *args):
+        if self.metrics is None:
+            return parse(*args)
+        start = time.perf_counter()
+        result = parse(*args)
+        seconds = time.perf_counter() - start
+        if isinstance(result, OfferList):
+            items = len(result.offers)
+        elif isinstance(result, ReviewList):
+            items = len(result.reviews)
+        else:
+            items = None
+        self._emit('parse', endpoint=endpoint, backend=self.parser.name, seconds=seconds, items=items)
+        return result
+
+    @staticmethod
+    def _offer_settings(prime_eligible=False, free_shipping=False, new=False, used_like_new=False,
+                        used_very_good=False, used_good=False, used_acceptable=False, merchant=None,
+                        page=1) -> Dict:
+        return {"prime_eligible": prime_eligible, "free_shipping": free_shipping, "new": new,
+                "used_like_new": used_like_new, "used_very_good": used_very_good,
+                "used_good": used_good,
+                "used_acceptable": used_acceptable, "merchant": merchant, "page": page}
+
+    @staticmethod
+    def _review_settings(asin: str, page=1, settings: Optional[ReviewSettings] = None) -> Dict:
+        if settings is None:
+            settings = ReviewSettings(sort_by=ReviewParameter.SortBy.Recent)
+        return settings.to_dict(asin, page)
 
     def _url_top_page(self) -> str:
         return 'https://{domain}'.format(domain=self.domain)
@@ -300,7 +221,347 @@ class Scraper:
                'ref=cm_cr_getr_d_paging_btm_next_{page}'.format(domain=self.domain, page=page)
 
     def _create_header(self):
-        return {**self.headers, 'cookie': '; '.join(f'{k}={v}' for k, v in self.cookie.items())}
+        return self.headers
 
     def _abs_path(self, endpoint: str) -> str:
         return urljoin('https://{}'.format(self.domain), endpoint)
+
+
+class Scraper(BaseScraper):
+    def __init__(self, country: Optional[Country] = Country.UnitedStates, language: Optional[Language] = None,
+                 currency: Optional[Currency] = None, run_init=True, pool_connections: int = 10,
+                 pool_maxsize: int = 10, session: Optional['requests.Session'] = None,
+                 parser: Union[str, ParserBackend, None] = None, cache: Optional[HTTPCache] = None,
+                 result_cache: Optional[ResultCache] = None, throttle: Union[Throttle, bool] = True,
+                 max_retries: int = 3, session_pool: Optional[SessionPool] = None, metrics: Optional[Metrics] = None,
+                 single_flight: Union[SingleFlight, bool] = True, proxy_pool: Optional[ProxyPool] = None):
+        """
+        Create Scraper Instance
+        :param country: Instance of `terraplen.Country` or `str`. Language and currency will automatically be calculated if not provided. Defaults to `Country.UnitedStates.`
+        :param language: Instance of `terraplen.Language` or `str`
+        :param currency: Instance of `terraplen.Currency` or `str`
+        :param run_init: Whether run first setup. setup accesses to Amazon homepage.
+        :param pool_connections: Number of host pools the underlying session keeps alive.
+        :param pool_maxsize: Maximum number of kept-alive connections per host.
+        :param session: `requests.Session` to use instead of creating a new one. Cookies are stored in its cookie jar.
+        :param parser: `'lxml'`, `'soup'` or instance of `terraplen.parser.ParserBackend`. Defaults to `'lxml'` if `cssselect` is installed, otherwise `'soup'`.
+        :param cache: Instance of `terraplen.HTTPCache` to serve rating, offers and reviews responses from. May be shared between Scrapers.
+        :param result_cache: Instance of `terraplen.ResultCache` to serve parsed results of `get_rating`, `get_offers` and `get_review` from. May be shared between Scrapers.
+        :param throttle: Instance of `terraplen.Throttle` pacing requests. True, the default, uses the one shared by every Scraper of the marketplace in this process, see `terraplen.throttle.get_throttle`. It lets through at most 2 requests per second with bursts of 5; raise it with `terraplen.throttle.set_throttle`. False disables throttling.
+        :param max_retries: Number of retries, with exponential backoff and a new setup, when detected as bot.
+        :param session_pool: Instance of `terraplen.SessionPool`. Cookies and User-Agent of a stored identity are used instead of running setup, and setups that do run are stored into it.
+        :param metrics: Instance of `terraplen.Metrics` recording latency, bytes, parse time, retries and bot detections. May be shared between Scrapers.
+        :param single_flight: Instance of `terraplen.SingleFlight`. Threads calling `get_rating`, `get_offers` or `get_review` with the same request at once share one download and parse, and the same result object. True creates one for this Scraper; pass an instance to share it between Scrapers. False disables it.
+        :param proxy_pool: Instance of `terraplen.ProxyPool`. Every request goes through its healthiest proxy, and a request whose proxy fails to connect is sent again through another one, up to `max_retries` times.
+        """
+        self.session = session or self._create_session(pool_connections, pool_maxsize)
+        self.cache = cache
+        self.result_cache = result_cache
+        self.session_pool = session_pool
+        self.proxy_pool = proxy_pool
+        self.identity: Optional[Identity] = None
+        self.single_flight = SingleFlight() if single_flight is True else single_flight or None
+
+        super().__init__(country, language, currency, parser, throttle, max_retries, metrics)
+
+        if session_pool is not None:
+            self.identity = session_pool.acquire(self.country)
+            if self.identity is not None:
+                self.identity.apply(self)
+        if run_init and self.identity is None:
+            self.init()
+
+    def init(self):
+        """
+        Access the homepage to collect cookies. With `session_pool`, the result replaces the identity in use.
+        """
+        self.get_with_update_cookie(self._url_top_page())
+        self.init_have_run = True
+        if self.session_pool is not None:
+            self.identity = self.session_pool.store(self, replace=self.identity)
+
+    @property
+    def cookie(self) -> Dict[str, str]:
+        return self.session.cookies.get_dict()
+
+    def get_with_update_cookie(self, url: str, endpoint: Optional[str] = None) -> 'requests.Response':
+        """
+        :param endpoint: `'rating'`, `'offers'` or `'reviews'` to go through `self.cache`. None bypasses the cache.
+        """
+        return self._request('GET', url, None, endpoint)
+
+    def post_with_update_cookie(self, url: str, data: Dict, endpoint: Optional[str] = None) -> 'requests.Response':
+        """
+        :param endpoint: `'rating'`, `'offers'` or `'reviews'` to go through `self.cache`. None bypasses the cache.
+        """
+        return self._request('POST', url, data, endpoint)
+
+    def _request(self, method: str, url: str, data: Optional[Dict], endpoint: Optional[str],
+                 revalidate: bool = False) -> 'requests.Response':
+        # `revalidate` asks Amazon even if `self.cache` holds a fresh response, sending its validators
+        headers = self._create_header()
+        key = cached = None
+        if self.cache is not None and endpoint is not None and self.cache.enabled(endpoint):
+            key = self.cache.key(method, url, data, self.domain, self.language.value, self.currency.value)
+            cached, fresh, validators = self.cache.lookup(key, endpoint)
+            if fresh and not revalidate:
+                self._emit('cache_hit', endpoint=endpoint)
+                return self._cached_response(cached)
+            headers = {**headers, **validators}
+
+        if self.throttle is not None:
+            self.throttle.acquire()
+        start = time.perf_counter()
+        resp = self._send(method, url, data, headers)
+        self._emit('response', endpoint=endpoint or 'top', status=resp.status_code, bytes=len(resp.content),
+                   ttfb=resp.elapsed.total_seconds(), total=time.perf_counter() - start)
+        self._check_response(resp.status_code, resp.cookies, resp.url)
+
+        if key is not None:
+            if cached is not None and resp.status_code == 304:
+                self.cache.refresh(key)
+                return self._cached_response(cached)
+            if resp.status_code == 200:
+                self.cache.store(key, endpoint, CachedResponse(resp.url, resp.status_code, dict(resp.headers),
+                                                               resp.content, resp.encoding))
+        return resp
+
+    def _send(self, method: str, url: str, data: Optional[Dict], headers: Dict) -> 'requests.Response':
+        if self.proxy_pool is None:
+            return self.session.request(method, url, data=data, headers=headers)
+
+        import requests
+        attempt = 0
+        while True:
+            proxy = self.proxy_pool.acquire()
+            start = time.perf_counter()
+            try:
+                resp = self.session.request(method, url, data=data, headers=headers, timeout=self.proxy_pool.timeout,
+                                            proxies={'http': proxy.url, 'https': proxy.url})
+            except (requests.ConnectionError, requests.Timeout):
+                self.proxy_pool.failure(proxy)
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1  # at once through the next proxy. Nothing reached Amazon, so there is no backoff
+                continue
+            except BaseException:
+                self.proxy_pool.release(proxy)
+                raise
+            if resp.status_code == BotDetectedStatusCode or BotDetectedPath in resp.url:
+                self.proxy_pool.blocked(proxy)  # raised by `_check_response`, and retried by `retry`
+            else:
+                self.proxy_pool.success(proxy, time.perf_counter() - start)
+            return resp
+
+    @staticmethod
+    def _cached_response(cached: CachedResponse) -> 'requests.Response':
+        import requests
+        from requests.structures import CaseInsensitiveDict
+
+        resp = requests.Response()
+        resp.url = cached.url
+        resp.status_code = cached.status_code
+        resp.headers = CaseInsensitiveDict(cached.headers)
+        resp.encoding = cached.encoding
+        resp._content = cached.content
+        return resp
+
+    @memoize
+    def get_rating(self, asin: str) -> Dict[int, int]:
+        return self._coalesce('rating', 'GET', self._url_rating(asin), None,
+                              lambda: self._parse_rating(self._fetch_rating(asin).content))
+    # https://images-na.ssl-images-amazon.com/images/I/71IdKRlm8%2BL._AC_SL1417_.jpg
+    # https://images-na.ssl-images-amazon.com/images/I/51lJ2FZcw5L._AC_US40_.jpg
+
+    @memoize
+    def get_offers(self, asin: str, prime_eligible=False, free_shipping=False, new=False, used_like_new=False,
+                   used_very_good=False, used_good=False, used_acceptable=False, merchant=None, page=1) -> OfferList:
+        settings = self._offer_settings(prime_eligible=prime_eligible, free_shipping=free_shipping, new=new,
+                                        used_like_new=used_like_new, used_very_good=used_very_good,
+                                        used_good=used_good, used_acceptable=used_acceptable, merchant=merchant,
+                                        page=page)
+        return self._coalesce('offers', 'GET', self._url_offers(asin, **settings), None,
+                              lambda: self._parse_offers(self._fetch_offers(asin, settings).text, settings))
+
+    def iter_offers(self, asin: str, start_page=1, limit: Optional[int] = None,
+                    until: Optional[Callable[[Offer], bool]] = None, prefetch=True, **filters) -> Iterator[Offer]:
+        """
+        Yield offers of every page lazily, in the order Amazon lists them, from `start_page` to the last page.
+        The next page is downloaded in the background while the current one is parsed.
+        :param asin: ASIN of the product
+        :param start_page: first page to fetch
+        :param limit: stop after this many offers. e.g. `iter_offers(asin, prime_eligible=True, limit=3)`
+        :param until: stop at the first offer this returns True for. That offer is not yielded. e.g. `until=lambda offer: offer.price > 100`
+        :param prefetch: Whether fetch the next page before the current one is parsed. The last page costs one extra request.
+        :param filters: filters of `get_offers` except `page`
+        """
+        seen = 0
+        total = None  # offer count of the listing. Pages after the first may not show it
+
+        def fetch(page):
+            settings = self._offer_settings(page=page, **filters)
+            return settings, self._fetch_offers(asin, settings)
+
+        def parse(fetched, page):
+            nonlocal seen, total
+            offer_list = self._parse_offers(fetched[1].text, fetched[0])
+            seen += len(offer_list.offers)
+            if offer_list.offer_count is not None:
+                total = offer_list.offer_count
+            return offer_list.offers, not offer_list.offers or (total is not None and seen >= total)
+
+        pages = iter_pages(fetch, parse, start_page, prefetch)
+        try:
+            yield from take(pages, limit, until)
+        finally:
+            pages.close()
+
+    @memoize
+    def get_review(self, asin: str, page=1, settings: Optional[ReviewSettings] = None) -> ReviewList:
+        """
+        Get one page of reviews.
+        :param asin: ASIN of the product
+        :param page: page number
+        :param settings: Instance of `terraplen.ReviewSettings`. Defaults to the most recent reviews, 20 per page.
+        """
+        data = self._review_settings(asin, page, settings)
+
+        def fetch_and_parse():
+            data, resp = self._fetch_review(asin, page, settings)
+            return self._parse_reviews(resp.text, asin, data)
+
+        return self._coalesce('reviews', 'POST', self._url_reviews(page), data, fetch_and_parse)
+
+    def iter_reviews(self, asin: str, start_page=1, limit: Optional[int] = None,
+                     until: Optional[Callable[[Review], bool]] = None, prefetch=True,
+                     settings: Optional[ReviewSettings] = None) -> Iterator[Review]:
+        """
+        Yield reviews of every page lazily, from `start_page` to the last page.
+        The next page is downloaded in the background while the current one is parsed.
+        :param asin: ASIN of the product
+        :param start_page: first page to fetch
+        :param limit: stop after this many reviews
+        :param until: stop at the first review this returns True for. That review is not yielded.
+        :param prefetch: Whether fetch the next page before the current one is parsed. The last page costs one extra request.
+        :param settings: Instance of `terraplen.ReviewSettings`. See `get_review`.
+        """
+
+        def parse(fetched, page):
+            review_list = self._parse_reviews(fetched[1].text, asin, fetched[0])
+            return review_list.reviews, review_list.last_page
+
+        pages = iter_pages(lambda page: self._fetch_review(asin, page, settings), parse, start_page, prefetch)
+        try:
+            yield from take(pages, limit, until)
+        finally:
+            pages.close()
+
+    def sync_reviews(self, asin: str, checkpoints: CheckpointStore, settings: Optional[ReviewSettings] = None,
+                     max_pages: Optional[int] = None) -> Iterator[Review]:
+        """
+        Yield only the reviews posted since the last sync of `asin` on this marketplace.
+        Pages are walked newest first and the walk stops at the first review already in `checkpoints`,
+        so a product with few new reviews costs one or two requests. The first sync walks every page.
+        The checkpoint is updated once every new review has been yielded. If the loop stops early or fails,
+        the next sync yields the same reviews again.
+        Pages always come from Amazon: `result_cache` is skipped and a response in `cache` is revalidated,
+        so a cached page does not hide new reviews.
+        :param asin: ASIN of the product
+        :param checkpoints: Instance of `terraplen.CheckpointStore`
+        :param settings: Instance of `terraplen.ReviewSettings` for filters. `sort_by` is always recent. Use the same filters on every sync of an ASIN.
+        :param max_pages: stop after this many pages even if no known review was found. Older reviews are then never synced.
+        """
+        settings = copy.copy(settings) if settings is not None else ReviewSettings()
+        settings.sort_by = ReviewParameter.SortBy.Recent
+        known = checkpoints.known(asin, self.country)
+        new_ids = []
+        page = 1
+        while True:
+            data, resp = self._fetch_review(asin, page, settings, revalidate=True)
+            review_list = self._parse_reviews(resp.text, asin, data)
+            for review in review_list.reviews:
+                current = review_id(review.review_url)
+                if current in known:
+                    checkpoints.update(asin, self.country, new_ids)
+                    return
+                if current is not None:
+                    known.add(current)  # a review shifted to the next page while paging is not yielded twice
+                    new_ids.append(current)
+                yield review
+            if review_list.last_page or (max_pages is not None and page >= max_pages):
+                break
+            page += 1
+        checkpoints.update(asin, self.country, new_ids)
+
+    def get_ratings_many(self, asins: Iterable[str], max_workers: int = 8,
+                         max_in_flight: Optional[int] = None) -> Iterator[Tuple[str, Union[Dict[int, int], Exception]]]:
+        """
+        Run `get_rating` for many ASINs on a thread pool.
+        Yields `(asin, rating)` in completion order. A failed ASIN yields `(asin, exception)` and the batch goes on.
+        Every request still waits for `self.throttle`. With the default shared throttle that is 2 requests per second
+        per marketplace, so more workers only help once the throttle allows more.
+        :param asins: ASINs to fetch. Consumed lazily.
+        :param max_workers: number of worker threads. Keep it at most `pool_maxsize` to reuse every connection.
+        :param max_in_flight: maximum number of ASINs submitted but not yet yielded. Defaults to `max_workers * 2`.
+        """
+        return map_unordered(self.get_rating, asins, max_workers, max_in_flight)
+
+    def get_offers_many(self, asins: Iterable[str], max_workers: int = 8, max_in_flight: Optional[int] = None,
+                        **kwargs) -> Iterator[Tuple[str, Union[OfferList, Exception]]]:
+        """
+        Run `get_offers` for many ASINs on a thread pool. See `get_ratings_many`.
+        :param kwargs: filters passed to `get_offers`
+        """
+        return map_unordered(lambda asin: self.get_offers(asin, **kwargs), asins, max_workers, max_in_flight)
+
+    def get_reviews_many(self, asins: Iterable[str], max_workers: int = 8, max_in_flight: Optional[int] = None,
+                         page=1, settings: Optional[ReviewSettings] = None
+                         ) -> Iterator[Tuple[str, Union[ReviewList, Exception]]]:
+        """
+        Run `get_review` for many ASINs on a thread pool. See `get_ratings_many`.
+        :param page: page of reviews to fetch for every ASIN
+        :param settings: Instance of `terraplen.ReviewSettings` used for every ASIN
+        """
+        return map_unordered(lambda asin: self.get_review(asin, page, settings), asins, max_workers, max_in_flight)
+
+    @retry('rating')
+    def _fetch_rating(self, asin: str) -> 'requests.Response':
+        resp = self.get_with_update_cookie(self._url_rating(asin), 'rating')
+        if resp.status_code != 200:
+            raise ValueError("status code `{}` seems like invalid for `get_rating`".format(resp.status_code))
+        return resp
+
+    @retry('offers')
+    def _fetch_offers(self, asin: str, settings: Dict) -> 'requests.Response':
+        resp = self.get_with_update_cookie(self._url_offers(asin, **settings), 'offers')
+        if resp.status_code != 200:
+            raise ValueError("status code `{}` seems like invalid for `get_offers`".format(resp.status_code))
+        return resp
+
+    @retry('reviews')
+    def _fetch_review(self, asin: str, page=1, settings: Optional[ReviewSettings] = None,
+                      revalidate: bool = False) -> Tuple[Dict, 'requests.Response']:
+        data = self._review_settings(asin, page, settings)
+        return data, self._request('POST', self._url_reviews(page), data, 'reviews', revalidate)
+
+    def _coalesce(self, endpoint: str, method: str, url: str, data: Optional[Dict], func: Callable):
+        if self.single_flight is None:
+            return func()
+        result, shared = self.single_flight.do(self._flight_key(method, url, data), func)
+        if shared:
+            self._emit('coalesced', endpoint=endpoint)
+        return result
+
+    def _set_cookie(self, name: str, value: str):
+        self.session.cookies.set(name, value, domain=self._cookie_domain, path='/')
+
+    @staticmethod
+    def _create_session(pool_connections: int, pool_maxsize: int) -> 'requests.Session':
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
@@ -0,0 +1,173 @@
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+from terraplen.exception import CircuitOpenException
+from terraplen.models import Country
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """
+    Exponential backoff with full jitter: a random delay between 0 and `min(cap, base * 2 ** attempt)`.
+    :param attempt: 0 for the first retry
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Token bucket refilled at `rate` tokens per second, holding up to `burst` tokens.
+        Not thread safe by itself. `Throttle` guards it.
+        :param rate: tokens per second
+        :param burst: capacity of the bucket
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+
+    def reserve(self) -> float:
+        """
+        Take one token, going into debt if the bucket is empty.
+        :return: seconds to wait before the token may be used
+        """
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+        self._tokens -= 1
+        return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+
+class Throttle:
+    def __init__(self, rate: float = 2.0, burst: int = 5, min_rate: float = 0.05, increase: float = 0.05,
+                 decrease: float = 0.5, failure_threshold: int = 5, recovery_time: float = 60.0,
+                 backoff_base: float = 1.0, backoff_cap: float = 60.0):
+        """
+        Pacing of requests to one marketplace. Thread safe. Share one instance between every Scraper of a marketplace,
+        which `get_throttle` does by default.
+        The rate adapts additively-increase / multiplicatively-decrease: every success raises it by `increase`
+        up to `rate`, and every bot detection multiplies it by `decrease` down to `min_rate`.
+        After `failure_threshold` detections in a row the circuit opens, and requests fail fast with
+        `CircuitOpenException` for `recovery_time` seconds. Then one probe request is let through. The circuit closes
+        if it succeeds and opens again if it is detected.
+        :param rate: maximum requests per second
+        :param burst: requests allowed at once after being idle
+        :param min_rate: lowest requests per second the rate adapts down to
+        :param increase: requests per second added on every success
+        :param decrease: factor the rate is multiplied by on every detection
+        :param failure_threshold: detections in a row that open the circuit
+        :param recovery_time: seconds the circuit stays open
+        :param backoff_base: base of the retry delay in seconds. See `backoff_delay`.
+        :param backoff_cap: maximum retry delay in seconds
+        """
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+        self._lock = threading.Lock()
+        self._bucket = TokenBucket(rate, burst)
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_at: Optional[float] = None
+
+    @property
+    def rate(self) -> float:
+        """
+        Current requests per second.
+        """
+        return self._bucket.rate
+
+    @property
+    def state(self) -> str:
+        """
+        `'closed'`, `'open'` or `'half-open'`.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            return 'open' if time.monotonic() - self._opened_at < self.recovery_time else 'half-open'
+
+    def reserve(self) -> float:
+        """
+        Take a slot for one request.
+        :return: seconds to wait before sending it
+        :raise CircuitOpenException: while the circuit is open
+        """
+        with self._lock:
+            if self._opened_at is not None:
+                now = time.monotonic()
+                retry_after = self._opened_at + self.recovery_time - now
+                if retry_after > 0:
+                    raise CircuitOpenException(retry_after)
+                if self._probe_at is not None and now - self._probe_at < self.recovery_time:  # a probe is running
+                    raise CircuitOpenException(self._probe_at + self.recovery_time - now)
+                self._probe_at = now
+            return self._bucket.reserve()
+
+    def acquire(self):
+        """
+        Block until one request may be sent.
+        :raise CircuitOpenException: while the circuit is open
+        """
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def success(self):
+        """
+        Record a response that was not a bot detection.
+        """
+        with self._lock:
+            self._failures = 0
+            self._opened_at = self._probe_at = None
+            self._bucket.rate = min(self.max_rate, self._bucket.rate + self.increase)
+
+    def blocked(self):
+        """
+        Record a bot detection.
+        """
+        with self._lock:
+            self._failures += 1
+            self._bucket.rate = max(self.min_rate, self._bucket.rate * self.decrease)
+            if self._probe_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._probe_at = None
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Delay before retry number `attempt`, starting at 0.
+        """
+        return backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+
+    def __repr__(self):
+        return 'Throttle(rate={:.3g}, max_rate={}, state={})'.format(self.rate, self.max_rate, repr(self.state))
+
+
+_lock = threading.Lock()
+_throttles: Dict[Country, Throttle] = {}
+
+
+def get_throttle(country: Country) -> Throttle:
+    """
+    Throttle shared by every Scraper of `country` in this process. Created with default settings on first use.
+    """
+    with _lock:
+        if country not in _throttles:
+            _throttles[country] = Throttle()
+        return _throttles[country]
+
+
+def set_throttle(country: Country, throttle: Throttle):
+    """
+    Replace the shared throttle of `country`, for example to change its rate.
+    Scrapers created before keep the previous one.
+    """
+    with _lock:
+        _throttles[country] = throttle
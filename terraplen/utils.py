@@ -1,4 +1,27 @@
+import importlib
 import re
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Optional, Tuple, TypeVar, Union
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+def lazy_import(name: str, feature: str, package: Optional[str] = None):
+    """
+    Import an optional dependency when it is first needed, instead of when terraplen is imported.
+    :param name: module name, such as `'pyarrow.parquet'`
+    :param feature: what needs it, for the error message
+    :param package: distribution to `pip install`. Defaults to the top-level module of `name`.
+    :raise ImportError: if it is not installed
+    """
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        package = package or name.split('.')[0]
+        raise ImportError('`{}` requires `{}`. Install it with `pip install {}`.'.format(feature, package, package)) \
+            from None
 
 
 def find_number(text: str) -> float:
@@ -10,3 +33,75 @@ def find_number(text: str) -> float:
 
 def remove_whitespace(text: str) -> str:
     return re.sub(r'\s+', '', text)
+
+
+def map_unordered(func: Callable[[T], R], items: Iterable[T], max_workers: int = 8,
+                  max_in_flight: Optional[int] = None) -> Iterator[Tuple[T, Union[R, Exception]]]:
+    """
+    Run `func` over `items` on a thread pool and yield `(item, result)` as each call completes.
+    An exception raised by `func` is yielded in place of its result instead of being raised.
+    :param func: function called with each item
+    :param items: items to process. Consumed lazily, so it may be a generator of any length.
+    :param max_workers: number of worker threads
+    :param max_in_flight: maximum number of submitted but not yet yielded items. Defaults to `max_workers * 2`.
+    """
+    max_in_flight = max_in_flight or max_workers * 2
+    items = iter(items)
+    pending = {}
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        while True:
+            for item in islice(items, max_in_flight - len(pending)):
+                pending[executor.submit(func, item)] = item
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                exception = future.exception()
+                yield item, exception if exception is not None else future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_pages(fetch: Callable[[int], T], parse: Callable[[T, int], Tuple[Iterable[R], bool]], start_page: int = 1,
+               prefetch: bool = True) -> Iterator[R]:
+    """
+    Yield items of consecutive pages. While a page is parsed, the next one is already being fetched in the background.
+    :param fetch: function that downloads a page, called with the page number
+    :param parse: function called with what `fetch` returned and the page number. Returns `(items, is_last_page)`.
+    :param start_page: first page to fetch
+    :param prefetch: Whether fetch the next page before the current one is parsed. The last page costs one extra request.
+    """
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        page = start_page
+        future = executor.submit(fetch, page)
+        while future is not None:
+            fetched = future.result()
+            future = executor.submit(fetch, page + 1) if prefetch else None
+            items, is_last_page = parse(fetched, page)
+            if is_last_page:
+                if future is not None:
+                    future.cancel()
+                future = None
+            elif future is None:
+                future = executor.submit(fetch, page + 1)
+            page += 1
+            yield from items
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def take(items: Iterable[T], limit: Optional[int] = None, until: Optional[Callable[[T], bool]] = None) -> Iterator[T]:
+    """
+    Yield items until `limit` items have been yielded or `until` returns True for an item, which is not yielded.
+    """
+    if limit is not None and limit <= 0:
+        return
+    for count, item in enumerate(items, 1):
+        if until is not None and until(item):
+            return
+        yield item
+        if limit is not None and count >= limit:
+            return
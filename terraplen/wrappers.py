@@ -1,14 +1,104 @@
+import inspect
+import time
 from functools import wraps
-from terraplen.exception import DetectedAsBotException
+from terraplen.exception import CircuitOpenException, DetectedAsBotException
 
 
-def retry(func):
+def retry(endpoint: str):
+    """
+    Retry up to `instance.max_retries` times when detected as bot, sleeping `instance._backoff(attempt)` and
+    running `instance.init()` before each retry. `CircuitOpenException` is raised at once.
+    :param endpoint: endpoint the retries are recorded under in `instance.metrics`
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(instance, *args, **kwargs):
+            attempt = 0
+            while True:
+                try:
+                    return func(instance, *args, **kwargs)
+                except CircuitOpenException:
+                    raise
+                except DetectedAsBotException:
+                    if attempt >= instance.max_retries:
+                        raise
+                delay = instance._backoff(attempt)
+                instance._emit('retry', endpoint=endpoint, attempt=attempt, delay=delay)
+                time.sleep(delay)
+                attempt += 1
+                try:
+                    instance.init()
+                except CircuitOpenException:
+                    raise
+                except DetectedAsBotException:  # the next attempt backs off further
+                    pass
+
+        return wrapper
+
+    return decorator
+
+
+def async_retry(endpoint: str):
+    """
+    Same as `retry`, for coroutine methods.
+    """
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(instance, *args, **kwargs):
+            attempt = 0
+            while True:
+                try:
+                    return await func(instance, *args, **kwargs)
+                except CircuitOpenException:
+                    raise
+                except DetectedAsBotException:
+                    if attempt >= instance.max_retries:
+                        raise
+                delay = instance._backoff(attempt)
+                instance._emit('retry', endpoint=endpoint, attempt=attempt, delay=delay)
+                await _asyncio().sleep(delay)
+                attempt += 1
+                try:
+                    await instance.init()
+                except CircuitOpenException:
+                    raise
+                except DetectedAsBotException:
+                    pass
+
+        return wrapper
+
+    return decorator
+
+
+def _asyncio():
+    import asyncio  # only coroutine methods need it, and it is slow to import
+    return asyncio
+
+
+def memoize(func):
+    """
+    Serve results from `instance.result_cache` when it is set.
+    Keyed by method name, marketplace, language, currency and the arguments with defaults applied.
+    """
+    signature = inspect.signature(func)
+
     @wraps(func)
     def wrapper(instance, *args, **kwargs):
-        try:
-            return func(instance, *args, **kwargs)
-        except DetectedAsBotException:
-            instance.init()
+        cache = instance.result_cache
+        if cache is None or not cache.enabled(func.__name__):
             return func(instance, *args, **kwargs)
 
+        bound = signature.bind(instance, *args, **kwargs)
+        bound.apply_defaults()
+        arguments = tuple((name, value if isinstance(value, (str, int, float, bool, type(None))) else repr(value))
+                          for name, value in list(bound.arguments.items())[1:])
+        key = (func.__name__, instance.domain, instance.language.value, instance.currency.value, arguments)
+
+        found, value = cache.get(func.__name__, key)
+        if found:
+            return value
+        value = func(instance, *args, **kwargs)
+        cache.set(func.__name__, key, value)
+        return value
+
     return wrapper
@@ -0,0 +1,181 @@
+import http.client
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from terraplen import Country
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+MARKETS = {'us': Country.UnitedStates, 'jp': Country.Japan, 'uk': Country.UnitedKingdom}
+BACKENDS = ('lxml', 'soup')
+ASIN = 'B07WXL5YPW'
+
+
+class Corpus:
+    """
+    Offline responses of one marketplace and what parsing them must return.
+    Responses are synthesized to follow the markup `terraplen.selector` targets, not recorded from Amazon.
+    """
+
+    def __init__(self, market: str):
+        self.market = market
+        self.country = MARKETS[market]
+        self.rating = self._read('rating.html')
+        self.offers = self._read('offers.html')
+        self.reviews = self._read('reviews.txt')
+        self.expected = json.loads(self._read('expected.json'))
+
+    @property
+    def expected_rating(self):
+        return {int(star): value for star, value in self.expected['rating'].items()}
+
+    def _read(self, name: str) -> str:
+        with open(os.path.join(FIXTURES, self.market, name), encoding='utf-8') as f:
+            return f.read()
+
+
+def pytest_generate_tests(metafunc):
+    if 'market' in metafunc.fixturenames:
+        metafunc.parametrize('market', list(MARKETS))
+    if 'backend' in metafunc.fixturenames:
+        metafunc.parametrize('backend', BACKENDS)
+
+
+@pytest.fixture
+def corpus(market) -> Corpus:
+    return Corpus(market)
+
+
+class LocalServer:
+    """
+    HTTP server on localhost answering with `respond(method, path, query, form)`,
+    which returns `(status, body)` or `(status, body, headers)`.
+    """
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.requests = []  # (method, path, query, form)
+        self.headers = []  # request headers, in the order of `requests`
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self._answer('GET', {})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+                self._answer('POST', {key: value[0] for key, value in parse_qs(body).items()})
+
+            def _answer(self, method, form):
+                url = urlsplit(self.path)
+                query = {key: value[0] for key, value in parse_qs(url.query).items()}
+                server.requests.append((method, url.path, query, form))
+                server.headers.append(dict(self.headers))
+                status, body, *headers = server.respond(method, url.path, query, form)
+                body = body.encode('utf-8')
+                self.send_response(status)
+                for key, value in (headers[0] if headers else {}).items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}'.format(self._server.server_address[1])
+        threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class LocalProxy:
+    """
+    Forward HTTP proxy on localhost standing in for an egress proxy. `behavior` is `'forward'`,
+    `'block'` to answer 503 as if Amazon detected the proxy as bot, or `'drop'` to close the connection unanswered.
+    Every request is delayed by `delay` seconds.
+    """
+
+    def __init__(self, behavior: str = 'forward', delay: float = 0.0):
+        self.behavior = behavior
+        self.delay = delay
+        self.requests = 0
+        proxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self._forward()
+
+            def do_POST(self):
+                self._forward()
+
+            def _forward(self):
+                proxy.requests += 1
+                time.sleep(proxy.delay)
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if proxy.behavior == 'drop':
+                    self.close_connection = True
+                    return
+                if proxy.behavior == 'block':
+                    status, headers, content = 503, [], b''
+                else:
+                    url = urlsplit(self.path)
+                    connection = http.client.HTTPConnection(url.netloc)
+                    connection.request(self.command, url.path + ('?' + url.query if url.query else ''), body,
+                                       {key: value for key, value in self.headers.items()
+                                        if not key.lower().startswith('proxy-')})
+                    response = connection.getresponse()
+                    status, headers, content = response.status, response.getheaders(), response.read()
+                    connection.close()
+                self.send_response(status)
+                for key, value in headers:
+                    if key.lower() not in ('content-length', 'connection', 'transfer-encoding', 'date', 'server'):
+                        self.send_header(key, value)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}'.format(self._server.server_address[1])
+        threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def local_proxy():
+    proxies = []
+
+    def start(behavior: str = 'forward', delay: float = 0.0) -> LocalProxy:
+        proxies.append(LocalProxy(behavior, delay))
+        return proxies[-1]
+
+    yield start
+    for proxy in proxies:
+        proxy.close()
+
+
+@pytest.fixture
+def local_server():
+    servers = []
+
+    def start(respond) -> LocalServer:
+        servers.append(LocalServer(respond))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
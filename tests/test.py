@@ -1,8 +1,38 @@
 from terraplen.utils import find_number
-from terraplen import Country
-from terraplen import Scraper
+from terraplen import Country, Currency
+from terraplen import Scraper, AsyncScraper, ReviewSettings, ReviewParameter, HTTPCache, ResultCache, ParsePipeline
+from terraplen import parse_rating, parse_offers, parse_review_stream, ReviewBatch, OfferBatch
+from terraplen import CSVSink, ParquetSink, export_records, open_sink, Throttle, SessionPool, Metrics, CheckpointStore
+from terraplen import MultiMarketScraper, SingleFlight, ProxyPool, JobQueue, Crawler
+from terraplen.crawl import Job, follow_ups
+from terraplen.checkpoint import review_id
+from terraplen.single_flight import AsyncSingleFlight
+from terraplen.parser import get_backend, scan_rating
+from terraplen.exception import (CircuitOpenException, DetectedAsBotException, NoProxyAvailableException,
+                                 ProductNotFoundException)
+from terraplen.utils import map_unordered
+import asyncio
+import csv
+import functools
+import gzip
+import itertools
+import json
+import multiprocessing
+import os
+import pickle
+import re
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import types
+import zlib
+
 import pytest
 
+from conftest import ASIN, MARKETS, Corpus
+
 DoHeavyTest = False
 
 
@@ -50,7 +80,7 @@ class TestCountry:
 
 
 class TestScraper:
-    scraper = Scraper(Country.Japan)
+    scraper = Scraper(Country.Japan, run_init=DoHeavyTest)
     test_asin = 'B07WXL5YPW'
 
     def test_domain(self):
@@ -63,5 +93,1017 @@ class TestScraper:
         pass
 
 
+class TestParser:
+    def test_rating(self, corpus, backend):
+        assert parse_rating(corpus.rating, backend) == corpus.expected_rating
+        assert parse_rating(corpus.rating, backend, fast=False) == corpus.expected_rating
+
+    def test_partial_parse(self, corpus, backend):
+        widget = '\n&&&\n["append", "#cm_cr-review_list", "<div data-hook=\\"review-widget\\">' \
+                 '<span class=\\"a-profile-name\\">Sponsored</span></div>"]'
+        review_list = parse_review_stream(corpus.reviews + widget, ASIN, corpus.country, None, backend)
+        assert [review.to_dict() for review in review_list.reviews] == corpus.expected['reviews']['reviews']
+
+        parser = get_backend(backend)
+        root = parser.parse('<div id="keep"><span>kept</span></div><div id="other"><span>other</span></div>',
+                            only={'id': ['keep']})
+        spans = [parser.text(node) for node in parser.select(root, 'span')]
+        assert spans[0] == 'kept' and (backend == 'lxml' or spans == ['kept'])  # lxml always builds everything
+
+    def test_rating_scan(self, corpus, backend):
+        assert scan_rating(corpus.rating) == scan_rating(corpus.rating.encode('utf-8')) == corpus.expected_rating
+        meter = '<div class="a-meter" role="progressbar" aria-valuenow="{}%">'.format(corpus.expected_rating[1])
+        for changed in (corpus.rating.replace(meter, meter.replace('%', '.5%')),  # not an integer
+                        corpus.rating.replace(meter, meter.replace('%', '0%')),  # over 100
+                        corpus.rating.replace(meter, meter.replace('a-meter', 'a-meter-bar')),  # not a meter
+                        corpus.rating.replace(meter, meter + meter)):  # six values
+            assert changed != corpus.rating
+            assert scan_rating(changed) is None
+
+        metrics = Metrics()
+        scraper = Scraper(corpus.country, run_init=False, parser=backend, metrics=metrics)
+        six = corpus.rating.replace(meter, meter + '</div>' + meter)
+        assert scraper._parse_rating(six) == parse_rating(six, backend, fast=False)
+        assert scraper._parse_rating(corpus.rating.encode('utf-8')) == corpus.expected_rating
+        assert metrics.fallbacks.value(endpoint='rating', marketplace=corpus.country.name) == 1
+        assert metrics.parse_time.count(endpoint='rating', marketplace=corpus.country.name, backend=backend) == 2
+
+    def test_offers(self, corpus, backend):
+        offer_list = parse_offers(corpus.offers, 'www.amazon.{}'.format(corpus.country.value),
+                                  Scraper._offer_settings(), backend)
+        assert offer_list.product_name == corpus.expected['offers']['product_name']
+        assert offer_list.offer_count == corpus.expected['offers']['offer_count']
+        assert [offer.to_dict() for offer in offer_list.offers] == corpus.expected['offers']['offers']
+
+    def test_reviews(self, corpus, backend):
+        review_list = parse_review_stream(corpus.reviews, ASIN, corpus.country, Scraper._review_settings(ASIN), backend)
+        assert review_list.last_page == corpus.expected['reviews']['last_page']
+        assert [review.to_dict() for review in review_list.reviews] == corpus.expected['reviews']['reviews']
+
+
+class FixtureScraper(Scraper):
+    """
+    Scraper answering from the fixture corpus instead of Amazon.
+    """
+
+    def __init__(self, corpus, **kwargs):
+        super().__init__(corpus.country, run_init=False, **kwargs)
+        self.corpus = corpus
+
+    def _fetch_rating(self, asin):
+        if asin == 'missing':
+            raise ValueError(asin)
+        return FixtureResponse(self.corpus.rating)
+
+
+class LocalURLs:
+    """
+    URLs of a `conftest.LocalServer` in place of Amazon, for a Scraper holding it as `self.server`.
+    """
+
+    def _url_top_page(self):
+        return self.server.url + '/'
+
+    def _url_rating(self, asin):
+        return '{}/rating?asin={}'.format(self.server.url, asin)
+
+    def _url_offers(self, asin, prime_eligible, free_shipping, new, used_like_new, used_very_good, used_good,
+                    used_acceptable, merchant, page=1):
+        return '{}/offers?asin={}&pageno={}'.format(self.server.url, asin, page)
+
+    def _url_reviews(self, page=1):
+        return '{}/reviews?page={}'.format(self.server.url, page)
+
+
+class LocalScraper(LocalURLs, Scraper):
+    """
+    Scraper sending every request to a `conftest.LocalServer`.
+    """
+
+    def __init__(self, server, country=Country.UnitedStates, **kwargs):
+        self.server = server
+        kwargs.setdefault('run_init', False)
+        super().__init__(country, **kwargs)
+
+
+class LocalAsyncScraper(LocalURLs, AsyncScraper):
+    """
+    AsyncScraper sending every request to a `conftest.LocalServer`.
+    """
+
+    def __init__(self, server, country=Country.UnitedStates, **kwargs):
+        self.server = server
+        kwargs.setdefault('run_init', False)
+        kwargs.setdefault('throttle', False)
+        super().__init__(country, **kwargs)
+
+
+class FixtureResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class TestParsePipeline:
+    def test_ratings(self):
+        corpus = Corpus('us')
+        asins = ['A{}'.format(i) for i in range(20)] + ['missing']
+        with ParsePipeline(FixtureScraper(corpus), fetch_workers=4, parse_workers=2) as pipeline:
+            results = dict(pipeline.ratings(asins))
+        assert len(results) == len(asins)
+        assert isinstance(results.pop('missing'), ValueError)
+        assert all(rating == corpus.expected_rating for rating in results.values())
+
+
+class TestBatch:
+    def test_many(self, corpus, local_server):
+        server = local_server(lambda method, path, query, form: (404 if query['asin'] == 'missing' else 200,
+                                                                corpus.rating))
+        scraper = LocalScraper(server, corpus.country, throttle=False)
+        asins = (asin for asin in ['A1', 'missing', 'A2', 'A3'])
+        results = dict(scraper.get_ratings_many(asins, max_workers=2))
+        assert isinstance(results.pop('missing'), ProductNotFoundException)  # yielded, and the batch went on
+        assert results == {'A1': corpus.expected_rating, 'A2': corpus.expected_rating, 'A3': corpus.expected_rating}
+
+    def test_max_in_flight(self):
+        lock = threading.Lock()
+        pulled, yielded, in_flight = 0, 0, []
+
+        def items():
+            nonlocal pulled
+            for item in range(30):
+                with lock:
+                    in_flight.append(pulled - yielded + 1)  # submitted and not yet yielded, this one included
+                    pulled += 1
+                yield item
+
+        for item, result in map_unordered(lambda item: time.sleep(0.005) or item * 2, items(), max_workers=2,
+                                          max_in_flight=3):
+            assert result == item * 2
+            with lock:
+                yielded += 1
+        assert pulled == yielded == 30
+        assert max(in_flight) == 3
+
+    def test_lazy_and_close(self):
+        calls = []
+        results = map_unordered(lambda item: calls.append(item) or time.sleep(0.01), itertools.count(),
+                                max_workers=2, max_in_flight=4)
+        assert calls == []  # nothing runs before the first result is asked for
+        for _ in itertools.islice(results, 5):
+            pass
+        results.close()
+        time.sleep(0.05)
+        stopped = len(calls)
+        assert stopped <= 5 + 4
+        time.sleep(0.05)
+        assert len(calls) == stopped  # the queued calls were cancelled
+
+
+class TestIterReviews:
+    def serve(self, corpus, local_server, last_page=3):
+        # full pages up to `last_page`, which is empty
+        server = local_server(lambda method, path, query, form: (200, corpus.reviews if int(query['page']) < last_page
+                                                                 else ''))
+        return server, LocalScraper(server, corpus.country, throttle=False)
+
+    @staticmethod
+    def pages(server):
+        return [int(query['page']) for _, _, query, _ in server.requests]
+
+    def test_last_page(self, corpus, local_server):
+        server, scraper = self.serve(corpus, local_server)
+        reviews = list(scraper.iter_reviews(ASIN))
+        assert reviews == list(parse_review_stream(corpus.reviews, ASIN, corpus.country).reviews) * 2
+        assert self.pages(server)[:3] == [1, 2, 3] and len(server.requests) <= 4  # page 4 may have been prefetched
+
+        server, scraper = self.serve(corpus, local_server)
+        assert len(list(scraper.iter_reviews(ASIN, start_page=2, prefetch=False))) == 20
+        assert self.pages(server) == [2, 3]  # no request past the last page
+
+    def test_limit_and_until(self, corpus, local_server):
+        server, scraper = self.serve(corpus, local_server)
+        reviews = parse_review_stream(corpus.reviews, ASIN, corpus.country).reviews
+        assert list(scraper.iter_reviews(ASIN, limit=25, prefetch=False)) == list(reviews + reviews[:5])
+        assert self.pages(server) == [1, 2]
+        assert list(scraper.iter_reviews(ASIN, until=lambda review: review == reviews[5])) == list(reviews[:5])
+        assert list(scraper.iter_reviews(ASIN, limit=0)) == []
+
+    def test_close(self, corpus, local_server):
+        server, scraper = self.serve(corpus, local_server)
+        reviews = scraper.iter_reviews(ASIN, prefetch=False)
+        next(reviews)
+        reviews.close()
+        assert self.pages(server) == [1]
+
+        server, scraper = self.serve(corpus, local_server)
+        reviews = scraper.iter_reviews(ASIN)
+        next(reviews)
+        reviews.close()
+        time.sleep(0.05)
+        assert self.pages(server) in ([1], [1, 2])  # the prefetch of page 2 is cancelled or finishes, and stops there
+
+
+class TestIterOffers:
+    def serve(self, corpus, local_server):
+        # 31 offers: the first page with the header and 11 offers, a second page of 10 without the header,
+        # then an empty page although 10 more were announced
+        pages = {1: re.sub(r'10(?= options|件)', '30', corpus.offers),
+                 2: corpus.offers[corpus.offers.index('<div id="aod-offer-list">'):]}
+        server = local_server(lambda method, path, query, form: (200, pages.get(int(query['pageno']),
+                                                                                '<div id="aod-offer"></div>')))
+        return server, LocalScraper(server, corpus.country, throttle=False)
+
+    @staticmethod
+    def pages(server):
+        return [int(query['pageno']) for _, _, query, _ in server.requests]
+
+    def test_pages(self, corpus, local_server, backend):
+        domain = 'www.amazon.{}'.format(corpus.country.value)
+        first = parse_offers(corpus.offers, domain, {'page': 1}, backend).offers
+        second = parse_offers(corpus.offers[corpus.offers.index('<div id="aod-offer-list">'):], domain, {'page': 2},
+                              backend)
+        assert (second.product_name, second.offer_count, second.offers) == (None, None, first[1:])
+
+        server, scraper = self.serve(corpus, local_server)
+        scraper.parser = get_backend(backend)
+        assert list(scraper.iter_offers(ASIN, prefetch=False)) == list(first + first[1:])
+        assert self.pages(server) == [1, 2, 3]  # stopped at the empty page
+
+        server = local_server(lambda *request: (200, corpus.offers))
+        assert len(list(LocalScraper(server, corpus.country, throttle=False).iter_offers(ASIN, prefetch=False))) == 11
+        assert self.pages(server) == [1]  # every announced offer was on the first page
+
+    def test_limit_and_until(self, corpus, local_server):
+        server, scraper = self.serve(corpus, local_server)
+        offers = parse_offers(corpus.offers, scraper.domain, {'page': 1}).offers
+        assert list(scraper.iter_offers(ASIN, limit=13, prefetch=False)) == list(offers + offers[1:3])
+        assert self.pages(server) == [1, 2]
+        assert list(scraper.iter_offers(ASIN, until=lambda offer: offer == offers[4])) == list(offers[:4])
+
+    def test_first_page_without_header(self, local_server):
+        server = local_server(lambda *request: (200, '<div id="aod-offer"></div>'))
+        with pytest.raises(ValueError):
+            list(LocalScraper(server, throttle=False).iter_offers(ASIN))
+
+
+class TestAsyncScraper:
+    def test_max_concurrency(self, corpus, local_server):
+        lock = threading.Lock()
+        in_flight = peak = 0
+
+        def respond(*request):
+            nonlocal in_flight, peak
+            with lock:
+                in_flight += 1
+                peak = max(peak, in_flight)
+            time.sleep(0.05)
+            with lock:
+                in_flight -= 1
+            return 200, corpus.rating
+
+        server = local_server(respond)
+
+        async def main():
+            # the first AsyncScraper of the loop and domain sizes the semaphore, and the second one shares it
+            async with LocalAsyncScraper(server, max_concurrency=3) as first, \
+                    LocalAsyncScraper(server, max_concurrency=10) as second:
+                return await asyncio.gather(*[scraper.get_rating('A{}'.format(i))
+                                              for i in range(12) for scraper in (first, second)])
+
+        assert asyncio.run(main()) == [corpus.expected_rating] * 24
+        assert peak == 3
+
+    def test_init_and_cookies(self, corpus, local_server):
+        server = local_server(lambda *request: (200, corpus.rating))
+
+        async def main():
+            scraper = LocalAsyncScraper(server, Country.Japan, currency='USD', run_init=True)
+            assert scraper.session is None and scraper.cookie == {'lc-acbjp': 'ja_JP', 'i18n-prefs': 'USD'}
+            async with scraper:
+                assert scraper.init_have_run and [request[1] for request in server.requests] == ['/']
+                # the cookies set before the session existed went into its cookie jar
+                assert scraper.cookie == {'lc-acbjp': 'ja_JP', 'i18n-prefs': 'USD'}
+                scraper.set_currency('JPY')
+                assert scraper.cookie['i18n-prefs'] == 'JPY'
+            assert scraper.session is None
+
+        asyncio.run(main())
+
+    def test_trace_timings(self, corpus, local_server):
+        server = local_server(lambda *request: (200, corpus.rating))
+        metrics = Metrics()
+
+        async def main():
+            async with LocalAsyncScraper(server, corpus.country, metrics=metrics) as scraper:
+                return await scraper.get_rating(ASIN)
+
+        assert asyncio.run(main()) == corpus.expected_rating
+        labels = {'endpoint': 'rating', 'marketplace': corpus.country.name}
+        assert metrics.requests.value(status='200', **labels) == 1
+        for phase in ('connect', 'ttfb', 'total'):  # no DNS lookup for an IP address
+            assert metrics.latency.count(phase=phase, **labels) == 1
+        assert metrics.latency.sum(phase='ttfb', **labels) <= metrics.latency.sum(phase='total', **labels)
+
+    def test_proxy(self, corpus, local_server, local_proxy):
+        server = local_server(lambda *request: (200, corpus.rating))
+        dropping, forwarding = local_proxy('drop'), local_proxy()
+        pool = ProxyPool([dropping.url, forwarding.url], failure_threshold=1)
+
+        async def main():
+            async with LocalAsyncScraper(server, corpus.country, proxy_pool=pool) as scraper:
+                return [await scraper.get_rating(asin) for asin in ('A1', 'A2')]
+
+        assert asyncio.run(main()) == [corpus.expected_rating] * 2
+        assert dropping.requests and (forwarding.requests, len(server.requests)) == (2, 2)  # aiohttp may resend once
+        stats = {proxy['url']: proxy for proxy in pool.stats()}
+        assert stats[dropping.url]['state'] == 'quarantined' and stats[dropping.url]['failures'] == 1
+        assert stats[forwarding.url]['requests'] == 2 and stats[forwarding.url]['in_flight'] == 0
+
+
+class TestReviewSettings:
+    def test_to_dict(self):
+        settings = ReviewSettings(sort_by='recent', filter_by_star=ReviewParameter.FilterByStar.Critical,
+                                  filter_by_keyword='battery', page_size=5)
+        data = settings.to_dict(ASIN, 3)
+        assert data['sortBy'] == 'recent'
+        assert data['filterByStar'] == 'critical'
+        assert data['filterByKeyword'] == 'battery'
+        assert data['pageNumber'] == 3
+        assert data['pageSize'] == 5
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            ReviewSettings(page_size=21)
+        with pytest.raises(ValueError):
+            ReviewSettings(sort_by='newest')
+
+
+class TestHTTPCache:
+    def test_ttl(self, local_server):
+        corpus = Corpus('us')
+        server = local_server(lambda *request: (200, corpus.rating))
+        scraper = LocalScraper(server, throttle=False, cache=HTTPCache(':memory:', ttl={'rating': 0.2}))
+        for _ in range(3):
+            assert scraper.get_rating(ASIN) == corpus.expected_rating
+        assert len(server.requests) == 1
+        time.sleep(0.25)
+        assert scraper.get_rating(ASIN) == corpus.expected_rating
+        assert len(server.requests) == 2
+        assert 'If-None-Match' not in server.headers[-1]  # nothing to revalidate with
+
+    def test_revalidate(self, local_server):
+        corpus = Corpus('us')
+        modified = 'Wed, 21 Oct 2015 07:28:00 GMT'
+
+        def respond(*request):
+            if server.headers[-1].get('If-None-Match') == '"v1"':
+                return 304, ''
+            return 200, corpus.rating, {'etag': '"v1"', 'last-modified': modified}  # lowercase names
+
+        server = local_server(respond)
+        cache = HTTPCache(':memory:', ttl={'rating': 0.2})
+        scraper = LocalScraper(server, throttle=False, cache=cache)
+        assert scraper.get_rating(ASIN) == corpus.expected_rating
+        time.sleep(0.25)
+        assert scraper.get_rating(ASIN) == corpus.expected_rating  # served from the cache after the 304
+        assert server.headers[-1]['If-None-Match'] == '"v1"'
+        assert server.headers[-1]['If-Modified-Since'] == modified
+        assert scraper.get_rating(ASIN) == corpus.expected_rating  # fresh again
+        assert len(server.requests) == 2
+
+    def test_lru(self, local_server):
+        corpus = Corpus('us')
+        server = local_server(lambda *request: (200, corpus.rating))
+        size = len(zlib.compress(corpus.rating.encode('utf-8'), 6))
+        cache = HTTPCache(':memory:', max_bytes=size * 2 + size // 2)
+        scraper = LocalScraper(server, throttle=False, cache=cache)
+        for asin in ('A1', 'A2', 'A1', 'A3'):  # A1 is used again, so A2 is the least recently used
+            scraper.get_rating(asin)
+        assert cache.size <= cache.max_bytes
+        scraper.get_rating('A1')
+        scraper.get_rating('A2')
+        assert [query['asin'] for _, _, query, _ in server.requests] == ['A1', 'A2', 'A3', 'A2']
+
+
+class TestResultCache:
+    def test_eviction_and_stats(self):
+        cache = ResultCache(max_entries=2)
+        for asin in ('A', 'B', 'C'):
+            cache.set('get_rating', ('get_rating', asin), asin)
+        assert cache.get('get_rating', ('get_rating', 'A')) == (False, None)
+        assert cache.get('get_rating', ('get_rating', 'C')) == (True, 'C')
+        assert cache.stats() == {'get_rating': {'hits': 1, 'misses': 1, 'evictions': 1}}
+
+
+class TestModels:
+    def test_immutable(self, corpus):
+        review_list = parse_review_stream(corpus.reviews, ASIN, corpus.country)
+        with pytest.raises(AttributeError):
+            review_list.last_page = True
+        with pytest.raises(AttributeError):
+            review_list.reviews[0].rating = 1
+        assert not hasattr(review_list.reviews[0], '__dict__')
+        restored = pickle.loads(pickle.dumps(review_list))
+        assert restored.reviews == review_list.reviews and restored.page == review_list.page
+
+    def test_batch_round_trip(self, corpus):
+        review_list = parse_review_stream(corpus.reviews, ASIN, corpus.country)
+        offer_list = parse_offers(corpus.offers, 'www.amazon.{}'.format(corpus.country.value), Scraper._offer_settings())
+        reviews, offers = ReviewBatch([review_list]), OfferBatch([offer_list])
+        assert list(reviews) == list(review_list.reviews)
+        assert reviews.asin(0) == ASIN
+        assert [offer.to_dict() for offer in offers] == [{**offer.to_dict(), 'price': float(offer.price)}
+                                                         for offer in offer_list.offers]
+
+    def test_batch_zero_copy(self, corpus):
+        numpy = pytest.importorskip('numpy')
+        batch = ReviewBatch([parse_review_stream(corpus.reviews, ASIN, corpus.country)])
+        columns = batch.to_numpy()
+        assert columns['rating'].dtype == numpy.int8
+        assert numpy.shares_memory(columns['helpful'], numpy.asarray(memoryview(batch.column('helpful'))))
+        assert columns['rating'].tolist() == [review.rating for review in batch]
+
+        pyarrow = pytest.importorskip('pyarrow')
+        table = batch.to_arrow()
+        assert table.num_rows == len(batch)
+        assert table.column('helpful').to_pylist() == list(batch.column('helpful'))
+        assert isinstance(table.schema.field('body').type, type(pyarrow.string()))
+
+
+class TestExport:
+    @staticmethod
+    def reviews(corpus, count):
+        reviews = parse_review_stream(corpus.reviews, ASIN, corpus.country).reviews
+        return (reviews[i % len(reviews)] for i in range(count))
+
+    def test_jsonl(self, corpus, tmp_path):
+        path = str(tmp_path / 'reviews.jsonl.gz')
+        assert export_records(self.reviews(corpus, 50), path, asin=ASIN) == 50
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f]
+        expected = corpus.expected['reviews']['reviews']
+        assert rows[21] == {**expected[1], 'asin': ASIN}
+
+    def test_csv(self, corpus, tmp_path):
+        path = str(tmp_path / 'offers.csv')
+        with open_sink(path, batch_size=4) as sink:
+            assert isinstance(sink, CSVSink)
+            sink.write_many([parse_offers(corpus.offers, 'www.amazon.com', Scraper._offer_settings())])
+            with pytest.raises(TypeError):
+                sink.write(next(self.reviews(corpus, 1)))
+            with pytest.raises(ValueError):  # the first offers came without extra columns
+                sink.write(parse_offers(corpus.offers, 'www.amazon.com', Scraper._offer_settings()).offers[0],
+                           asin=ASIN)
+        with open(path, encoding='utf-8', newline='') as f:
+            rows = list(csv.DictReader(f))
+        expected = corpus.expected['offers']['offers']
+        assert len(rows) == len(expected)
+        assert rows[0]['condition'] == expected[0]['condition']
+        assert rows[0]['approx_review'] == ''
+
+    def test_parquet(self, corpus, tmp_path):
+        parquet = pytest.importorskip('pyarrow.parquet')
+        path = str(tmp_path / 'reviews.parquet')
+        with open_sink(path, batch_size=100) as sink:
+            sink.write_many(self.reviews(corpus, 250), asin=ASIN)
+        file = parquet.ParquetFile(path)
+        assert file.metadata.num_rows == 250 and file.num_row_groups == 3
+        assert str(file.schema_arrow.field('rating').type) == 'int8'
+
+        path = str(tmp_path / 'pages.parquet')
+        with ParquetSink(path, column_types={'asin': 'large_string'}) as sink:
+            for review in self.reviews(corpus, 3):
+                sink.write(review, page=1, asin=ASIN, seen=None)
+            sink.write(review, asin=ASIN, seen='today', page=2)  # any order of the same columns
+            with pytest.raises(ValueError):
+                sink.write(review, asin=ASIN)
+        table = parquet.read_table(path)
+        assert [str(field.type) for field in table.schema][-3:] == ['int64', 'large_string', 'string']
+        assert table.column('page').to_pylist() == [1, 1, 1, 2] and table.column('seen').to_pylist()[-1] == 'today'
+
+    def test_bounded_memory(self, corpus, tmp_path):
+        path = str(tmp_path / 'reviews.jsonl')
+        tracemalloc.start()
+        try:
+            export_records(self.reviews(corpus, 20000), path)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        assert peak < os.path.getsize(path) / 4
+
+
+class TestThrottle:
+    def test_token_bucket(self):
+        throttle = Throttle(rate=50, burst=2)
+        delays = [throttle.reserve() for _ in range(4)]
+        assert delays[:2] == [0, 0]
+        assert 0.015 < delays[2] < 0.025 and 0.035 < delays[3] < 0.045
+
+    def test_adaptive_rate_and_circuit(self):
+        throttle = Throttle(rate=10, increase=1, failure_threshold=3, recovery_time=0.05)
+        for _ in range(3):
+            throttle.blocked()
+        assert throttle.rate == 1.25 and throttle.state == 'open'
+        with pytest.raises(CircuitOpenException):
+            throttle.reserve()
+        time.sleep(0.06)
+        assert throttle.state == 'half-open'
+        throttle.reserve()  # the probe
+        with pytest.raises(CircuitOpenException):
+            throttle.reserve()
+        throttle.success()
+        assert throttle.state == 'closed' and throttle.rate == 2.25
+
+    def test_retry_with_backoff(self, corpus, local_server):
+        answers = iter([503, 200, 503, 200])  # rating, setup, rating, setup, then 200 for good
+
+        def respond(method, path, query, form):
+            status = next(answers, 200)
+            return status, corpus.rating if status == 200 and path == '/rating' else ''
+
+        server = local_server(respond)
+        scraper = LocalScraper(server, corpus.country, throttle=Throttle(rate=1000, backoff_base=0.001))
+        assert scraper.get_rating(ASIN) == corpus.expected_rating
+        assert [path for _, path, _, _ in server.requests] == ['/rating', '/', '/rating', '/', '/rating']
+
+    def test_circuit_stops_requests(self, local_server):
+        server = local_server(lambda *request: (503, ''))
+        throttle = Throttle(rate=1000, failure_threshold=2, backoff_base=0.001)
+        scraper = LocalScraper(server, throttle=throttle, max_retries=10)
+        with pytest.raises(CircuitOpenException):
+            scraper.get_rating(ASIN)
+        assert len(server.requests) == 2
+        with pytest.raises(DetectedAsBotException):
+            LocalScraper(server, throttle=False, max_retries=0).get_rating(ASIN)
+
+
+class TestSessionPool:
+    def test_warm_and_reuse(self, local_server, tmp_path):
+        server = local_server(lambda *request: (200, '', {'Set-Cookie': 'session-id=123-456; Path=/'}))
+
+        def bootstrap(country):
+            scraper = LocalScraper(server, country, throttle=False)
+            scraper.init()
+            return scraper
+
+        path = str(tmp_path / 'sessions.json')
+        assert SessionPool(path, size=2).warm(Country.Japan, factory=bootstrap) == 2
+        assert len(server.requests) == 2
+
+        pool = SessionPool(path)
+        assert pool.warm(Country.Japan, count=2, factory=bootstrap) == 0
+        scraper = LocalScraper(server, Country.Japan, throttle=False, session_pool=pool, run_init=True)
+        assert len(server.requests) == 2
+        assert scraper.cookie['session-id'] == '123-456'
+        assert scraper.cookie['i18n-prefs'] == 'JPY'
+        assert scraper.headers['User-Agent'] == scraper.identity.user_agent
+        assert {pool.acquire(Country.Japan).identity_id for _ in range(2)} == \
+               {identity.identity_id for identity in pool.identities(Country.Japan)}
+
+        scraper.init()  # a new setup replaces the identity in use
+        assert len(SessionPool(path).identities(Country.Japan)) == 2
+        assert SessionPool(path).acquire(Country.UnitedStates) is None
+
+        expiring = SessionPool(str(tmp_path / 'expiring.json'), ttl=0)
+        expiring.store(scraper)
+        assert expiring.acquire(Country.Japan) is None
+
+    def test_instances_merge(self, local_server, tmp_path):
+        server = local_server(lambda *request: (200, '', {'Set-Cookie': 'session-id=123-456; Path=/'}))
+        scraper = LocalScraper(server, Country.Japan, throttle=False)
+        path = str(tmp_path / 'sessions.json')
+        first, second = SessionPool(path), SessionPool(path)  # as two processes would
+
+        kept = first.store(scraper)
+        dropped = second.store(scraper)
+        assert {identity.identity_id for identity in SessionPool(path).identities(Country.Japan)} == \
+               {kept.identity_id, dropped.identity_id}
+
+        first.discard(dropped)  # never seen by first, removed from the file all the same
+        added = second.store(scraper)  # second must not write dropped back
+        assert {identity.identity_id for identity in SessionPool(path).identities(Country.Japan)} == \
+               {kept.identity_id, added.identity_id}
+        assert os.path.exists(path + '.lock')
+
+
+class TestMetrics:
+    def test_request_metrics(self, corpus, local_server):
+        answers = iter([503, 200])  # rating, setup, then 200 for good
+
+        def respond(method, path, query, form):
+            status = next(answers, 200)
+            return status, corpus.rating if status == 200 and path == '/rating' else ''
+
+        server = local_server(respond)
+        metrics = Metrics()
+        events = []
+        metrics.subscribe(lambda event, fields: events.append(event))
+        scraper = LocalScraper(server, corpus.country, throttle=Throttle(rate=1000, backoff_base=0.001),
+                               metrics=metrics)
+        assert scraper.get_rating(ASIN) == corpus.expected_rating
+        assert events == ['response', 'bot_detected', 'retry', 'response', 'response', 'parse']
+
+        market = corpus.country.name
+        assert metrics.requests.value(endpoint='rating', marketplace=market, status='503') == 1
+        assert metrics.requests.value(endpoint='rating', marketplace=market, status='200') == 1
+        assert metrics.requests.value(endpoint='top', marketplace=market, status='200') == 1
+        assert metrics.response_bytes.value(endpoint='rating', marketplace=market) == \
+               len(corpus.rating.encode('utf-8'))
+        assert metrics.latency.count(endpoint='rating', marketplace=market, phase='total') == 2
+        assert metrics.retries.value(endpoint='rating', marketplace=market) == 1
+        assert metrics.bot_detections.value(marketplace=market) == 1
+        assert metrics.parse_time.count(endpoint='rating', marketplace=market, backend=scraper.parser.name) == 1
+
+        text = metrics.to_prometheus()
+        assert '# TYPE terraplen_request_seconds histogram' in text
+        assert 'terraplen_retries_total{{endpoint="rating",marketplace="{}"}} 1'.format(market) in text
+        assert 'terraplen_request_seconds_bucket{{endpoint="rating",marketplace="{}",phase="total",le="+Inf"}} 2' \
+            .format(market) in text
+
+    def test_histogram(self):
+        metrics = Metrics(buckets=(0.1, 1))
+        for value in (0.05, 0.5, 5):
+            metrics.record('parse', endpoint='reviews', marketplace='Japan', backend='lxml', seconds=value, items=10)
+        samples = {(name, labels.get('le')): value for name, labels, value in metrics.parse_time.samples()}
+        assert samples[('terraplen_parse_seconds_bucket', '0.1')] == 1
+        assert samples[('terraplen_parse_seconds_bucket', '1')] == 2
+        assert samples[('terraplen_parse_seconds_bucket', '+Inf')] == 3
+        assert samples[('terraplen_parse_seconds_sum', None)] == 5.55
+        assert metrics.items.value(endpoint='reviews', marketplace='Japan') == 30
+
+
+class TestSyncReviews:
+    def test_delta(self, corpus, local_server):
+        server = local_server(lambda *request: (200, corpus.reviews))
+        scraper = LocalScraper(server, corpus.country, throttle=False)
+        store = CheckpointStore(':memory:')
+        reviews = parse_review_stream(corpus.reviews, ASIN, corpus.country).reviews
+        ids = [review_id(review.review_url) for review in reviews]
+        assert all(ids)
+
+        assert list(scraper.sync_reviews(ASIN, store, max_pages=1)) == list(reviews)
+        assert [form['sortBy'] for _, _, _, form in server.requests] == ['recent']
+        assert store.get(ASIN, corpus.country).review_ids == ids
+
+        assert list(scraper.sync_reviews(ASIN, store)) == []  # nothing new: stops at the first review
+        assert len(server.requests) == 2
+
+        store.delete(ASIN, corpus.country)
+        store.update(ASIN, corpus.country, ids[3:])  # as if the three newest reviews were posted since
+        assert list(scraper.sync_reviews(ASIN, store)) == list(reviews[:3])
+        assert len(server.requests) == 3
+        checkpoint = store.get(ASIN, corpus.country)
+        assert checkpoint.review_ids == ids and checkpoint.synced == 20
+
+    def test_caches_bypassed(self, corpus, local_server):
+        reviews = parse_review_stream(corpus.reviews, ASIN, corpus.country).reviews
+        fragments = corpus.reviews.split('&&&')
+        pages = [corpus.reviews]
+
+        server = local_server(lambda *request: (200, pages[-1]))
+        scraper = LocalScraper(server, corpus.country, throttle=False, result_cache=ResultCache(),
+                               cache=HTTPCache(':memory:'))
+        store = CheckpointStore(':memory:')
+        settings = ReviewSettings()
+        settings.sort_by = ReviewParameter.SortBy.Recent
+        assert scraper.get_review(ASIN, 1, settings).reviews == reviews  # now in both caches
+        assert len(list(scraper.sync_reviews(ASIN, store, max_pages=1))) == len(reviews)
+
+        newest = next(i for i, fragment in enumerate(fragments) if review_id(fragment))
+        posted = fragments[newest].replace(review_id(fragments[newest]), 'RNEWREVIEW0001')
+        pages.append('&&&'.join(fragments[:newest] + [posted] + fragments[newest:]))  # a review was posted since
+        assert scraper.get_review(ASIN, 1, settings).reviews == reviews  # stale
+        synced = list(scraper.sync_reviews(ASIN, store, max_pages=1))
+        assert [review_id(review.review_url) for review in synced] == ['RNEWREVIEW0001']
+        assert len(server.requests) == 3
+
+    def test_interrupted(self, corpus, local_server):
+        server = local_server(lambda *request: (200, corpus.reviews))
+        scraper = LocalScraper(server, corpus.country, throttle=False)
+        store = CheckpointStore(':memory:', keep=5)
+        reviews = scraper.sync_reviews(ASIN, store, max_pages=1)
+        next(reviews)
+        reviews.close()
+        assert store.get(ASIN, corpus.country) is None
+        assert len(list(scraper.sync_reviews(ASIN, store, max_pages=1))) == 20
+        assert len(store.get(ASIN, corpus.country).review_ids) == 5
+
+
+class TestMultiMarket:
+    def test_fan_out(self, local_server):
+        corpora = {country: Corpus(market) for market, country in MARKETS.items()}
+        server = local_server(lambda *request: (time.sleep(0.2) or 200, corpora[Country.Japan].offers))
+        created = []
+
+        def factory(country, **kwargs):
+            if country == Country.France:
+                raise ValueError('unreachable')
+            created.append(country)
+            return LocalScraper(server, country, throttle=False, **kwargs)
+
+        with MultiMarketScraper(list(corpora) + [Country.France], factory=factory) as scraper:
+            start = time.perf_counter()
+            results = scraper.get_offers(ASIN)
+            assert time.perf_counter() - start < 0.5  # as long as one marketplace, not three
+            assert list(results) == [Country.UnitedStates, Country.Japan, Country.UnitedKingdom, Country.France]
+            assert [result.currency for result in results.values()] == \
+                   [country.lang_and_currency()[1] for country in results]
+            assert results[Country.Japan].result.offers == \
+                   parse_offers(corpora[Country.Japan].offers, 'www.amazon.co.jp', {'page': 1}).offers
+            assert isinstance(results[Country.France].error, ValueError) and results[Country.France].result is None
+
+            lowest = MultiMarketScraper.lowest_prices(results)
+            assert list(lowest) == [Country.UnitedStates, Country.Japan, Country.UnitedKingdom]
+            assert lowest[Country.Japan].result == min(offer.price for offer in results[Country.Japan].result.offers)
+
+            scraper.get_offers(ASIN, [Country.Japan])
+            assert sorted(created, key=str) == sorted(corpora, key=str)  # one Scraper per marketplace, reused
+
+    def test_currency(self, local_server):
+        server = local_server(lambda *request: (200, ''))
+        scraper = MultiMarketScraper([Country.Japan, 'de'], currency='USD',
+                                     factory=lambda country, **kwargs: LocalScraper(server, country, **kwargs))
+        assert scraper.warm() == {Country.Japan: None, Country.Germany: None}
+        assert scraper.scraper(Country.Germany).currency == Currency.USDollar
+        assert scraper.scraper(Country.Germany).cookie['i18n-prefs'] == 'USD'
+        scraper.close()
+
+        corpus = Corpus('jp')
+        server = local_server(lambda *request: (200, corpus.rating, {'Set-Cookie': 'i18n-prefs=JPY; Path=/'}))
+        with MultiMarketScraper([Country.Japan], currency='USD', factory=lambda country, **kwargs: LocalScraper(
+                server, country, throttle=False, **kwargs)) as scraper:
+            with pytest.warns(UserWarning):
+                results = scraper.get_rating(ASIN)
+            assert results[Country.Japan].currency == Currency.JapaneseYen
+            assert results[Country.Japan].result == corpus.expected_rating
+
+
+class TestSingleFlight:
+    def test_concurrent_calls(self, corpus, local_server):
+        def respond(method, path, query, form):
+            time.sleep(0.2)
+            return (200, corpus.rating) if query['asin'] == ASIN else (500, '')
+
+        server = local_server(respond)
+        metrics = Metrics()
+        scraper = LocalScraper(server, corpus.country, throttle=False, metrics=metrics)
+        barrier = threading.Barrier(8)
+
+        def call(asin):
+            barrier.wait()
+            try:
+                return scraper.get_rating(asin)
+            except ValueError as e:
+                return e
+
+        results = list(map_threads(call, [ASIN] * 8))
+        assert len(server.requests) == 1
+        assert all(result is results[0] for result in results)
+        assert results[0] == corpus.expected_rating
+        assert metrics.coalesced.value(endpoint='rating', marketplace=corpus.country.name) == 7
+        assert isinstance(scraper.single_flight, SingleFlight) and scraper.single_flight.in_flight == 0
+
+        barrier.reset()
+        errors = list(map_threads(call, ['missing'] * 8))
+        assert len(server.requests) == 2
+        assert all(isinstance(error, ValueError) for error in errors)
+
+        scraper.get_rating(ASIN)  # nothing is kept once the call returns
+        assert len(server.requests) == 3
+
+    def test_async(self):
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return object()
+
+        async def main():
+            first = asyncio.ensure_future(flight.do('key', fetch))
+            await asyncio.sleep(0)
+            first.cancel()  # the call goes on for the others
+            results = await asyncio.gather(*(flight.do('key', fetch) for _ in range(4)))
+            other = await flight.do('other', fetch)
+            return results, other
+
+        results, other = asyncio.run(main())
+        assert len(calls) == 2 and flight.coalesced == 4
+        assert all(result is results[0][0] and shared for result, shared in results)
+        assert other[0] is not results[0][0] and not other[1]
+
+
+def map_threads(func, items):
+    results = [None] * len(items)
+
+    def run(i, item):
+        results[i] = func(item)
+
+    threads = [threading.Thread(target=run, args=(i, item)) for i, item in enumerate(items)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class TestProxyPool:
+    def test_healthiest_proxy(self, corpus, local_server, local_proxy):
+        server = local_server(lambda *request: (200, corpus.rating))
+        fast, slow, blocking, dropping = local_proxy(), local_proxy(delay=0.05), local_proxy('block'), \
+            local_proxy('drop')
+        pool = ProxyPool([fast.url, slow.url, blocking.url, dropping.url])
+        scraper = LocalScraper(server, corpus.country, throttle=Throttle(rate=1000, backoff_base=0.001),
+                               proxy_pool=pool)
+        for _ in range(20):
+            assert scraper.get_rating(ASIN) == corpus.expected_rating
+
+        assert (slow.requests, blocking.requests, dropping.requests) == (1, 1, 1)  # tried once each
+        assert fast.requests + slow.requests == len(server.requests) == 21  # and the bot detection cost one setup
+        stats = {proxy['url']: proxy for proxy in pool.stats()}
+        assert stats[fast.url]['latency'] < stats[slow.url]['latency']
+        assert stats[blocking.url]['detections'] == 1 and stats[blocking.url]['detection_rate'] > 0
+        assert stats[dropping.url]['failures'] == 1 and stats[dropping.url]['success_rate'] < 1
+        assert all(proxy['in_flight'] == 0 and proxy['state'] == 'healthy' for proxy in stats.values())
+
+    def test_quarantine_and_probe(self, corpus, local_server, local_proxy):
+        server = local_server(lambda *request: (200, corpus.rating))
+        flaky, good = local_proxy('drop'), local_proxy(delay=0.01)
+        pool = ProxyPool([flaky.url, good.url], failure_threshold=1, quarantine_time=0.2)
+        scraper = LocalScraper(server, corpus.country, throttle=False, proxy_pool=pool)
+        assert scraper.get_rating(ASIN) == corpus.expected_rating  # sent again through `good`
+        assert pool.proxies[0].state == 'quarantined' and (flaky.requests, good.requests) == (1, 1)
+
+        time.sleep(0.25)
+        scraper.get_rating(ASIN)  # the probe fails and the quarantine doubles
+        assert flaky.requests == 2 and pool.proxies[0].quarantines == 2
+        time.sleep(0.25)
+        scraper.get_rating(ASIN)
+        assert flaky.requests == 2
+
+        flaky.behavior = 'forward'
+        time.sleep(0.2)
+        scraper.get_rating(ASIN)  # the probe succeeds
+        assert flaky.requests == 3 and pool.proxies[0].state == 'healthy'
+        assert pool.proxies[0].quarantines == 0 and good.requests == 3
+
+        with pytest.raises(NoProxyAvailableException):
+            LocalScraper(server, corpus.country, throttle=False, max_retries=5,
+                         proxy_pool=ProxyPool([local_proxy('drop').url], failure_threshold=1)).get_rating(ASIN)
+
+
+def crawl_kwargs(directory):
+    """
+    Scraper arguments a `Crawler` worker builds for itself. At module level, so spawned workers can unpickle it.
+    """
+    return {'session_pool': SessionPool(os.path.join(directory, 'sessions.json')),
+            'cache': HTTPCache(os.path.join(directory, 'cache.db'))}
+
+
+class TestCrawl:
+    def test_queue(self, tmp_path):
+        corpus = Corpus('us')
+        queue = JobQueue(str(tmp_path / 'crawl.db'), lease_time=0.1, max_attempts=2, backoff_base=0)
+        assert queue.put(ASIN, corpus.country, 'reviews')
+        assert not queue.put(ASIN, corpus.country.value, 'reviews')  # deduplicated
+        assert queue.put_many([('A1', corpus.country, 'rating', 3), ('A1', corpus.country, 'rating', 1)], 5) == 1
+        with pytest.raises(ValueError):
+            queue.put(ASIN, corpus.country, 'questions')
+
+        job = queue.lease('a')
+        assert (job.asin, job.kind, job.page, job.attempts) == ('A1', 'rating', 1, 1)  # higher priority first
+        review_list = parse_review_stream(corpus.reviews, ASIN, corpus.country)
+        reviews = queue.lease('a')
+        assert queue.complete(reviews, review_list, follow_ups(reviews, review_list))
+        assert not queue.put(ASIN, corpus.country, 'reviews')  # done jobs are not queued again
+
+        time.sleep(0.1)
+        taken = queue.lease('b')  # the lease of `job` expired
+        assert (taken.id, taken.attempts) == (job.id, 2)
+        assert not queue.complete(job, {})  # and `a` lost it
+        assert queue.fail(taken, ValueError('broken'))
+        assert queue.get(job.id).status == 'failed' and queue.get(job.id).error == 'ValueError: broken'
+
+        second = queue.lease('a')
+        assert (second.kind, second.page) == ('reviews', 2)
+        assert queue.fail(second, 'timeout') and queue.get(second.id).status == 'pending'
+        assert queue.lease('a').id == second.id
+        time.sleep(0.1)
+        assert queue.lease('a') is None  # expired at its last attempt
+        assert queue.counts() == {'pending': 0, 'leased': 0, 'done': 1, 'failed': 2}
+
+        assert queue.retry_failed('rating') == 1 and queue.unfinished() == 1
+        assert [(job.page, result.reviews) for job, result in queue.results()] == [(1, review_list.reviews)]
+        queue.close()
+
+    def test_follow_ups(self, corpus):
+        offer_list = parse_offers(corpus.offers, 'www.amazon.com', {'page': 1})
+        first = Job(1, ASIN, corpus.country, 'offers', 1, 0, 'leased', 1, None)
+        assert follow_ups(first, offer_list) == []  # every offer fits on the first page
+        many = type(offer_list)('product', 35, offer_list.offers, {'page': 1})
+        assert follow_ups(first, many) == [('offers', 2)]
+        assert follow_ups(first._replace(page=2), many) == [('offers', 3)]  # on until a page adds nothing
+        assert follow_ups(first._replace(page=3), type(offer_list)(None, None, [], {'page': 3})) == []
+        assert follow_ups(first._replace(kind='rating'), corpus.expected_rating) == []
+
+    def test_crawl(self, tmp_path, local_server):
+        corpus = Corpus('jp')
+
+        def respond(method, path, query, form):
+            time.sleep(0.05)
+            if query.get('asin') == 'missing' or form.get('asin') == 'missing':
+                return 404, ''
+            if path == '/rating':
+                return 200, corpus.rating
+            if path == '/offers':
+                return 200, corpus.offers
+            return 200, corpus.reviews if int(query['page']) < 3 else ''
+
+        server = local_server(respond)
+        crawler = Crawler(str(tmp_path / 'crawl.db'), workers=4, factory=functools.partial(LocalScraper, server),
+                          backoff_base=0, poll_interval=0.01, throttle=False)
+        asins = ['A{}'.format(i) for i in range(6)] + ['missing']
+        assert crawler.put(asins, [corpus.country]) == 21
+        start = time.perf_counter()
+        counts = crawler.run()
+        elapsed = time.perf_counter() - start
+        assert counts == {'pending': 0, 'leased': 0, 'done': 30, 'failed': 3}  # and 2 more pages of reviews per ASIN
+        assert len(server.requests) == 33  # not found is not retried
+        assert elapsed < 33 * 0.05 / 2  # the workers ran in parallel
+
+        with crawler.queue() as queue:
+            workers = {row[0] for row in queue._connection.execute('SELECT worker FROM jobs')}
+            assert len(workers) > 1
+            results = list(queue.results())
+            failed = queue.jobs('failed')
+        assert {job.asin for job in failed} == {'missing'} and 'ProductNotFoundException' in failed[0].error
+        assert all(result == corpus.expected_rating for job, result in results if job.kind == 'rating')
+        assert sorted((job.asin, job.page, len(result.reviews)) for job, result in results
+                      if job.kind == 'reviews')[:3] == [('A0', 1, 20), ('A0', 2, 20), ('A0', 3, 0)]
+
+        crawler.put(asins, [corpus.country])
+        assert crawler.run() == counts  # finished work is not done again
+        assert len(server.requests) == 33
+
+    def test_resume(self, tmp_path, local_server):
+        corpus = Corpus('us')
+        server = local_server(lambda *request: (200, corpus.rating))
+        crawler = Crawler(str(tmp_path / 'crawl.db'), workers=2, lease_time=0.2, poll_interval=0.01,
+                          factory=functools.partial(LocalScraper, server), throttle=False)
+        crawler.put(['A1', 'A2'], [corpus.country], ['rating'])
+        with crawler.queue() as queue:
+            crashed = queue.lease('crashed')  # never completed, as if its worker died
+        assert crawler.run()['done'] == 2
+        with crawler.queue() as queue:
+            assert queue.get(crashed.id).attempts == 2
+        assert len(server.requests) == 2
+
+    def test_spawn(self, tmp_path, local_server):
+        corpus = Corpus('us')
+        server = local_server(lambda *request: (200, corpus.rating))
+        with pytest.raises(ValueError):  # holds a lock, so it would never reach a spawned worker
+            Crawler(str(tmp_path / 'crawl.db'), session_pool=SessionPool(str(tmp_path / 'sessions.json')))
+
+        crawler = Crawler(str(tmp_path / 'crawl.db'), workers=2, poll_interval=0.01,
+                          factory=functools.partial(LocalScraper, types.SimpleNamespace(url=server.url)),
+                          kwargs_factory=functools.partial(crawl_kwargs, str(tmp_path)), throttle=False)
+        crawler.put(['A1', 'A2', 'A3'], [corpus.country], ['rating'])
+        assert crawler.run(multiprocessing.get_context('spawn'))['done'] == 3
+        assert len(server.requests) == 3
+        with crawler.queue() as queue:
+            assert all(result == corpus.expected_rating for job, result in queue.results())
+        assert os.path.exists(str(tmp_path / 'cache.db'))
+
+
+class TestImport:
+    ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    BUDGET = 50000  # microseconds of `import terraplen`, cumulative as reported by `-X importtime`
+    HEAVY = ('requests', 'bs4', 'lxml', 'cssselect', 'aiohttp', 'numpy', 'pandas', 'pyarrow')
+
+    def run(self, code, *options):
+        env = {**os.environ, 'PYTHONPATH': self.ROOT, 'LC_ALL': '', 'LANG': 'C.UTF-8'}
+        return subprocess.run([sys.executable, *options, '-c', code], capture_output=True, text=True, check=True,
+                              env=env, cwd=self.ROOT)
+
+    def test_import_time(self):
+        # best of three, so a busy machine does not fail it
+        times = []
+        for _ in range(3):
+            stderr = self.run('import terraplen', '-X', 'importtime').stderr
+            line = [line for line in stderr.splitlines() if line.endswith('| terraplen')][-1]
+            times.append(int(line.split('|')[1]))
+        assert min(times) < self.BUDGET
+
+    def test_no_heavy_import(self):
+        code = ('import locale, sys\n'
+                'before = locale.setlocale(locale.LC_ALL)\n'
+                'import terraplen\n'
+                'from terraplen import Scraper, AsyncScraper, ReviewBatch, ParquetSink, parse_rating\n'
+                'print(locale.setlocale(locale.LC_ALL) == before)\n'
+                'print(" ".join(name for name in {} if name in sys.modules))'.format(self.HEAVY))
+        assert self.run(code).stdout.split('\n')[:2] == ['True', '']
+
+
 if __name__ == '__main__':
     pytest.main()
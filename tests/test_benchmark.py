@@ -0,0 +1,88 @@
+"""
+Offline benchmarks of every parse path, on the corpus in `tests/fixtures`.
+
+    pytest tests/test_benchmark.py                         # throughput and per-document latency
+    pytest tests/test_benchmark.py --benchmark-autosave    # store a timing baseline in .benchmarks/
+    pytest tests/test_benchmark.py --benchmark-compare --benchmark-compare-fail=median:25%
+
+Peak memory is compared against `tests/fixtures/baseline.json`. Run with `TERRAPLEN_UPDATE_BASELINE=1` to rewrite it.
+"""
+
+import json
+import os
+import tracemalloc
+
+import pytest
+
+from terraplen import Scraper
+from terraplen.parser import parse_rating, scan_rating
+
+from conftest import ASIN, FIXTURES
+
+pytest.importorskip('pytest_benchmark')
+
+BASELINE = os.path.join(FIXTURES, 'baseline.json')
+MEMORY_TOLERANCE = 1.5
+MEMORY_SLACK = 64 * 1024  # bytes. keeps tiny baselines from failing on allocator noise
+ENDPOINTS = ('rating', 'offers', 'reviews')
+
+
+def parse_function(scraper: Scraper, endpoint: str):
+    if endpoint == 'rating':  # the DOM parse of the backend. `test_rating_scan_speed` times the fast path
+        return lambda text: parse_rating(text, scraper.parser, fast=False)
+    if endpoint == 'offers':
+        settings = scraper._offer_settings()
+        return lambda text: scraper._parse_offers(text, settings)
+    settings = scraper._review_settings(ASIN)
+    return lambda text: scraper._parse_reviews(text, ASIN, settings)
+
+
+def peak_memory(func, *args) -> int:
+    # Python heap only. libxml2 allocates with plain malloc, which tracemalloc does not see.
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.parametrize('endpoint', ENDPOINTS)
+def test_parse_speed(benchmark, corpus, backend, endpoint):
+    scraper = Scraper(corpus.country, run_init=False, parser=backend)
+    text = getattr(corpus, endpoint)
+    benchmark.group = endpoint
+    benchmark.extra_info['bytes'] = len(text.encode('utf-8'))
+    result = benchmark(parse_function(scraper, endpoint), text)
+
+    if endpoint == 'rating':
+        assert result == corpus.expected_rating
+    elif endpoint == 'offers':
+        assert len(result.offers) == len(corpus.expected['offers']['offers'])
+    else:
+        assert len(result.reviews) == len(corpus.expected['reviews']['reviews'])
+
+
+def test_rating_scan_speed(benchmark, corpus):
+    html = corpus.rating.encode('utf-8')
+    benchmark.group = 'rating-scan'
+    benchmark.extra_info['bytes'] = len(html)
+    assert benchmark(scan_rating, html) == corpus.expected_rating
+
+
+@pytest.mark.parametrize('endpoint', ENDPOINTS)
+def test_parse_peak_memory(corpus, backend, endpoint):
+    scraper = Scraper(corpus.country, run_init=False, parser=backend)
+    func = parse_function(scraper, endpoint)
+    text = getattr(corpus, endpoint)
+    func(text)  # warm up lazy imports and caches
+    peak = peak_memory(func, text)
+
+    name = '{}-{}-{}'.format(corpus.market, endpoint, backend)
+    with open(BASELINE) as f:
+        baseline = json.load(f)
+    if os.environ.get('TERRAPLEN_UPDATE_BASELINE'):
+        baseline['memory'][name] = peak
+        with open(BASELINE, 'w') as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+    assert peak <= baseline['memory'][name] * MEMORY_TOLERANCE + MEMORY_SLACK